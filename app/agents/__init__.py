@@ -5,5 +5,6 @@ from .base import BaseAgent
 from .chat_agent import ChatAgent
 from .code_agent import CodeAgent
 from .search_agent import SearchAgent
+from .document_agent import DocumentAgent
 
-__all__ = ["BaseAgent", "ChatAgent", "CodeAgent", "SearchAgent"] 
\ No newline at end of file
+__all__ = ["BaseAgent", "ChatAgent", "CodeAgent", "SearchAgent", "DocumentAgent"] 
\ No newline at end of file
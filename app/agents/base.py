@@ -1,10 +1,20 @@
 """
 基础Agent类
 """
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple, AsyncIterator
 from loguru import logger
-from app.services.ai_service import AIServiceFactory
+from app.services.ai_service import AIServiceFactory, ConversationExpiredError
+from app.services.interaction_recorder import interaction_recorder
+from app.utils.request_context import get_request_id
+from app.utils.timing import span
+from app.utils.cancellation import aclosing
+from app.utils.serialization import dumps
+from app.utils.deadline import DeadlineExceeded, expired
+from app.utils.metrics import CASCADE_RESPONSES, CASCADE_SECONDS
+from app.prompts import prompt_registry
+from .cascade import CascadePolicy
 
 
 class BaseAgent(ABC):
@@ -17,6 +27,12 @@ class BaseAgent(ABC):
         self.ai_service = AIServiceFactory.get_service(provider)
         self.config = kwargs.get("config", {})
         self.model_name = kwargs.get("model_name")
+        # 注册表分配的ID（注册前为None），用作节点亲和键，name 只是可重复的显示名称
+        self.agent_id: Optional[str] = kwargs.get("agent_id")
+        self.cascade = CascadePolicy.from_config(self.config)
+        self.prompt_template = prompt_registry.get(self.config.get("prompt_template") or f"{agent_type}/default")
+        # 运行时状态每次变化时递增，注册表据此判断是否需要重新测量大小
+        self.state_version = 0
         
         logger.info(f"初始化Agent: {name} (类型: {agent_type}, 提供商: {provider})")
     
@@ -26,14 +42,205 @@ class BaseAgent(ABC):
         pass
     
     async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """生成AI响应"""
+        """生成AI响应（配置了级联策略时先由小模型回答）"""
+        if self.cascade is None:
+            return await self._generate(prompt, **kwargs)
+        
+        small, reason = await self._try_small_model(prompt, kwargs)
+        if reason is None:
+            return self._mark_tier(small, "small")
+        
+        large = await self._generate(prompt, **self._large_model_kwargs(kwargs))
+        return self._mark_tier(large, "large", reason, small)
+    
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成AI响应
+        
+        配置了级联策略时，小模型的回答先完整生成并检查，通过后一次性输出；
+        未通过时流式输出大模型的回答。
+        """
+        if self.cascade is None:
+            async with aclosing(self._stream(prompt, **kwargs)) as events:
+                async for event in events:
+                    yield event
+            return
+        
+        small, reason = await self._try_small_model(prompt, kwargs)
+        if reason is None:
+            result = self._mark_tier(small, "small")
+            if result.get("response"):
+                yield {"type": "delta", "content": result["response"]}
+            yield {"type": "done", "result": result}
+            return
+        
+        async with aclosing(self._stream(prompt, **self._large_model_kwargs(kwargs))) as events:
+            async for event in events:
+                if event["type"] == "done":
+                    event = {"type": "done", "result": self._mark_tier(event["result"], "large", reason, small)}
+                yield event
+    
+    @property
+    def affinity_id(self) -> str:
+        """节点亲和键使用的Agent标识（未注册的Agent按对象区分）"""
+        return self.agent_id or f"{self.agent_type}@{id(self):x}"
+    
+    async def _generate(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """调用AI服务生成一次响应"""
+        kwargs.setdefault("affinity_key", self.affinity_id)
         try:
-            result = await self.ai_service.generate_response(prompt, **kwargs)
-            logger.info(f"Agent {self.name} 生成响应成功，耗时: {result.get('processing_time', 0):.2f}秒")
+            with span("llm"):
+                result = await self.ai_service.generate_response(prompt, **kwargs)
+            logger.info("Agent {} 生成响应成功，耗时: {:.2f}秒", self.name, result.get("processing_time", 0))
+            self._record_interaction(prompt, result)
             return result
+        except ConversationExpiredError:
+            # 由调用方重建会话后重试
+            raise
+        except asyncio.CancelledError:
+            logger.info("Agent {} 生成已取消", self.name)
+            raise
         except Exception as e:
-            logger.error(f"Agent {self.name} 生成响应失败: {e}")
+            logger.error("Agent {} 生成响应失败: {}", self.name, e)
+            raise
+    
+    async def _stream(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """调用AI服务流式生成一次响应"""
+        kwargs.setdefault("affinity_key", self.affinity_id)
+        try:
+            async with aclosing(self.ai_service.stream_response(prompt, **kwargs)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        result = event["result"]
+                        logger.info("Agent {} 流式生成响应成功，耗时: {:.2f}秒", self.name, result.get("processing_time", 0))
+                        self._record_interaction(prompt, result)
+                    yield event
+        except ConversationExpiredError:
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：上游流已随 aclosing 关闭
+            logger.info("Agent {} 流式生成已取消", self.name)
             raise
+        except Exception as e:
+            logger.error("Agent {} 流式生成响应失败: {}", self.name, e)
+            raise
+    
+    async def _try_small_model(self, prompt: str, kwargs: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """由小模型回答并检查，返回 (结果, 升级原因)，通过检查时升级原因为None
+        
+        超过请求截止时间时抛出 DeadlineExceeded，不再升级到大模型。
+        """
+        with span("cascade_small"):
+            try:
+                small = await self._generate(prompt, **{**kwargs, "model": self.cascade.small_model})
+            except (ConversationExpiredError, DeadlineExceeded):
+                raise
+            except Exception as e:
+                if expired():
+                    raise DeadlineExceeded() from e
+                return None, "error"
+        reason = self._cascade_check(small)
+        if reason is not None:
+            if expired():
+                # 预算已用完，不再升级到大模型
+                raise DeadlineExceeded()
+            logger.info("Agent {} 小模型回答未通过检查（{}），升级到大模型", self.name, reason)
+        return small, reason
+    
+    def _large_model_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if self.cascade.large_model:
+            return {**kwargs, "model": self.cascade.large_model}
+        return kwargs
+    
+    def _cascade_check(self, result: Dict[str, Any]) -> Optional[str]:
+        """检查小模型的回答，子类可增加领域相关的检查"""
+        return self.cascade.check(result)
+    
+    def _mark_tier(self, result: Dict[str, Any], tier: str, reason: Optional[str] = None,
+                   small: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """记录回答来自哪一级模型；升级时处理耗时包含小模型的耗时"""
+        small_time = (small or {}).get("processing_time") or 0.0
+        cascade = {"tier": tier, "model": result.get("model_used")}
+        if tier == "large":
+            cascade.update({
+                "escalation_reason": reason,
+                "small_model": self.cascade.small_model,
+                "small_processing_time": small_time
+            })
+        result = {**result, "processing_time": (result.get("processing_time") or 0.0) + small_time, "cascade": cascade}
+        CASCADE_RESPONSES.labels(self.agent_type, tier, reason or "accepted").inc()
+        CASCADE_SECONDS.labels(self.agent_type, tier).observe(result["processing_time"])
+        return result
+    
+    @staticmethod
+    def _llm_metadata(result: Dict[str, Any]) -> Dict[str, Any]:
+        """各Agent响应metadata中通用的模型调用信息"""
+        metadata = {"cached_tokens": result.get("cached_tokens", 0)}
+        if result.get("cascade"):
+            metadata["cascade"] = result["cascade"]
+        return metadata
+    
+    def _record_interaction(self, prompt: str, result: Dict[str, Any]):
+        """记录本次交互（写入内存缓冲区，由后台任务批量落库）"""
+        interaction_recorder.record(
+            request_id=get_request_id(),
+            agent_name=self.name,
+            agent_type=self.agent_type,
+            provider=result.get("provider", self.provider),
+            model_used=result.get("model_used"),
+            prompt=prompt,
+            response=result.get("response"),
+            tokens_used=result.get("tokens_used"),
+            latency=result.get("processing_time")
+        )
+    
+    async def stream_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理消息
+        
+        产出 {"type": "delta", "content": ...} 事件，最后产出
+        {"type": "done", "result": ...}，result 与 process_message 的返回值一致。
+        子类未实现流式处理时，一次性返回完整结果。
+        """
+        result = await self.process_message(message, context)
+        if result.get("response"):
+            yield {"type": "delta", "content": result["response"]}
+        yield {"type": "done", "result": result}
+    
+    def dump_state(self) -> Dict[str, Any]:
+        """导出可序列化的状态（Agent换出到磁盘时使用，from_state 据此重建）"""
+        return {
+            "name": self.name,
+            "agent_id": self.agent_id,
+            "provider": self.provider,
+            "model_name": self.model_name,
+            "config": self.config,
+            "options": self._options()
+        }
+    
+    def state_size(self) -> int:
+        """状态序列化后的大小（字节），有运行时状态的子类可以增量维护"""
+        return len(dumps(self.dump_state()))
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "BaseAgent":
+        """根据 dump_state 导出的状态重建Agent"""
+        agent = cls(
+            name=state["name"],
+            provider=state["provider"],
+            config=state["config"],
+            model_name=state["model_name"],
+            agent_id=state.get("agent_id"),
+            **state.get("options", {})
+        )
+        agent._load_state(state)
+        return agent
+    
+    def _options(self) -> Dict[str, Any]:
+        """子类特有的构造参数"""
+        return {}
+    
+    def _load_state(self, state: Dict[str, Any]):
+        """恢复构造参数以外的运行时状态（子类实现）"""
+        pass
     
     def get_info(self) -> Dict[str, Any]:
         """获取Agent信息"""
@@ -0,0 +1,70 @@
+"""
+模型级联策略
+
+请求先交给配置的小模型，回答通过廉价检查（非空、未被截断、没有明显的不确定表述等）即直接返回，
+否则升级到大模型重新生成。Agent配置示例:
+
+    "cascade": {
+        "small_model": "qwen2.5:1.5b",
+        "large_model": "deepseek-r1:8b",    // 可选，默认使用config中的model或提供商默认模型
+        "min_chars": 2,                     // 可选，回答少于该字符数视为失败
+        "hedge_phrases": ["我不知道"]        // 可选，出现即视为低置信度
+    }
+"""
+import re
+from typing import Dict, Any, Optional, Sequence
+
+# 默认的低置信度表述
+DEFAULT_HEDGE_PHRASES = (
+    "我不知道", "我不确定", "无法回答", "不太清楚",
+    "i don't know", "i'm not sure", "i am not sure", "i cannot answer",
+)
+
+# 推理模型输出的思考过程
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.S)
+
+
+def strip_reasoning(text: str) -> str:
+    """去掉推理模型的 <think> 思考过程，只保留最终回答"""
+    return _THINK_BLOCK.sub("", text)
+
+
+class CascadePolicy:
+    """小模型优先、检查失败再升级的级联策略"""
+
+    def __init__(
+        self,
+        small_model: str,
+        large_model: Optional[str] = None,
+        min_chars: int = 2,
+        hedge_phrases: Sequence[str] = DEFAULT_HEDGE_PHRASES
+    ):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.min_chars = min_chars
+        self.hedge_phrases = tuple(phrase.lower() for phrase in hedge_phrases)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["CascadePolicy"]:
+        """从Agent配置创建，未配置小模型时返回None"""
+        cascade = config.get("cascade")
+        if not cascade or not cascade.get("small_model"):
+            return None
+        return cls(
+            small_model=cascade["small_model"],
+            large_model=cascade.get("large_model") or config.get("model"),
+            min_chars=cascade.get("min_chars", 2),
+            hedge_phrases=cascade.get("hedge_phrases", DEFAULT_HEDGE_PHRASES)
+        )
+
+    def check(self, result: Dict[str, Any]) -> Optional[str]:
+        """检查小模型的回答，通过返回None，否则返回升级原因"""
+        if result.get("finish_reason") == "length":
+            return "truncated"
+        text = strip_reasoning(result.get("response") or "").strip()
+        if len(text) < self.min_chars:
+            return "empty"
+        lowered = text.lower()
+        if any(phrase in lowered for phrase in self.hedge_phrases):
+            return "low_confidence"
+        return None
@@ -1,80 +1,425 @@
 """
 聊天Agent实现
 """
-from typing import Dict, Any, Optional
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from loguru import logger
+from app.core.config import settings
+from app.services.ai_service import ConversationExpiredError
+from app.prompts import flatten_prompt, build_messages
+from app.utils.timing import span
+from app.utils.cancellation import aclosing
+from app.utils.serialization import dumps
+from app.utils.deadline import current_deadline, replace_deadline, run_with_deadline
+from app.utils.request_context import get_request_id
 from .base import BaseAgent
 
 
+# 默认系统提示
+DEFAULT_SYSTEM_PROMPT = "你是一个有用的AI助手。请用中文回答问题。"
+
+# 未指定 session_id 时使用的会话
+DEFAULT_SESSION = "default"
+
+
+class ChatSession:
+    """单个会话的状态
+    
+    history 为本地对话历史；使用服务端会话的提供商（Dify）时仅作镜像，
+    用于查询历史和在服务端会话失效后重建上下文。
+    """
+    
+    __slots__ = ("history", "conversation_id", "lock", "pending", "size")
+    
+    def __init__(self):
+        self.history: List[Tuple[str, str]] = []
+        self.conversation_id: Optional[str] = None
+        # 本会话在 dump_state 中序列化后的大小（字节）
+        self.size = 0
+        # 同一会话同时只处理一轮，asyncio.Lock按等待顺序唤醒，保证各轮按到达顺序执行
+        self.lock = asyncio.Lock()
+        # 启用消息合并时，尚未开始生成的一轮
+        self.pending: Optional["PendingTurn"] = None
+
+
+class PendingTurn:
+    """尚未开始生成的一轮对话
+    
+    合并窗口内（或前一轮仍在生成时）到达同一会话的消息加入这一轮，合并为一次生成，
+    生成的事件分发给每个加入的请求。
+    
+    合并的一轮在独立任务中执行：截止时间取所有加入请求中最晚的一个（任一请求未设置截止时间时不限），
+    每个请求仍按自己的截止时间单独超时离开；日志和交互记录使用第一个请求的 request_id，
+    request_ids 中记录了所有加入的请求。
+    """
+    
+    __slots__ = ("messages", "context", "subscribers", "created_at", "finished", "task", "deadline", "request_ids")
+    
+    def __init__(self, message: str, context: Optional[Dict[str, Any]]):
+        self.messages: List[str] = [message]
+        self.context = context
+        self.subscribers: List[asyncio.Queue] = []
+        self.created_at = time.monotonic()
+        self.finished = False
+        self.task: Optional[asyncio.Future] = None
+        self.deadline = current_deadline()
+        self.request_ids: List[Optional[str]] = [get_request_id()]
+    
+    def join(self, message: str, context: Optional[Dict[str, Any]]):
+        """加入一条消息，截止时间延后到加入请求中最晚的一个"""
+        self.messages.append(message)
+        self.context = context
+        self.request_ids.append(get_request_id())
+        deadline = current_deadline()
+        if self.deadline is not None:
+            self.deadline = None if deadline is None else max(self.deadline, deadline)
+    
+    def publish(self, event: Dict[str, Any]):
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+
 class ChatAgent(BaseAgent):
     """聊天Agent"""
     
     def __init__(self, name: str = "ChatAgent", provider: str = "ollama", **kwargs):
         super().__init__(name, "chat", provider, **kwargs)
-        self.conversation_history = []
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # 各会话序列化大小之和，会话变化时增量更新，避免每次测量都序列化全部历史
+        self._sessions_size = 0
         self.max_history = kwargs.get("max_history", 10)
+        self.max_sessions = kwargs.get("max_sessions", 1000)
+        # 合并窗口（秒）：大于0时，窗口内或前一轮仍在生成时到达的消息合并为一轮
+        self.coalesce_window = float(self.config.get("coalesce_window", settings.chat_coalesce_window))
+        # 静态系统提示只渲染一次，保证各请求的前缀逐字节一致
+        self.system_prompt = self.prompt_template.render_system(
+            system_prompt=self.config.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
+        )
+        # 提供商在服务端保存会话时，每轮只发送新消息
+        self.server_conversations = getattr(self.ai_service, "supports_conversations", False)
+    
+    @property
+    def conversation_history(self) -> List[Tuple[str, str]]:
+        """默认会话的对话历史"""
+        return self._get_session(DEFAULT_SESSION).history
+    
+    def _get_session(self, session_id: Optional[str] = None) -> ChatSession:
+        """获取会话（不存在时创建，超出上限时淘汰最久未使用的会话）"""
+        session_id = session_id or DEFAULT_SESSION
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = ChatSession()
+            self._resize_session(session_id, session)
+            if len(self.sessions) > self.max_sessions:
+                self._evict_session(keep=session_id)
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
+    
+    def _evict_session(self, keep: str):
+        """淘汰最久未使用的空闲会话（正在处理或有待处理轮次的会话不淘汰，全部忙碌时暂时超出上限）"""
+        for session_id, session in self.sessions.items():
+            if session_id != keep and not session.lock.locked() and session.pending is None:
+                break
+        else:
+            return
+        del self.sessions[session_id]
+        self._sessions_size -= session.size
+    
+    @staticmethod
+    def _session_id(context: Optional[Dict[str, Any]]) -> str:
+        return (context or {}).get("session_id") or DEFAULT_SESSION
+    
+    def _prepare_request(self, message: str, context: Optional[Dict[str, Any]], session_id: str, session: ChatSession) -> Tuple[str, Dict[str, Any]]:
+        """构建提示词和调用参数"""
+        kwargs = dict(self.config)
+        # 同一会话的请求路由到同一节点，复用节点上的KV缓存
+        kwargs["affinity_key"] = f"{self.affinity_id}:{session_id}"
+        if self.server_conversations:
+            kwargs["user"] = f"{self.affinity_id}:{session_id}"
+            if session.conversation_id:
+                # 服务端已保存上下文，只发送新消息
+                kwargs["conversation_id"] = session.conversation_id
+                return self._render_user(message, context), kwargs
+            # 新会话：首轮直接发送消息；会话失效重建时带上本地镜像的历史
+            if session.history:
+                return self._build_prompt(message, context, session), kwargs
+            return self._render_user(message, context), kwargs
+        
+        kwargs["messages"] = self._build_messages(message, context, session)
+        return self._build_prompt(message, context, session), kwargs
     
     async def process_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """处理聊天消息"""
+        """处理聊天消息（同一会话的消息按到达顺序逐轮处理）"""
         try:
-            # 构建对话历史
-            prompt = self._build_prompt(message, context)
+            session_id = self._session_id(context)
+            session = self._get_session(session_id)
             
-            # 生成响应
-            result = await self.generate_response(prompt, **self.config)
-            
-            # 更新对话历史
-            self._update_history(message, result["response"])
+            if self.coalesce_window <= 0:
+                async with session.lock:
+                    return await self._process_turn(message, context, session_id, session)
             
-            return {
-                "agent_id": self.name,
-                "response": result["response"],
-                "model_used": result["model_used"],
-                "tokens_used": result["tokens_used"],
-                "processing_time": result["processing_time"],
-                "metadata": {
-                    "conversation_length": len(self.conversation_history),
-                    "provider": result["provider"]
-                }
-            }
+            async with aclosing(self._join_turn(message, context, session_id, session)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        return event["result"]
+            raise RuntimeError("合并的一轮未返回结果")
             
         except Exception as e:
             logger.error(f"ChatAgent处理消息失败: {e}")
             raise
     
-    def _build_prompt(self, message: str, context: Optional[Dict[str, Any]] = None) -> str:
-        """构建提示词"""
-        prompt_parts = []
+    async def stream_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理聊天消息（同一会话的消息按到达顺序逐轮处理）"""
+        try:
+            session_id = self._session_id(context)
+            session = self._get_session(session_id)
+            
+            if self.coalesce_window > 0:
+                turn = self._join_turn(message, context, session_id, session)
+            else:
+                turn = self._ordered_stream(message, context, session_id, session)
+            async with aclosing(turn) as events:
+                async for event in events:
+                    yield event
+            
+        except Exception as e:
+            logger.error(f"ChatAgent流式处理消息失败: {e}")
+            raise
+    
+    async def _process_turn(self, message: str, context: Optional[Dict[str, Any]], session_id: str, session: ChatSession) -> Dict[str, Any]:
+        """生成一轮回答（调用方持有会话锁）"""
+        for attempt in range(2):
+            # 构建对话历史
+            with span("prompt_build"):
+                prompt, kwargs = self._prepare_request(message, context, session_id, session)
+            
+            # 生成响应
+            try:
+                result = await self.generate_response(prompt, **kwargs)
+                break
+            except ConversationExpiredError:
+                if attempt:
+                    raise
+                self._reset_conversation(session_id, session)
+            except asyncio.CancelledError:
+                self._abandon_turn(session_id, session)
+                raise
         
-        # 添加系统提示
-        system_prompt = self.config.get("system_prompt", "你是一个有用的AI助手。请用中文回答问题。")
-        prompt_parts.append(f"系统: {system_prompt}")
+        # 更新对话历史
+        self._update_history(message, result, session_id, session)
         
-        # 添加对话历史
-        if self.conversation_history:
-            for i, (user_msg, ai_msg) in enumerate(self.conversation_history[-self.max_history:], 1):
-                prompt_parts.append(f"用户{i}: {user_msg}")
-                prompt_parts.append(f"助手{i}: {ai_msg}")
+        return self._build_result(result, session)
+    
+    async def _ordered_stream(self, message: str, context: Optional[Dict[str, Any]], session_id: str, session: ChatSession) -> AsyncIterator[Dict[str, Any]]:
+        async with session.lock:
+            async with aclosing(self._stream_turn(message, context, session_id, session)) as events:
+                async for event in events:
+                    yield event
+    
+    async def _stream_turn(self, message: str, context: Optional[Dict[str, Any]], session_id: str, session: ChatSession) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成一轮回答（调用方持有会话锁）"""
+        for attempt in range(2):
+            with span("prompt_build"):
+                prompt, kwargs = self._prepare_request(message, context, session_id, session)
+            
+            started = completed = False
+            try:
+                async with aclosing(self.stream_response(prompt, **kwargs)) as events:
+                    async for event in events:
+                        if event["type"] == "done":
+                            # 仅在完整生成后更新对话历史
+                            self._update_history(message, event["result"], session_id, session)
+                            completed = True
+                            yield {"type": "done", "result": self._build_result(event["result"], session)}
+                        else:
+                            started = True
+                            yield event
+                return
+            except ConversationExpiredError:
+                # 已经输出内容后不能重试
+                if attempt or started:
+                    raise
+                self._reset_conversation(session_id, session)
+            except (asyncio.CancelledError, GeneratorExit):
+                if not completed:
+                    self._abandon_turn(session_id, session)
+                raise
+    
+    async def _join_turn(self, message: str, context: Optional[Dict[str, Any]], session_id: str, session: ChatSession) -> AsyncIterator[Dict[str, Any]]:
+        """加入会话中尚未开始的一轮（没有时新建），与同一轮的其他请求共享生成的事件"""
+        turn = session.pending
+        if turn is None:
+            turn = session.pending = PendingTurn(message, context)
+            turn.task = asyncio.ensure_future(self._run_turn(turn, session_id, session))
+        else:
+            turn.join(message, context)
         
-        # 添加当前消息
-        prompt_parts.append(f"用户: {message}")
-        prompt_parts.append("助手:")
+        queue: asyncio.Queue = asyncio.Queue()
+        turn.subscribers.append(queue)
+        try:
+            while True:
+                # 合并的一轮按最晚的截止时间执行，每个请求在自己的截止时间到达时单独离开
+                event = await run_with_deadline(queue.get())
+                if event["type"] == "error":
+                    raise event["error"]
+                if event["type"] == "done":
+                    result = event["result"]
+                    # 每个请求各自一份metadata（路由可能往里写入timings）
+                    yield {"type": "done", "result": {**result, "metadata": dict(result["metadata"])}}
+                    return
+                yield event
+        finally:
+            turn.subscribers.remove(queue)
+            # 所有请求都已离开（客户端断开）时取消这一轮，之后到达的消息另开一轮
+            if not turn.subscribers and not turn.finished:
+                if session.pending is turn:
+                    session.pending = None
+                turn.task.cancel()
+    
+    async def _run_turn(self, turn: "PendingTurn", session_id: str, session: ChatSession):
+        """等到前一轮结束和合并窗口过去后，把这一轮收集到的消息合并生成一次回答"""
+        try:
+            async with session.lock:
+                delay = turn.created_at + self.coalesce_window - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # 之后到达的消息进入下一轮
+                if session.pending is turn:
+                    session.pending = None
+                # 本任务复制了第一个请求的上下文，改为按所有加入请求中最晚的截止时间生成
+                replace_deadline(turn.deadline)
+                
+                if len(turn.messages) > 1:
+                    logger.info(
+                        f"ChatAgent {self.name} 会话 {session_id} 合并 {len(turn.messages)} 条消息为一轮，"
+                        f"请求: {', '.join(str(request_id) for request_id in turn.request_ids)}"
+                    )
+                message = "\n".join(turn.messages)
+                async with aclosing(self._stream_turn(message, turn.context, session_id, session)) as events:
+                    async for event in events:
+                        if event["type"] == "done":
+                            turn.finished = True
+                            event["result"]["metadata"]["coalesced_messages"] = len(turn.messages)
+                            event["result"]["metadata"]["coalesced_request_ids"] = turn.request_ids
+                        turn.publish(event)
+        except asyncio.CancelledError:
+            turn.publish({"type": "error", "error": RuntimeError("本轮已取消")})
+            raise
+        except Exception as e:
+            turn.finished = True
+            turn.publish({"type": "error", "error": e})
+        finally:
+            if session.pending is turn:
+                session.pending = None
+    
+    def _reset_conversation(self, session_id: str, session: ChatSession):
+        """服务端会话失效，丢弃会话ID以便重建"""
+        logger.info(f"ChatAgent {self.name} 会话 {session_id} 的服务端会话已失效，重新创建")
+        session.conversation_id = None
+        self._resize_session(session_id, session)
+    
+    def _abandon_turn(self, session_id: str, session: ChatSession):
+        """本轮被取消，不写入本地历史
         
-        return "\n".join(prompt_parts)
+        服务端会话可能已经记录了这一轮，与本地历史不再一致，丢弃会话ID，
+        下一轮用本地历史重建服务端会话。
+        """
+        if session.conversation_id:
+            logger.info(f"ChatAgent {self.name} 会话 {session_id} 本轮已取消，下一轮重建服务端会话")
+            session.conversation_id = None
+            self._resize_session(session_id, session)
+    
+    def _build_result(self, result: Dict[str, Any], session: ChatSession) -> Dict[str, Any]:
+        """构建返回结果"""
+        return {
+            "agent_id": self.name,
+            "response": result["response"],
+            "model_used": result["model_used"],
+            "tokens_used": result["tokens_used"],
+            "processing_time": result["processing_time"],
+            "metadata": {
+                "conversation_length": len(session.history),
+                **self._llm_metadata(result),
+                "provider": result["provider"],
+                "provider_metadata": result.get("metadata", {})
+            }
+        }
+    
+    def _render_user(self, message: str, context: Optional[Dict[str, Any]]) -> str:
+        return self.prompt_template.render_user(message=message, context=context or {})
+    
+    def _history(self, context: Optional[Dict[str, Any]], session: Optional[ChatSession]) -> List[Tuple[str, str]]:
+        return (session or self._get_session(self._session_id(context))).history[-self.max_history:]
+    
+    def _build_prompt(self, message: str, context: Optional[Dict[str, Any]] = None, session: Optional[ChatSession] = None) -> str:
+        """构建提示词"""
+        return flatten_prompt(self.system_prompt, self._history(context, session), self._render_user(message, context))
     
-    def _update_history(self, user_message: str, ai_response: str):
-        """更新对话历史"""
-        self.conversation_history.append((user_message, ai_response))
+    def _build_messages(self, message: str, context: Optional[Dict[str, Any]] = None, session: Optional[ChatSession] = None) -> List[Dict[str, str]]:
+        """构建结构化消息（系统提示和历史轮次保持不变，便于提供商缓存前缀）"""
+        return build_messages(self.system_prompt, self._history(context, session), self._render_user(message, context))
+    
+    def _update_history(self, user_message: str, result: Dict[str, Any], session_id: str, session: ChatSession):
+        """更新对话历史和服务端会话ID"""
+        session.history.append((user_message, result["response"]))
+        if result.get("conversation_id"):
+            session.conversation_id = result["conversation_id"]
         
         # 保持历史记录在限制范围内
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        if len(session.history) > self.max_history:
+            del session.history[:-self.max_history]
+        
+        if self.sessions.get(session_id) is session:
+            self._resize_session(session_id, session)
+    
+    def _resize_session(self, session_id: str, session: ChatSession):
+        """重新测量单个会话的序列化大小（只序列化该会话，代价与历史轮数上限成正比）"""
+        size = len(dumps([session_id, session.history, session.conversation_id]))
+        self._sessions_size += size - session.size
+        session.size = size
+        self.state_version += 1
+    
+    def clear_history(self, session_id: Optional[str] = None):
+        """清空对话历史（未指定会话时清空所有会话）"""
+        self.state_version += 1
+        if session_id is None:
+            self.sessions.clear()
+            self._sessions_size = 0
+            logger.info(f"ChatAgent {self.name} 对话历史已清空")
+        else:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                self._sessions_size -= session.size
+            logger.info(f"ChatAgent {self.name} 会话 {session_id} 的对话历史已清空")
+    
+    def _options(self) -> Dict[str, Any]:
+        return {"max_history": self.max_history, "max_sessions": self.max_sessions}
+    
+    def dump_state(self) -> Dict[str, Any]:
+        """导出状态，包括各会话的历史和服务端会话ID（按最近使用顺序）"""
+        return {
+            **super().dump_state(),
+            "sessions": [
+                [session_id, session.history, session.conversation_id]
+                for session_id, session in self.sessions.items()
+            ]
+        }
+    
+    def _load_state(self, state: Dict[str, Any]):
+        for session_id, history, conversation_id in state.get("sessions", []):
+            session = self.sessions[session_id] = ChatSession()
+            session.history = [tuple(turn) for turn in history]
+            session.conversation_id = conversation_id
+            self._resize_session(session_id, session)
     
-    def clear_history(self):
-        """清空对话历史"""
-        self.conversation_history.clear()
-        logger.info(f"ChatAgent {self.name} 对话历史已清空")
+    def state_size(self) -> int:
+        """状态序列化大小的估算（会话部分增量维护）"""
+        return len(dumps(BaseAgent.dump_state(self))) + self._sessions_size
     
-    def get_history(self) -> list:
+    def get_history(self, session_id: Optional[str] = None) -> list:
         """获取对话历史"""
-        return self.conversation_history.copy() 
\ No newline at end of file
+        session = self.sessions.get(session_id or DEFAULT_SESSION)
+        return session.history.copy() if session is not None else []
@@ -1,8 +1,11 @@
 """
 代码生成Agent
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, AsyncIterator
 from loguru import logger
+from app.utils.timing import span
+from app.utils.cancellation import aclosing
+from app.prompts import flatten_prompt, build_messages
 from .base import BaseAgent
 
 
@@ -13,68 +16,87 @@ class CodeAgent(BaseAgent):
         super().__init__(name, "code", provider, **kwargs)
         self.language = kwargs.get("language", "python")
         self.framework = kwargs.get("framework", "")
+        self._render_system()
     
     async def process_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理代码生成请求"""
         try:
             # 构建代码生成提示词
-            prompt = self._build_code_prompt(message, context)
+            with span("prompt_build"):
+                prompt = self._build_code_prompt(message, context)
+                messages = self._build_code_messages(message, context)
             
             # 生成响应
-            result = await self.generate_response(prompt, **self.config)
+            result = await self.generate_response(prompt, messages=messages, **self.config)
             
-            # 提取代码块
-            code_blocks = self._extract_code_blocks(result["response"])
-            
-            return {
-                "agent_id": self.name,
-                "response": result["response"],
-                "code_blocks": code_blocks,
-                "model_used": result["model_used"],
-                "tokens_used": result["tokens_used"],
-                "processing_time": result["processing_time"],
-                "metadata": {
-                    "language": self.language,
-                    "framework": self.framework,
-                    "code_block_count": len(code_blocks),
-                    "provider": result["provider"]
-                }
-            }
+            return self._build_result(result)
             
         except Exception as e:
             logger.error(f"CodeAgent处理消息失败: {e}")
             raise
     
+    async def stream_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理代码生成请求"""
+        try:
+            with span("prompt_build"):
+                prompt = self._build_code_prompt(message, context)
+                messages = self._build_code_messages(message, context)
+            
+            async with aclosing(self.stream_response(prompt, messages=messages, **self.config)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        yield {"type": "done", "result": self._build_result(event["result"])}
+                    else:
+                        yield event
+            
+        except Exception as e:
+            logger.error(f"CodeAgent流式处理消息失败: {e}")
+            raise
+    
+    def _cascade_check(self, result: Dict[str, Any]) -> Optional[str]:
+        """小模型的回答还需要能提取出代码块"""
+        reason = super()._cascade_check(result)
+        if reason is None and not self._extract_code_blocks(result.get("response") or ""):
+            return "no_code"
+        return reason
+    
+    def _build_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """构建返回结果"""
+        # 提取代码块
+        with span("code_extract"):
+            code_blocks = self._extract_code_blocks(result["response"])
+        
+        return {
+            "agent_id": self.name,
+            "response": result["response"],
+            "code_blocks": code_blocks,
+            "model_used": result["model_used"],
+            "tokens_used": result["tokens_used"],
+            "processing_time": result["processing_time"],
+            "metadata": {
+                "language": self.language,
+                "framework": self.framework,
+                "code_block_count": len(code_blocks),
+                **self._llm_metadata(result),
+                "provider": result["provider"],
+                "provider_metadata": result.get("metadata", {})
+            }
+        }
+    
+    def _render_system(self):
+        """渲染静态系统提示（语言或框架变化时重新渲染）"""
+        self.system_prompt = self.prompt_template.render_system(language=self.language, framework=self.framework)
+    
+    def _render_user(self, message: str, context: Optional[Dict[str, Any]]) -> str:
+        return self.prompt_template.render_user(message=message, context=context or {})
+    
     def _build_code_prompt(self, message: str, context: Optional[Dict[str, Any]] = None) -> str:
         """构建代码生成提示词"""
-        prompt_parts = []
-        
-        # 系统提示
-        system_prompt = f"""你是一个专业的{self.language}程序员。请根据用户的需求生成高质量的代码。
-
-要求：
-1. 代码要简洁、高效、易读
-2. 添加必要的注释
-3. 遵循最佳实践
-4. 如果涉及特定框架，请使用{self.framework}（如果指定）
-5. 提供完整的代码示例
-
-请用中文回复，代码用markdown格式。"""
-        
-        prompt_parts.append(f"系统: {system_prompt}")
-        
-        # 添加上下文信息
-        if context:
-            if "requirements" in context:
-                prompt_parts.append(f"需求: {context['requirements']}")
-            if "constraints" in context:
-                prompt_parts.append(f"约束: {context['constraints']}")
-        
-        # 添加用户消息
-        prompt_parts.append(f"用户: {message}")
-        prompt_parts.append("助手:")
-        
-        return "\n".join(prompt_parts)
+        return flatten_prompt(self.system_prompt, (), self._render_user(message, context))
+    
+    def _build_code_messages(self, message: str, context: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        """构建结构化消息（系统提示独立成条，便于提供商缓存前缀）"""
+        return build_messages(self.system_prompt, (), self._render_user(message, context))
     
     def _extract_code_blocks(self, response: str) -> list:
         """提取代码块"""
@@ -105,12 +127,17 @@ class CodeAgent(BaseAgent):
         
         return code_blocks
     
+    def _options(self) -> Dict[str, Any]:
+        return {"language": self.language, "framework": self.framework}
+    
     def set_language(self, language: str):
         """设置编程语言"""
         self.language = language
+        self._render_system()
         logger.info(f"CodeAgent {self.name} 设置语言为: {language}")
     
     def set_framework(self, framework: str):
         """设置框架"""
         self.framework = framework
+        self._render_system()
         logger.info(f"CodeAgent {self.name} 设置框架为: {framework}") 
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+文档问答Agent
+"""
+from typing import Dict, Any, Optional, List, AsyncIterator
+from loguru import logger
+from app.core.config import settings
+from app.services.document_store import get_document_store
+from app.utils.timing import span
+from app.utils.cancellation import aclosing
+from app.prompts import flatten_prompt, build_messages
+from .base import BaseAgent
+
+
+class DocumentAgent(BaseAgent):
+    """基于已上传文档回答问题的Agent"""
+
+    def __init__(self, name: str = "DocumentAgent", provider: str = "ollama", **kwargs):
+        super().__init__(name, "document", provider, **kwargs)
+        self.collection = kwargs.get("collection", "default")
+        self.top_k = kwargs.get("top_k", settings.document_top_k)
+        self.store = get_document_store(self.collection)
+        self.system_prompt = self.prompt_template.render_system()
+
+    async def process_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """处理文档问答请求"""
+        try:
+            chunks = await self._retrieve(message)
+            with span("prompt_build"):
+                prompt = self._build_document_prompt(message, chunks)
+                messages = self._build_document_messages(message, chunks)
+
+            result = await self.generate_response(prompt, messages=messages, **self.config)
+            return self._build_result(result, chunks)
+
+        except Exception as e:
+            logger.error(f"DocumentAgent处理消息失败: {e}")
+            raise
+
+    async def stream_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理文档问答请求（检索完成后流式输出AI回答）"""
+        try:
+            chunks = await self._retrieve(message)
+            with span("prompt_build"):
+                prompt = self._build_document_prompt(message, chunks)
+                messages = self._build_document_messages(message, chunks)
+
+            async with aclosing(self.stream_response(prompt, messages=messages, **self.config)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        yield {"type": "done", "result": self._build_result(event["result"], chunks)}
+                    else:
+                        yield event
+
+        except Exception as e:
+            logger.error(f"DocumentAgent流式处理消息失败: {e}")
+            raise
+
+    async def _retrieve(self, message: str) -> List[Dict[str, Any]]:
+        """检索与问题最相关的文本块"""
+        with span("retrieve"):
+            return await self.store.query(message, self.top_k)
+
+    def _render_user(self, message: str, chunks: List[Dict[str, Any]]) -> str:
+        return self.prompt_template.render_user(message=message, chunks=chunks)
+
+    def _build_document_prompt(self, message: str, chunks: List[Dict[str, Any]]) -> str:
+        """构建包含文档片段的提示词"""
+        return flatten_prompt(self.system_prompt, (), self._render_user(message, chunks))
+
+    def _build_document_messages(self, message: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """构建结构化消息（固定的回答要求作为系统消息放在最前，便于提供商缓存前缀）"""
+        return build_messages(self.system_prompt, (), self._render_user(message, chunks))
+
+    def _build_result(self, result: Dict[str, Any], chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """构建返回结果"""
+        return {
+            "agent_id": self.name,
+            "response": result["response"],
+            "model_used": result["model_used"],
+            "tokens_used": result["tokens_used"],
+            "processing_time": result["processing_time"],
+            "metadata": {
+                "collection": self.collection,
+                "sources": [{"document": chunk["document"], "score": chunk["score"]} for chunk in chunks],
+                **self._llm_metadata(result),
+                "provider": result["provider"],
+                "provider_metadata": result.get("metadata", {})
+            }
+        }
+
+    def _options(self) -> Dict[str, Any]:
+        return {"collection": self.collection, "top_k": self.top_k}
@@ -3,14 +3,40 @@
 """
 import re
 import asyncio
-from typing import Dict, Any, Optional, List
-from urllib.parse import quote_plus
+from typing import Dict, Any, Optional, List, AsyncIterator
 import httpx
-from bs4 import BeautifulSoup
 from loguru import logger
+from app.core.config import settings
+from app.utils.timing import span
+from app.utils.cancellation import aclosing
+from app.utils.deadline import remaining
+from app.utils.metrics import SEARCH_ENGINES_SKIPPED, SEARCH_RESULTS_FILTERED
+from app.utils.keyword_matcher import get_matcher
+from app.utils.http_client import get_http_client
+from app.services.serp_parser import parse_bing_async
+from app.prompts import flatten_prompt, build_messages
 from .base import BaseAgent
 
 
+# Bing每页的自然结果数，整页解析后再过滤广告、去重
+BING_PAGE_RESULTS = 10
+
+# 广告指示词（英文按整词匹配），可通过 ad_keywords 配置追加
+AD_KEYWORDS = [
+    "广告", "推广", "赞助", "ad", "sponsored", "promoted",
+    "购买", "优惠", "折扣", "限时", "特价"
+]
+
+# 消息开头的搜索指示词（匹配最长的一个），可通过 intent_keywords 配置追加
+SEARCH_INTENT_KEYWORDS = [
+    "搜索", "查找", "查询", "搜索一下", "帮我搜索", "请搜索",
+    "search", "find", "look up", "search for"
+]
+
+# 去掉指示词后查询开头残留的分隔符
+_QUERY_SEPARATORS = " \t\r\n:：,，"
+
+
 class SearchAgent(BaseAgent):
     """搜索引擎Agent"""
     
@@ -19,12 +45,19 @@ class SearchAgent(BaseAgent):
         self.search_engines = kwargs.get("search_engines", ["duckduckgo"])
         self.max_results = kwargs.get("max_results", 1)
         self.timeout = kwargs.get("timeout", 10.0)
+        self.ad_keywords = list(kwargs.get("ad_keywords", []))
+        self.intent_keywords = list(kwargs.get("intent_keywords", []))
+        # 关键词组编译为单趟匹配器，相同配置的Agent共享同一个匹配器
+        self.ad_matcher = get_matcher(AD_KEYWORDS + self.ad_keywords)
+        self.intent_matcher = get_matcher(SEARCH_INTENT_KEYWORDS + self.intent_keywords)
+        self.system_prompt = self.prompt_template.render_system()
         
     async def process_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """处理搜索请求"""
         try:
             # 提取搜索关键词
-            search_query = self._extract_search_query(message, context)
+            with span("query_extract"):
+                search_query = self._extract_search_query(message, context)
             
             # 执行搜索
             search_results = await self._perform_search(search_query)
@@ -35,62 +68,103 @@ class SearchAgent(BaseAgent):
             # 使用AI服务优化响应
             ai_response = await self._enhance_with_ai(message, search_results, context)
             
-            return {
-                "agent_id": self.name,
-                "response": ai_response["response"],
-                "model_used": ai_response["model_used"],
-                "tokens_used": ai_response["tokens_used"],
-                "processing_time": ai_response["processing_time"],
-                "metadata": {
-                    "search_query": search_query,
-                    "search_results": search_results,
-                    "search_engines_used": self.search_engines,
-                    "results_count": len(search_results)
-                }
-            }
+            return self._build_result(search_query, search_results, ai_response)
             
         except Exception as e:
             logger.error(f"SearchAgent处理消息失败: {e}")
             raise
     
+    async def stream_message(self, message: str, context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理搜索请求（搜索完成后流式输出AI回答）"""
+        try:
+            with span("query_extract"):
+                search_query = self._extract_search_query(message, context)
+            search_results = await self._perform_search(search_query)
+            with span("prompt_build"):
+                prompt = self._build_search_prompt(message, search_results)
+                messages = self._build_search_messages(message, search_results)
+            
+            async with aclosing(self.stream_response(prompt, messages=messages, **self.config)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        yield {"type": "done", "result": self._build_result(search_query, search_results, event["result"])}
+                    else:
+                        yield event
+            
+        except Exception as e:
+            logger.error(f"SearchAgent流式处理消息失败: {e}")
+            raise
+    
+    def _build_result(self, search_query: str, search_results: List[Dict[str, Any]], ai_response: Dict[str, Any]) -> Dict[str, Any]:
+        """构建返回结果"""
+        return {
+            "agent_id": self.name,
+            "response": ai_response["response"],
+            "model_used": ai_response["model_used"],
+            "tokens_used": ai_response["tokens_used"],
+            "processing_time": ai_response["processing_time"],
+            "metadata": {
+                "search_query": search_query,
+                "search_results": search_results,
+                "search_engines_used": self.search_engines,
+                "results_count": len(search_results),
+                **self._llm_metadata(ai_response),
+                "provider": ai_response["provider"],
+                "provider_metadata": ai_response.get("metadata", {})
+            }
+        }
+    
     def _extract_search_query(self, message: str, context: Optional[Dict[str, Any]] = None) -> str:
         """提取搜索关键词"""
         # 如果context中有明确的搜索查询，使用它
         if context and "search_query" in context:
             return context["search_query"]
         
-        # 从消息中提取搜索关键词
-        # 移除常见的搜索指示词
-        search_indicators = [
-            "搜索", "查找", "查询", "搜索一下", "帮我搜索", "请搜索",
-            "search", "find", "look up", "search for"
-        ]
-        
+        # 从消息中提取搜索关键词：移除开头最长的搜索指示词（"搜索一下" 优先于 "搜索"）
         query = message.strip()
-        for indicator in search_indicators:
-            if query.startswith(indicator):
-                query = query[len(indicator):].strip()
-                break
+        indicator = self.intent_matcher.match_prefix(query)
+        if indicator:
+            query = query[len(indicator):].lstrip(_QUERY_SEPARATORS).strip()
         
         return query if query else message.strip()
     
+    def _search_timeout(self, index: int) -> Optional[float]:
+        """第index个搜索引擎可用的超时，剩余预算不足时返回None（跳过该引擎）
+        
+        设置了请求截止时间时，搜索阶段只使用为LLM调用保留之外的预算；
+        第一个引擎之后的引擎是可选的，剩余预算不够完整执行一次时直接跳过。
+        """
+        left = remaining()
+        if left is None:
+            return self.timeout
+        budget = left - settings.deadline_llm_reserve
+        if budget <= 0 or (index > 0 and budget < self.timeout):
+            return None
+        return min(self.timeout, budget)
+    
     async def _perform_search(self, query: str) -> List[Dict[str, Any]]:
         """执行搜索"""
         all_results = []
         
-        for engine in self.search_engines:
+        for index, engine in enumerate(self.search_engines):
+            timeout = self._search_timeout(index)
+            if timeout is None:
+                logger.info(f"剩余预算不足，跳过搜索引擎 {engine}")
+                SEARCH_ENGINES_SKIPPED.labels(engine).inc()
+                continue
             try:
-                if engine == "duckduckgo":
-                    results = await self._search_google(query)  # 使用DuckDuckGo
-                elif engine == "bing":
-                    results = await self._search_bing(query)
-                elif engine == "google":
-                    results = await self._search_google(query)  # 也使用DuckDuckGo作为Google替代
-                else:
-                    logger.warning(f"不支持的搜索引擎: {engine}")
-                    continue
+                with span(f"search_{engine}"):
+                    if engine == "duckduckgo":
+                        results = await self._search_google(query, timeout)  # 使用DuckDuckGo
+                    elif engine == "bing":
+                        results = await self._search_bing(query, timeout)
+                    elif engine == "google":
+                        results = await self._search_google(query, timeout)  # 也使用DuckDuckGo作为Google替代
+                    else:
+                        logger.warning(f"不支持的搜索引擎: {engine}")
+                        continue
                 
-                all_results.extend(results)
+                all_results.extend(self._filter_advertisements(engine, results))
                 
             except Exception as e:
                 logger.error(f"搜索引擎 {engine} 搜索失败: {e}")
@@ -100,11 +174,11 @@ class SearchAgent(BaseAgent):
         unique_results = self._deduplicate_results(all_results)
         return unique_results[:self.max_results]
     
-    async def _search_google(self, query: str) -> List[Dict[str, Any]]:
+    async def _search_google(self, query: str, timeout: float) -> List[Dict[str, Any]]:
         """使用DuckDuckGo搜索（Google替代）"""
         try:
             # 使用DuckDuckGo Instant Answer API
-            url = "https://api.duckduckgo.com/"
+            url = settings.duckduckgo_api_url
             params = {
                 "q": query,
                 "format": "json",
@@ -112,81 +186,86 @@ class SearchAgent(BaseAgent):
                 "skip_disambig": "1"
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                results = []
-                
-                # 处理即时答案
-                if data.get("Abstract"):
+            client = get_http_client("search", follow_redirects=True)
+            response = await client.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            
+            data = response.json()
+            results = []
+            
+            # 处理即时答案
+            if data.get("Abstract"):
+                results.append({
+                    "title": data.get("AbstractSource", "DuckDuckGo"),
+                    "snippet": data.get("Abstract", ""),
+                    "url": data.get("AbstractURL", ""),
+                    "engine": "duckduckgo"
+                })
+            
+            # 处理相关主题
+            for topic in data.get("RelatedTopics", [])[:3]:
+                if isinstance(topic, dict) and topic.get("Text"):
                     results.append({
-                        "title": data.get("AbstractSource", "DuckDuckGo"),
-                        "snippet": data.get("Abstract", ""),
-                        "url": data.get("AbstractURL", ""),
+                        "title": topic.get("FirstURL", "").split("/")[-1] if topic.get("FirstURL") else "相关主题",
+                        "snippet": topic.get("Text", ""),
+                        "url": topic.get("FirstURL", ""),
                         "engine": "duckduckgo"
                     })
-                
-                # 处理相关主题
-                for topic in data.get("RelatedTopics", [])[:3]:
-                    if isinstance(topic, dict) and topic.get("Text"):
-                        results.append({
-                            "title": topic.get("FirstURL", "").split("/")[-1] if topic.get("FirstURL") else "相关主题",
-                            "snippet": topic.get("Text", ""),
-                            "url": topic.get("FirstURL", ""),
-                            "engine": "duckduckgo"
-                        })
-                
-                return results
-                
+            
+            return results
+            
         except Exception as e:
             logger.error(f"DuckDuckGo搜索失败: {e}")
             return []
     
-    async def _search_bing(self, query: str) -> List[Dict[str, Any]]:
-        """使用Bing搜索（简化版）"""
+    async def _search_bing(self, query: str, timeout: float) -> List[Dict[str, Any]]:
+        """使用Bing搜索（下载结果页并解析其中的自然结果）"""
         try:
-            # 使用Bing的简化搜索API
-            url = "https://www.bing.com/search"
             params = {
                 "q": query,
-                "format": "json",
                 "cc": "CN"
             }
             
             headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+                "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8"
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params, headers=headers)
+            client = get_http_client("search", follow_redirects=True)
+            async with client.stream("GET", settings.bing_search_url, params=params, headers=headers, timeout=timeout) as response:
                 response.raise_for_status()
-                
-                # 由于Bing API限制，这里返回模拟结果
-                # 在实际使用中，可以考虑使用Bing Search API（需要API密钥）
-                results = [{
-                    "title": f"关于 {query} 的搜索结果",
-                    "snippet": f"这是关于 {query} 的搜索结果。由于API限制，这里显示的是模拟数据。",
-                    "url": f"https://www.bing.com/search?q={quote_plus(query)}",
-                    "engine": "bing"
-                }]
-                
-                return results
+                page = await self._read_page(response)
+            
+            with span("serp_parse"):
+                results = await parse_bing_async(page, max(self.max_results, BING_PAGE_RESULTS))
+            return results
                 
         except Exception as e:
             logger.error(f"Bing搜索失败: {e}")
             return []
     
+    @staticmethod
+    async def _read_page(response: httpx.Response) -> bytes:
+        """读取结果页，超过 SEARCH_MAX_PAGE_BYTES 的部分不再下载（结果位于页面前部，截断后仍可解析）"""
+        limit = settings.search_max_page_bytes
+        page = bytearray()
+        async for chunk in response.aiter_bytes():
+            page += chunk
+            if len(page) >= limit:
+                del page[limit:]
+                break
+        return bytes(page)
+    
     def _is_advertisement(self, title: str, snippet: str) -> bool:
-        """判断是否为广告"""
-        ad_indicators = [
-            "广告", "推广", "赞助", "ad", "sponsored", "promoted",
-            "购买", "优惠", "折扣", "限时", "特价"
-        ]
-        
-        text = (title + " " + snippet).lower()
-        return any(indicator in text for indicator in ad_indicators)
+        """判断是否为广告（英文指示词按整词匹配，避免 "ad" 误判 "read" 等单词）"""
+        return self.ad_matcher.search(title + "\n" + snippet) is not None
+    
+    def _filter_advertisements(self, engine: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """过滤各搜索引擎结果中的广告"""
+        kept = [r for r in results if not self._is_advertisement(r.get("title", ""), r.get("snippet", ""))]
+        if len(kept) < len(results):
+            SEARCH_RESULTS_FILTERED.labels(engine).inc(len(results) - len(kept))
+        return kept
     
     def _deduplicate_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """去重搜索结果"""
@@ -219,25 +298,30 @@ class SearchAgent(BaseAgent):
     
     async def _enhance_with_ai(self, original_message: str, search_results: List[Dict[str, Any]], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """使用AI增强搜索结果"""
-        if not search_results:
-            prompt = f"用户询问: {original_message}\n\n没有找到相关信息，请给出合适的回复。"
-        else:
-            # 构建包含搜索结果的提示
-            search_info = "\n".join([
-                f"- {result['title']}: {result['snippet']}"
-                for result in search_results
-            ])
-            
-            prompt = f"""基于以下搜索结果回答用户的问题:
-
-用户问题: {original_message}
-
-搜索结果:
-{search_info}
-
-请根据搜索结果提供准确、有用的回答。如果搜索结果不足以回答问题，请说明这一点。"""
-
-        return await self.generate_response(prompt, **self.config)
+        with span("prompt_build"):
+            prompt = self._build_search_prompt(original_message, search_results)
+            messages = self._build_search_messages(original_message, search_results)
+        return await self.generate_response(prompt, messages=messages, **self.config)
+    
+    def _render_user(self, original_message: str, search_results: List[Dict[str, Any]]) -> str:
+        return self.prompt_template.render_user(message=original_message, results=search_results)
+    
+    def _build_search_messages(self, original_message: str, search_results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """构建结构化消息（固定的回答要求作为系统消息放在最前，便于提供商缓存前缀）"""
+        return build_messages(self.system_prompt, (), self._render_user(original_message, search_results))
+    
+    def _build_search_prompt(self, original_message: str, search_results: List[Dict[str, Any]]) -> str:
+        """构建包含搜索结果的提示词"""
+        return flatten_prompt(self.system_prompt, (), self._render_user(original_message, search_results))
+    
+    def _options(self) -> Dict[str, Any]:
+        return {
+            "search_engines": self.search_engines,
+            "max_results": self.max_results,
+            "timeout": self.timeout,
+            "ad_keywords": self.ad_keywords,
+            "intent_keywords": self.intent_keywords
+        }
     
     def get_search_history(self) -> List[Dict[str, Any]]:
         """获取搜索历史（如果需要的话）"""
@@ -1,35 +1,39 @@
 """
 Agent API路由
 """
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+from typing import List, Dict, Any, Optional, AsyncIterator
 from loguru import logger
 
-from app.models.agent import AgentCreate, AgentUpdate, AgentResponse, AgentRequest
-from app.utils.database import get_db
+from app.core.config import settings
+from app.models.schemas import AgentCreate, AgentRequest, AgentChatResponse
+from app.utils.serialization import FastJSONResponse, dumps, slim_result
+from app.utils.timing import current_timings
+from app.utils.cancellation import ClientDisconnected, ClosingStreamingResponse, aclosing, run_until_disconnected
+from app.utils.deadline import (
+    DEADLINE_HEADER, DeadlineExceeded, deadline_scope, expired, request_timeout, run_with_deadline, set_deadline
+)
+from app.utils.metrics import REQUESTS_CANCELLED, DEADLINE_EXCEEDED
 from app.agents.chat_agent import ChatAgent
 from app.agents.code_agent import CodeAgent
 from app.agents.search_agent import SearchAgent
+from app.agents.document_agent import DocumentAgent
 from app.services.ai_service import AIServiceFactory
+from app.services.agent_registry import agent_registry
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
-# 内存中的Agent实例
-_agents: Dict[str, Any] = {}
+# 客户端在响应返回前断开（沿用nginx的约定，仅用于访问日志）
+CLIENT_CLOSED_REQUEST = 499
 
 
 @router.get("/", response_model=List[Dict[str, Any]])
 async def list_agents():
     """获取所有Agent列表"""
     try:
-        agents_info = []
-        for agent_id, agent in _agents.items():
-            agents_info.append({
-                "id": agent_id,
-                **agent.get_info()
-            })
-        return agents_info
+        return agent_registry.list_agents()
     except Exception as e:
         logger.error(f"获取Agent列表失败: {e}")
         raise HTTPException(status_code=500, detail="获取Agent列表失败")
@@ -39,14 +43,13 @@ async def list_agents():
 async def create_chat_agent(agent_data: AgentCreate):
     """创建聊天Agent"""
     try:
-        agent_id = f"chat_{len(_agents) + 1}"
         agent = ChatAgent(
             name=agent_data.name,
             provider=agent_data.provider or "ollama",
             config=agent_data.config or {},
             model_name=agent_data.model_name
         )
-        _agents[agent_id] = agent
+        agent_id = await agent_registry.add(agent)
         
         logger.info(f"创建聊天Agent: {agent_id}")
         return {
@@ -62,7 +65,6 @@ async def create_chat_agent(agent_data: AgentCreate):
 async def create_code_agent(agent_data: AgentCreate):
     """创建代码生成Agent"""
     try:
-        agent_id = f"code_{len(_agents) + 1}"
         agent = CodeAgent(
             name=agent_data.name,
             provider=agent_data.provider or "ollama",
@@ -71,7 +73,7 @@ async def create_code_agent(agent_data: AgentCreate):
             language=agent_data.config.get("language", "python") if agent_data.config else "python",
             framework=agent_data.config.get("framework", "") if agent_data.config else ""
         )
-        _agents[agent_id] = agent
+        agent_id = await agent_registry.add(agent)
         
         logger.info(f"创建代码生成Agent: {agent_id}")
         return {
@@ -87,7 +89,6 @@ async def create_code_agent(agent_data: AgentCreate):
 async def create_search_agent(agent_data: AgentCreate):
     """创建搜索引擎Agent"""
     try:
-        agent_id = f"search_{len(_agents) + 1}"
         agent = SearchAgent(
             name=agent_data.name,
             provider=agent_data.provider or "ollama",
@@ -95,9 +96,11 @@ async def create_search_agent(agent_data: AgentCreate):
             model_name=agent_data.model_name,
             search_engines=agent_data.config.get("search_engines", ["duckduckgo"]) if agent_data.config else ["duckduckgo"],
             max_results=agent_data.config.get("max_results", 1) if agent_data.config else 1,
-            timeout=agent_data.config.get("timeout", 10.0) if agent_data.config else 10.0
+            timeout=agent_data.config.get("timeout", 10.0) if agent_data.config else 10.0,
+            ad_keywords=agent_data.config.get("ad_keywords", []) if agent_data.config else [],
+            intent_keywords=agent_data.config.get("intent_keywords", []) if agent_data.config else []
         )
-        _agents[agent_id] = agent
+        agent_id = await agent_registry.add(agent)
         
         logger.info(f"创建搜索引擎Agent: {agent_id}")
         return {
@@ -109,32 +112,131 @@ async def create_search_agent(agent_data: AgentCreate):
         raise HTTPException(status_code=500, detail="创建搜索引擎Agent失败")
 
 
-@router.post("/{agent_id}/chat", response_model=Dict[str, Any])
-async def chat_with_agent(agent_id: str, request: AgentRequest):
-    """与Agent聊天"""
+@router.post("/document", response_model=Dict[str, Any])
+async def create_document_agent(agent_data: AgentCreate):
+    """创建文档问答Agent"""
     try:
-        if agent_id not in _agents:
+        agent = DocumentAgent(
+            name=agent_data.name,
+            provider=agent_data.provider or "ollama",
+            config=agent_data.config or {},
+            model_name=agent_data.model_name,
+            collection=agent_data.config.get("collection", "default") if agent_data.config else "default",
+            top_k=agent_data.config.get("top_k", settings.document_top_k) if agent_data.config else settings.document_top_k
+        )
+        agent_id = await agent_registry.add(agent)
+        
+        logger.info(f"创建文档问答Agent: {agent_id}")
+        return {
+            "agent_id": agent_id,
+            **agent.get_info()
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"创建文档问答Agent失败: {e}")
+        raise HTTPException(status_code=500, detail="创建文档问答Agent失败")
+
+
+@router.post("/{agent_id}/chat", response_model=AgentChatResponse)
+async def chat_with_agent(
+    agent_id: str,
+    request: AgentRequest,
+    http_request: Request,
+    verbose: bool = Query(False, description="是否返回原始提供商数据和完整搜索结果"),
+    timings: bool = Query(False, description="是否在metadata中返回各阶段耗时")
+):
+    """与Agent聊天
+    
+    stream 为 true 时以 Server-Sent Events 返回 delta/done 事件。
+    客户端断开后立即取消生成，不再等待上游模型输出完毕。
+    通过 X-Request-Timeout 请求头或 timeout 字段设置预算（秒），超过后返回504。
+    """
+    try:
+        timeout = request_timeout(http_request.headers.get(DEADLINE_HEADER), request.timeout)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的 {DEADLINE_HEADER} 请求头")
+    
+    if request.stream:
+        if agent_id not in agent_registry:
             raise HTTPException(status_code=404, detail="Agent不存在")
+        # 响应体在路由函数返回后生成，截止时间需要保留到那时
+        set_deadline(timeout)
+        return ClosingStreamingResponse(
+            _stream_chat(agent_id, request, verbose, timings),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        async with agent_registry.use(agent_id) as agent:
+            if agent is None:
+                raise HTTPException(status_code=404, detail="Agent不存在")
+            with deadline_scope(timeout):
+                result = await run_until_disconnected(
+                    http_request, run_with_deadline(agent.process_message(request.message, request.context))
+                )
         
-        agent = _agents[agent_id]
-        result = await agent.process_message(request.message, request.context)
+        if timings:
+            result.setdefault("metadata", {})["timings"] = current_timings()
         
-        return result
+        # 直接返回响应对象，跳过通用的response_model校验
+        return FastJSONResponse(slim_result(result, verbose), route="agent_chat")
     except HTTPException:
         raise
+    except ClientDisconnected:
+        REQUESTS_CANCELLED.labels("agent_chat").inc()
+        logger.info(f"客户端已断开，取消Agent {agent_id} 的生成")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except DeadlineExceeded:
+        DEADLINE_EXCEEDED.labels("agent_chat").inc()
+        logger.warning(f"Agent {agent_id} 的请求超过截止时间（预算 {timeout}秒）")
+        raise HTTPException(status_code=504, detail="请求超过截止时间")
     except Exception as e:
         logger.error(f"与Agent聊天失败: {e}")
         raise HTTPException(status_code=500, detail="与Agent聊天失败")
 
 
+def _sse(event: Dict[str, Any]) -> bytes:
+    return b"data: " + dumps(event) + b"\n\n"
+
+
+async def _stream_chat(agent_id: str, request: AgentRequest, verbose: bool, timings: bool) -> AsyncIterator[bytes]:
+    """流式聊天的SSE事件（期间占用Agent，不会被换出）"""
+    try:
+        async with agent_registry.use(agent_id) as agent:
+            if agent is None:
+                yield _sse({"type": "error", "detail": "Agent不存在"})
+                return
+            async with aclosing(agent.stream_message(request.message, request.context)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        result = slim_result(event["result"], verbose)
+                        if timings:
+                            result.setdefault("metadata", {})["timings"] = current_timings()
+                        event = {"type": "done", "result": result}
+                    yield _sse(event)
+    except (asyncio.CancelledError, GeneratorExit):
+        REQUESTS_CANCELLED.labels("agent_chat_stream").inc()
+        logger.info(f"客户端已断开，取消Agent {agent_id} 的流式生成")
+        raise
+    except Exception as e:
+        if isinstance(e, DeadlineExceeded) or expired():
+            DEADLINE_EXCEEDED.labels("agent_chat_stream").inc()
+            logger.warning(f"Agent {agent_id} 的流式请求超过截止时间")
+            yield _sse({"type": "error", "code": "deadline_exceeded", "detail": "请求超过截止时间"})
+            return
+        logger.error(f"与Agent流式聊天失败: {e}")
+        yield _sse({"type": "error", "detail": "与Agent聊天失败"})
+
+
 @router.delete("/{agent_id}")
 async def delete_agent(agent_id: str):
     """删除Agent"""
     try:
-        if agent_id not in _agents:
+        if not await agent_registry.delete(agent_id):
             raise HTTPException(status_code=404, detail="Agent不存在")
         
-        del _agents[agent_id]
         logger.info(f"删除Agent: {agent_id}")
         
         return {"message": "Agent删除成功"}
@@ -146,15 +248,15 @@ async def delete_agent(agent_id: str):
 
 
 @router.get("/{agent_id}/history")
-async def get_agent_history(agent_id: str):
+async def get_agent_history(agent_id: str, session_id: Optional[str] = Query(None, description="会话ID，默认会话为空")):
     """获取Agent对话历史"""
     try:
-        if agent_id not in _agents:
+        agent = await agent_registry.get(agent_id)
+        if agent is None:
             raise HTTPException(status_code=404, detail="Agent不存在")
         
-        agent = _agents[agent_id]
         if hasattr(agent, 'get_history'):
-            history = agent.get_history()
+            history = agent.get_history(session_id)
             return {"history": history}
         else:
             return {"history": []}
@@ -166,15 +268,15 @@ async def get_agent_history(agent_id: str):
 
 
 @router.delete("/{agent_id}/history")
-async def clear_agent_history(agent_id: str):
+async def clear_agent_history(agent_id: str, session_id: Optional[str] = Query(None, description="会话ID，为空时清空所有会话")):
     """清空Agent对话历史"""
     try:
-        if agent_id not in _agents:
+        agent = await agent_registry.get(agent_id)
+        if agent is None:
             raise HTTPException(status_code=404, detail="Agent不存在")
         
-        agent = _agents[agent_id]
         if hasattr(agent, 'clear_history'):
-            agent.clear_history()
+            agent.clear_history(session_id)
             return {"message": "对话历史已清空"}
         else:
             return {"message": "该Agent不支持历史记录"}
@@ -185,6 +287,12 @@ async def clear_agent_history(agent_id: str):
         raise HTTPException(status_code=500, detail="清空Agent历史失败")
 
 
+@router.get("/registry")
+async def get_registry_stats():
+    """获取Agent注册表统计（内存中/已换出的Agent数量、换出与恢复次数）"""
+    return agent_registry.get_stats()
+
+
 @router.get("/providers")
 async def get_available_providers():
     """获取可用的AI提供商"""
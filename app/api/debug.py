@@ -0,0 +1,45 @@
+"""
+调试API路由（仅管理员）
+"""
+import secrets
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import PlainTextResponse
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.profiler import profile, ProfilerBusyError
+from app.utils.serialization import FastJSONResponse
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def require_admin(token: Optional[str]):
+    """校验管理员令牌，未配置令牌时调试接口不可用"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="调试接口未启用")
+    if not token or not secrets.compare_digest(token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="无权访问")
+
+
+@router.get("/profile")
+async def profile_process(
+    seconds: float = Query(10.0, gt=0, le=120, description="采样时长（秒）"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="采样间隔（毫秒）"),
+    include_idle: bool = Query(False, description="是否包含空闲等待的线程栈"),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$", description="collapsed 或 json"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """对当前进程进行采样分析，返回折叠栈（可直接生成火焰图）"""
+    require_admin(x_admin_token)
+
+    logger.info(f"开始性能采样: {seconds}秒，间隔 {interval_ms}毫秒")
+    try:
+        sampler = await profile(seconds, interval=interval_ms / 1000.0, include_idle=include_idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"性能采样完成: {sampler.samples} 次采样，{len(sampler.stacks)} 个不同调用栈")
+
+    if format == "json":
+        return FastJSONResponse(sampler.summary(), route="debug_profile")
+    return PlainTextResponse(sampler.collapsed())
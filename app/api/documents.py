@@ -0,0 +1,116 @@
+"""
+文档API路由
+
+上传的文档保存到 upload_dir/<集合>/ 下并建立向量索引，供文档问答Agent检索。
+"""
+import os
+import uuid
+import asyncio
+from pathlib import Path
+from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Request
+from loguru import logger
+
+from app.core.config import settings
+from app.services.document_store import DocumentStore, get_document_store
+
+router = APIRouter(prefix="/documents", tags=["documents"])
+
+# 支持的文本文档类型
+TEXT_SUFFIXES = {".txt", ".md", ".markdown", ".rst", ".csv", ".log", ".json"}
+
+# 上传内容攒够该字节数后写入一次磁盘
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+
+def _get_store(collection: str) -> DocumentStore:
+    try:
+        return get_document_store(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _document_name(filename: str) -> str:
+    """校验文件名（不允许包含路径）"""
+    name = Path(filename).name
+    if not name or name != filename or name.startswith("."):
+        raise HTTPException(status_code=400, detail="无效的文件名")
+    if Path(name).suffix.lower() not in TEXT_SUFFIXES:
+        raise HTTPException(status_code=415, detail=f"仅支持文本文档: {', '.join(sorted(TEXT_SUFFIXES))}")
+    return name
+
+
+async def _save_stream(request: Request, path: Path) -> int:
+    """将请求体分块写入文件，超过大小上限时中止并删除已写入的部分"""
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    await asyncio.to_thread(tmp_path.parent.mkdir, parents=True, exist_ok=True)
+    file = await asyncio.to_thread(open, tmp_path, "wb")
+    size = 0
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.max_file_size:
+                raise HTTPException(status_code=413, detail=f"文件超过大小上限（{settings.max_file_size}字节）")
+            buffer += chunk
+            if len(buffer) >= UPLOAD_BUFFER_SIZE:
+                await asyncio.to_thread(file.write, buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(file.write, buffer)
+    except BaseException:
+        await asyncio.to_thread(file.close)
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        raise
+    await asyncio.to_thread(file.close)
+    await asyncio.to_thread(os.replace, tmp_path, path)
+    return size
+
+
+def _read_text(path: Path) -> str:
+    return path.read_bytes().decode("utf-8", errors="replace")
+
+
+@router.put("/{collection}/{filename}")
+async def upload_document(collection: str, filename: str, request: Request) -> Dict[str, Any]:
+    """流式上传文档（请求体为文件原始内容）并建立索引，同名文档重新上传时只为变化的部分生成向量"""
+    store = _get_store(collection)
+    name = _document_name(filename)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.max_file_size:
+        raise HTTPException(status_code=413, detail=f"文件超过大小上限（{settings.max_file_size}字节）")
+
+    path = Path(settings.upload_dir) / collection / name
+    size = await _save_stream(request, path)
+    text = await asyncio.to_thread(_read_text, path)
+
+    try:
+        result = await store.index_document(name, text)
+    except Exception as e:
+        logger.error(f"文档索引失败 {collection}/{name}: {e}")
+        raise HTTPException(status_code=500, detail="文档索引失败")
+    return {"collection": collection, "size": size, **result}
+
+
+@router.get("/{collection}")
+async def get_collection(collection: str) -> Dict[str, Any]:
+    """获取集合中的文档和索引信息"""
+    store = _get_store(collection)
+    return await asyncio.to_thread(store.get_stats)
+
+
+@router.delete("/{collection}/{filename}")
+async def delete_document(collection: str, filename: str) -> Dict[str, Any]:
+    """删除文档及其索引"""
+    store = _get_store(collection)
+    name = _document_name(filename)
+    try:
+        removed = await store.remove_document(name)
+    except Exception as e:
+        logger.error(f"删除文档索引失败 {collection}/{name}: {e}")
+        raise HTTPException(status_code=500, detail="删除文档失败")
+    if not removed:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    await asyncio.to_thread((Path(settings.upload_dir) / collection / name).unlink, missing_ok=True)
+    return {"message": "文档删除成功"}
@@ -7,6 +7,12 @@ from datetime import datetime
 from loguru import logger
 from app.core.config import settings
 from app.services.ai_service import AIServiceFactory
+from app.utils.startup import get_startup_report
+from app.utils.loop_monitor import loop_monitor
+from app.utils.serialization import FastJSONResponse
+from app.services.health_service import health_monitor
+from app.services.ollama_residency import residency_manager
+from app.services.ollama_pool import ollama_pool
 
 router = APIRouter(prefix="/health", tags=["health"])
 
@@ -34,41 +40,60 @@ async def health_check() -> Dict[str, Any]:
         }
 
 
+@router.get("/startup")
+async def startup_report() -> Dict[str, Any]:
+    """启动耗时报告"""
+    return get_startup_report()
+
+
+@router.get("/loop")
+async def loop_report() -> Dict[str, Any]:
+    """事件循环延迟统计"""
+    return loop_monitor.get_stats()
+
+
+@router.get("/live")
+async def liveness() -> Dict[str, Any]:
+    """存活检查（不访问任何外部依赖）"""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness():
+    """就绪检查：应用启动完成即就绪，AI服务状态仅作参考"""
+    ready = get_startup_report()["ready"]
+    snapshot = health_monitor.peek()
+    ai_status = snapshot["overall_status"] if snapshot else None
+    if settings.health_ready_requires_ai and ai_status != "healthy":
+        ready = False
+    return FastJSONResponse(
+        {"status": "ready" if ready else "not_ready", "ai_status": ai_status},
+        status_code=200 if ready else 503,
+        route="health_ready"
+    )
+
+
+@router.get("/models")
+async def model_residency() -> Dict[str, Any]:
+    """Ollama模型驻留状态及最近的加载/卸载事件"""
+    return residency_manager.get_stats()
+
+
+@router.get("/ollama")
+async def ollama_nodes() -> Dict[str, Any]:
+    """Ollama节点池状态（负载、错误数、摘除状态）"""
+    return ollama_pool.get_stats()
+
+
 @router.get("/ai")
 async def ai_health_check() -> Dict[str, Any]:
-    """AI服务健康检查"""
+    """AI服务健康检查（返回后台定时刷新的快照）"""
     try:
-        results = {}
-        providers = AIServiceFactory.get_available_providers()
-        
-        for provider in providers:
-            try:
-                service = AIServiceFactory.get_service(provider)
-                # 简单的连接测试
-                if provider == "ollama":
-                    import httpx
-                    async with httpx.AsyncClient() as client:
-                        response = await client.get(f"{settings.ollama_base_url}/api/tags")
-                        results[provider] = {
-                            "status": "healthy",
-                            "models": response.json().get("models", [])
-                        }
-                else:
-                    results[provider] = {"status": "available"}
-            except Exception as e:
-                results[provider] = {
-                    "status": "unhealthy",
-                    "error": str(e)
-                }
-        
-        return {
-            "ai_services": results,
-            "overall_status": "healthy" if all(r.get("status") == "healthy" for r in results.values()) else "degraded"
-        }
+        return await health_monitor.get_snapshot()
     except Exception as e:
         logger.error(f"AI健康检查失败: {e}")
         return {
             "ai_services": {},
             "overall_status": "unhealthy",
             "error": str(e)
-        } 
\ No newline at end of file
+        }
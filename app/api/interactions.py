@@ -0,0 +1,32 @@
+"""
+交互记录API路由
+"""
+from fastapi import APIRouter, Header, HTTPException
+from typing import Dict, Any, Optional
+from loguru import logger
+
+from app.models.schemas import InteractionExportRequest
+from app.services.interaction_recorder import interaction_recorder
+from app.api.debug import require_admin
+
+router = APIRouter(prefix="/interactions", tags=["interactions"])
+
+
+@router.get("/stats")
+async def get_interaction_stats(x_admin_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """获取交互记录器统计信息（需要管理员令牌）"""
+    require_admin(x_admin_token)
+    return interaction_recorder.get_stats()
+
+
+@router.post("/export")
+async def export_interactions(request: InteractionExportRequest, x_admin_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """导出时间范围内的交互记录（gzip压缩的JSONL，需要管理员令牌）"""
+    require_admin(x_admin_token)
+    if request.end <= request.start:
+        raise HTTPException(status_code=400, detail="结束时间必须晚于开始时间")
+    try:
+        return await interaction_recorder.export_jsonl(request.start, request.end)
+    except Exception as e:
+        logger.error(f"导出交互记录失败: {e}")
+        raise HTTPException(status_code=500, detail="导出交互记录失败")
@@ -0,0 +1,190 @@
+"""
+WebSocket API路由
+
+单个连接上通过消息ID复用多个Agent会话，并以流式帧返回部分输出。
+
+客户端消息:
+    {"id": "m1", "type": "chat", "agent_id": "chat_1", "message": "...", "context": {...}, "verbose": false, "timeout": 30}
+    {"id": "m1", "type": "cancel"}
+    {"type": "ping"}
+
+服务端消息:
+    {"id": "m1", "type": "delta", "content": "..."}
+    {"id": "m1", "type": "done", "result": {...}}
+    {"id": "m1", "type": "error", "detail": "..."}
+    {"id": "m1", "type": "error", "code": "deadline_exceeded", "detail": "..."}
+    {"id": "m1", "type": "cancelled"}
+    {"type": "pong"}
+
+流控: 每个连接的待发送帧队列有上限，队列满时生成任务会暂停等待，
+慢速读取方不会导致服务端无限缓存输出；单帧发送超时的连接会被关闭。
+"""
+import asyncio
+import json
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from loguru import logger
+
+from app.core.config import settings
+from app.services.agent_registry import agent_registry
+from app.utils.serialization import dumps, slim_result
+from app.utils.cancellation import aclosing
+from app.utils.deadline import DeadlineExceeded, deadline_scope, expired, request_timeout
+from app.utils.metrics import REQUESTS_CANCELLED, DEADLINE_EXCEEDED
+
+router = APIRouter(prefix="/ws", tags=["websocket"])
+
+
+class MultiplexConnection:
+    """单个WebSocket连接上的多路复用会话"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.send_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.closed = False
+
+    async def run(self):
+        """运行连接的读写循环，任一方向结束即关闭连接"""
+        reader = asyncio.create_task(self._reader())
+        writer = asyncio.create_task(self._writer())
+        try:
+            await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.closed = True
+            tasks = [reader, writer, *self.inflight.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _reader(self):
+        """读取客户端消息并分发"""
+        while True:
+            try:
+                raw = await self.websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                await self.send({"type": "error", "detail": "无效的JSON消息"})
+                continue
+            if not isinstance(frame, dict):
+                await self.send({"type": "error", "detail": "消息必须是JSON对象"})
+                continue
+
+            await self._dispatch(frame)
+
+    async def _dispatch(self, frame: Dict[str, Any]):
+        """分发单条客户端消息"""
+        frame_type = frame.get("type", "chat")
+        message_id = frame.get("id")
+
+        if frame_type == "ping":
+            await self.send({"type": "pong"})
+            return
+
+        if not message_id:
+            await self.send({"type": "error", "detail": "缺少消息ID"})
+            return
+        message_id = str(message_id)
+
+        if frame_type == "cancel":
+            task = self.inflight.get(message_id)
+            if task:
+                task.cancel()
+            return
+
+        if frame_type != "chat":
+            await self.send({"id": message_id, "type": "error", "detail": f"不支持的消息类型: {frame_type}"})
+            return
+
+        if message_id in self.inflight:
+            await self.send({"id": message_id, "type": "error", "detail": "消息ID正在处理中"})
+            return
+
+        if len(self.inflight) >= settings.ws_max_inflight:
+            await self.send({"id": message_id, "type": "error", "detail": "并发会话数已达上限"})
+            return
+
+        agent_id = frame.get("agent_id")
+        if agent_id not in agent_registry:
+            await self.send({"id": message_id, "type": "error", "detail": "Agent不存在"})
+            return
+
+        message = frame.get("message")
+        if not isinstance(message, str):
+            await self.send({"id": message_id, "type": "error", "detail": "缺少message字段"})
+            return
+
+        timeout = frame.get("timeout")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            await self.send({"id": message_id, "type": "error", "detail": "timeout必须为正数"})
+            return
+        timeout = request_timeout(field=timeout)
+
+        task = asyncio.create_task(
+            self._converse(message_id, agent_id, message, frame.get("context"), bool(frame.get("verbose")), timeout)
+        )
+        self.inflight[message_id] = task
+        task.add_done_callback(lambda _: self.inflight.pop(message_id, None))
+
+    async def _converse(self, message_id: str, agent_id: str, message: str, context: Optional[Dict[str, Any]],
+                        verbose: bool, timeout: Optional[float] = None):
+        """执行单个会话并流式发送输出（期间占用Agent，不会被换出）"""
+        with deadline_scope(timeout):
+            try:
+                async with agent_registry.use(agent_id) as agent:
+                    if agent is None:
+                        await self.send({"id": message_id, "type": "error", "detail": "Agent不存在"})
+                        return
+                    async with aclosing(agent.stream_message(message, context)) as events:
+                        async for event in events:
+                            if event["type"] == "done":
+                                event = {"type": "done", "result": slim_result(event["result"], verbose)}
+                            # 队列满时在此等待，从而向上游生成施加背压
+                            await self.send({"id": message_id, **event})
+            except asyncio.CancelledError:
+                REQUESTS_CANCELLED.labels("websocket").inc()
+                if not self.closed:
+                    await self.send({"id": message_id, "type": "cancelled"})
+                raise
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded) or expired():
+                    DEADLINE_EXCEEDED.labels("websocket").inc()
+                    await self.send({"id": message_id, "type": "error", "code": "deadline_exceeded", "detail": "请求超过截止时间"})
+                    return
+                logger.error(f"WebSocket会话 {message_id} 处理失败: {e}")
+                await self.send({"id": message_id, "type": "error", "detail": "与Agent聊天失败"})
+
+    async def send(self, frame: Dict[str, Any]):
+        """将帧放入发送队列（队列满时等待）"""
+        await self.send_queue.put(frame)
+
+    async def _writer(self):
+        """从发送队列取出帧并写入连接"""
+        while True:
+            frame = await self.send_queue.get()
+            try:
+                await asyncio.wait_for(
+                    self.websocket.send_text(dumps(frame).decode("utf-8")),
+                    timeout=settings.ws_send_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("WebSocket客户端读取过慢，关闭连接")
+                return
+            except Exception:
+                return
+
+
+@router.websocket("/agents")
+async def agents_websocket(websocket: WebSocket):
+    """多路复用的Agent会话WebSocket"""
+    await websocket.accept()
+    logger.info("WebSocket连接已建立")
+
+    connection = MultiplexConnection(websocket)
+    await connection.run()
+
+    logger.info("WebSocket连接已关闭")
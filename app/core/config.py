@@ -23,10 +23,18 @@ class Settings(BaseSettings):
     
     # 数据库配置
     database_url: str = Field(default="sqlite:///./data/ai_agent_demo.db", env="DATABASE_URL")
+    db_pool_size: int = Field(default=10, env="DB_POOL_SIZE")  # 非SQLite数据库连接池大小
+    db_max_overflow: int = Field(default=20, env="DB_MAX_OVERFLOW")
+    db_pool_timeout: float = Field(default=30.0, env="DB_POOL_TIMEOUT")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")
     
     # 日志配置
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     log_file: str = Field(default="./logs/app.log", env="LOG_FILE")
+    log_enqueue: bool = Field(default=True, env="LOG_ENQUEUE")  # 日志写入在后台线程执行
+    log_queue_size: int = Field(default=10000, env="LOG_QUEUE_SIZE")  # 后台日志队列上限，满时丢弃
+    log_json: bool = Field(default=False, env="LOG_JSON")  # 文件日志输出结构化JSON
+    log_sample_rates: str = Field(default="", env="LOG_SAMPLE_RATES")  # 按级别采样，如 "DEBUG=0.01,INFO=0.1"
     
     # AI服务配置
     
@@ -41,6 +49,31 @@ class Settings(BaseSettings):
     # Ollama配置
     ollama_base_url: str = Field(default="http://localhost:11434", env="OLLAMA_BASE_URL")
     ollama_model: str = Field(default="deepseek-r1:8b", env="OLLAMA_MODEL")
+    ollama_nodes: str = Field(default="", env="OLLAMA_NODES")  # 多节点，如 "http://gpu1:11434=2,http://gpu2:11434"（=后为权重），为空时只用OLLAMA_BASE_URL
+    ollama_affinity_load_factor: float = Field(default=1.5, env="OLLAMA_AFFINITY_LOAD_FACTOR")  # 亲和节点负载超过平均值的倍数时顺延到下一节点
+    ollama_eject_failures: int = Field(default=3, env="OLLAMA_EJECT_FAILURES")  # 连续失败多少次后摘除节点
+    ollama_eject_seconds: float = Field(default=30.0, env="OLLAMA_EJECT_SECONDS")  # 首次摘除时长（秒），再次摘除时加倍
+    ollama_eject_max_seconds: float = Field(default=300.0, env="OLLAMA_EJECT_MAX_SECONDS")  # 摘除时长上限（秒）
+    ollama_residency_enabled: bool = Field(default=True, env="OLLAMA_RESIDENCY_ENABLED")  # 跟踪已加载模型并设置keep_alive
+    ollama_residency_refresh_interval: float = Field(default=10.0, env="OLLAMA_RESIDENCY_REFRESH_INTERVAL")  # 查询 /api/ps 的间隔（秒）
+    ollama_keep_alive: str = Field(default="5m", env="OLLAMA_KEEP_ALIVE")  # 默认keep_alive
+    ollama_model_keep_alive: str = Field(default="", env="OLLAMA_MODEL_KEEP_ALIVE")  # 按模型设置，如 "qwen2.5:7b=30m,llama3:8b=1h"
+    ollama_pinned_models: str = Field(default="", env="OLLAMA_PINNED_MODELS")  # 常驻模型（逗号分隔），启动时预热且不卸载
+    ollama_flexible_models: str = Field(default="", env="OLLAMA_FLEXIBLE_MODELS")  # 未指定模型的请求可用的候选模型，默认仅OLLAMA_MODEL
+    ollama_prewarm_timeout: float = Field(default=120.0, env="OLLAMA_PREWARM_TIMEOUT")  # 预热单个模型的超时（秒）
+    
+    # 录制/回放提供商（性能测试用）
+    replay_enabled: bool = Field(default=False, env="REPLAY_ENABLED")
+    replay_mode: str = Field(default="replay", env="REPLAY_MODE")  # record 或 replay
+    replay_file: str = Field(default="./data/replay/recordings.jsonl", env="REPLAY_FILE")
+    replay_inner_provider: str = Field(default="ollama", env="REPLAY_INNER_PROVIDER")  # 录制时包装的真实提供商
+    replay_speed: str = Field(default="fast", env="REPLAY_SPEED")  # recorded 按录制速度回放，fast 尽快返回
+    
+    # 搜索引擎配置
+    duckduckgo_api_url: str = Field(default="https://api.duckduckgo.com/", env="DUCKDUCKGO_API_URL")
+    bing_search_url: str = Field(default="https://www.bing.com/search", env="BING_SEARCH_URL")
+    search_max_page_bytes: int = Field(default=2 * 1024 * 1024, env="SEARCH_MAX_PAGE_BYTES")  # 结果页最多下载的字节数，超出部分丢弃
+    search_parse_workers: int = Field(default=2, env="SEARCH_PARSE_WORKERS")  # 结果页解析线程数
     
     # OpenAI API (可选)
     openai_api_key: Optional[str] = Field(default=None, env="OPENAI_API_KEY")
@@ -53,22 +86,71 @@ class Settings(BaseSettings):
     secret_key: str = Field(default="your_secret_key_here_change_in_production", env="SECRET_KEY")
     algorithm: str = Field(default="HS256", env="ALGORITHM")
     access_token_expire_minutes: int = Field(default=30, env="ACCESS_TOKEN_EXPIRE_MINUTES")
+    admin_token: Optional[str] = Field(default=None, env="ADMIN_TOKEN")  # 调试与交互记录接口的令牌，未配置时这些接口关闭
     
     # 监控配置
     enable_metrics: bool = Field(default=True, env="ENABLE_METRICS")
+    server_timing_enabled: bool = Field(default=True, env="SERVER_TIMING_ENABLED")  # 返回Server-Timing响应头
     metrics_port: int = Field(default=9090, env="METRICS_PORT")
+    health_refresh_interval: float = Field(default=15.0, env="HEALTH_REFRESH_INTERVAL")  # AI健康检查刷新间隔（秒）
+    health_probe_timeout: float = Field(default=2.0, env="HEALTH_PROBE_TIMEOUT")  # 单个提供商探测超时（秒）
+    health_ready_requires_ai: bool = Field(default=False, env="HEALTH_READY_REQUIRES_AI")  # 就绪检查是否要求AI服务全部健康
+    http_max_connections: int = Field(default=100, env="HTTP_MAX_CONNECTIONS")  # 共享HTTP客户端连接池上限
+    http_max_keepalive_connections: int = Field(default=20, env="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    loop_monitor_enabled: bool = Field(default=True, env="LOOP_MONITOR_ENABLED")  # 事件循环延迟监控
+    loop_monitor_interval: float = Field(default=0.1, env="LOOP_MONITOR_INTERVAL")  # 延迟采样间隔（秒）
+    loop_stall_threshold: float = Field(default=0.5, env="LOOP_STALL_THRESHOLD")  # 超过该时长记录阻塞调用栈（秒）
+    loop_debug: bool = Field(default=False, env="LOOP_DEBUG")  # asyncio调试模式，报告慢回调位置
     
     # 缓存配置
     redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
     
+    # 提示词模板
+    prompt_template_dir: Optional[str] = Field(default=None, env="PROMPT_TEMPLATE_DIR")  # 自定义模板目录，同名模板覆盖内置模板
+    
     # 文件存储
     upload_dir: str = Field(default="./data/uploads", env="UPLOAD_DIR")
     max_file_size: int = Field(default=10485760, env="MAX_FILE_SIZE")  # 10MB
     
+    # 文档问答配置
+    document_store_dir: str = Field(default="./data/documents", env="DOCUMENT_STORE_DIR")  # 文本块与向量矩阵目录
+    ollama_embed_model: str = Field(default="nomic-embed-text", env="OLLAMA_EMBED_MODEL")  # 文本向量模型
+    document_chunk_size: int = Field(default=800, env="DOCUMENT_CHUNK_SIZE")  # 单个文本块的最大字符数
+    document_embed_batch_size: int = Field(default=32, env="DOCUMENT_EMBED_BATCH_SIZE")  # 每次请求向量化的文本块数
+    document_top_k: int = Field(default=4, env="DOCUMENT_TOP_K")  # 检索返回的文本块数
+    document_compact_ratio: float = Field(default=0.5, env="DOCUMENT_COMPACT_RATIO")  # 墓碑占全部文本块的比例达到该值时压缩文件
+    
     # 限流配置
     rate_limit_per_minute: int = Field(default=60, env="RATE_LIMIT_PER_MINUTE")
     rate_limit_per_hour: int = Field(default=1000, env="RATE_LIMIT_PER_HOUR")
     
+    # 交互记录配置
+    interaction_log_enabled: bool = Field(default=True, env="INTERACTION_LOG_ENABLED")
+    interaction_buffer_size: int = Field(default=10000, env="INTERACTION_BUFFER_SIZE")  # 内存缓冲上限，超出丢弃
+    interaction_batch_size: int = Field(default=200, env="INTERACTION_BATCH_SIZE")  # 达到条数立即写入
+    interaction_flush_interval: float = Field(default=2.0, env="INTERACTION_FLUSH_INTERVAL")  # 定时写入间隔（秒）
+    interaction_export_dir: str = Field(default="./data/exports", env="INTERACTION_EXPORT_DIR")
+    
+    # WebSocket配置
+    ws_max_inflight: int = Field(default=16, env="WS_MAX_INFLIGHT")  # 单连接最大并发会话数
+    ws_send_queue_size: int = Field(default=64, env="WS_SEND_QUEUE_SIZE")  # 单连接待发送帧上限
+    ws_send_timeout: float = Field(default=10.0, env="WS_SEND_TIMEOUT")  # 单帧发送超时（秒）
+    
+    # Agent注册表配置
+    agent_max_resident: int = Field(default=500, env="AGENT_MAX_RESIDENT")  # 内存中保留的Agent数量上限
+    agent_max_memory_mb: float = Field(default=256.0, env="AGENT_MAX_MEMORY_MB")  # 内存中Agent状态的估算大小上限（MB）
+    agent_idle_ttl: float = Field(default=1800.0, env="AGENT_IDLE_TTL")  # 空闲超过该时长换出到磁盘（秒）
+    agent_spill_ttl: float = Field(default=604800.0, env="AGENT_SPILL_TTL")  # 换出后超过该时长未使用则删除（秒）
+    agent_sweep_interval: float = Field(default=30.0, env="AGENT_SWEEP_INTERVAL")  # 后台检查间隔（秒）
+    agent_spill_dir: str = Field(default="./data/agents", env="AGENT_SPILL_DIR")  # 换出的Agent状态目录
+    
+    # 聊天配置
+    chat_coalesce_window: float = Field(default=0.0, env="CHAT_COALESCE_WINDOW")  # 同一会话连续消息的合并窗口（秒），0为不合并
+    
+    # 请求截止时间配置
+    request_timeout: float = Field(default=0.0, env="REQUEST_TIMEOUT")  # 未指定预算的请求使用的预算（秒），0为不限制
+    deadline_llm_reserve: float = Field(default=5.0, env="DEADLINE_LLM_RESERVE")  # 搜索阶段为LLM调用保留的预算（秒）
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
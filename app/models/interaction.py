@@ -0,0 +1,24 @@
+"""
+Agent交互记录数据模型
+"""
+from sqlalchemy import Column, String, Text, Integer, Float, Index
+
+from .base import BaseModel as DBBaseModel
+
+
+class Interaction(DBBaseModel):
+    """Agent交互记录（用于分析和微调）"""
+    __tablename__ = "interactions"
+    __table_args__ = (
+        Index("ix_interactions_created_at", "created_at"),
+    )
+    
+    request_id = Column(String(64), nullable=True)
+    agent_name = Column(String(100), nullable=False)
+    agent_type = Column(String(50), nullable=False)
+    provider = Column(String(50), nullable=True)
+    model_used = Column(String(100), nullable=True)
+    prompt = Column(Text, nullable=False)
+    response = Column(Text, nullable=True)
+    tokens_used = Column(Integer, nullable=True)
+    latency = Column(Float, nullable=True)  # 秒
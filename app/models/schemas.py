@@ -0,0 +1,95 @@
+"""
+Agent接口数据模型（Pydantic）
+"""
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Dict, Any, List
+from datetime import datetime, timezone
+
+
+class AgentBase(BaseModel):
+    """Agent基础模型"""
+    name: str
+    description: Optional[str] = None
+    agent_type: str
+    config: Optional[Dict[str, Any]] = None
+    model_name: Optional[str] = None
+    provider: Optional[str] = None
+
+
+class AgentCreate(AgentBase):
+    """创建Agent模型"""
+    pass
+
+
+class AgentUpdate(BaseModel):
+    """更新Agent模型"""
+    name: Optional[str] = None
+    description: Optional[str] = None
+    agent_type: Optional[str] = None
+    config: Optional[Dict[str, Any]] = None
+    is_active: Optional[bool] = None
+    model_name: Optional[str] = None
+    provider: Optional[str] = None
+
+
+class AgentResponse(AgentBase):
+    """Agent响应模型"""
+    id: int
+    is_active: bool
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class AgentRequest(BaseModel):
+    """Agent请求模型"""
+    message: str
+    context: Optional[Dict[str, Any]] = None
+    stream: bool = False
+    timeout: Optional[float] = Field(default=None, gt=0, description="请求预算（秒），超过后返回504")
+
+
+class AgentResponse(BaseModel):
+    """Agent响应模型"""
+    response: str
+    agent_id: int
+    model_used: Optional[str] = None
+    tokens_used: Optional[int] = None
+    processing_time: Optional[float] = None
+    metadata: Optional[Dict[str, Any]] = None 
+
+
+class CodeBlock(BaseModel):
+    """代码块模型"""
+    language: str
+    code: str
+
+
+class AgentChatResponse(BaseModel):
+    """Agent对话响应模型"""
+    agent_id: str
+    response: str
+    model_used: Optional[str] = None
+    tokens_used: Optional[int] = None
+    processing_time: Optional[float] = None
+    code_blocks: Optional[List[CodeBlock]] = None
+    metadata: Dict[str, Any] = {}
+
+
+class InteractionExportRequest(BaseModel):
+    """交互记录导出请求模型（不带时区的时间按UTC处理）"""
+    start: datetime
+    end: datetime
+
+    @field_validator("start", "end")
+    @classmethod
+    def to_naive_utc(cls, value: datetime) -> datetime:
+        """统一为不带时区的UTC时间，与交互记录的 created_at 一致"""
+        if value.tzinfo is None:
+            return value
+        try:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        except (OverflowError, ValueError) as e:
+            raise ValueError(f"无法转换为UTC时间: {e}")
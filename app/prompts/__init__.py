@@ -0,0 +1,6 @@
+"""
+提示词模板包
+"""
+from .registry import PromptTemplate, PromptRegistry, prompt_registry, flatten_prompt, build_messages
+
+__all__ = ["PromptTemplate", "PromptRegistry", "prompt_registry", "flatten_prompt", "build_messages"]
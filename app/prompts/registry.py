@@ -0,0 +1,115 @@
+"""
+提示词模板注册表
+
+模板使用Jinja2编写，启动时统一编译并缓存，Agent通过 config["prompt_template"] 选择模板。
+每个Agent模板定义两个区块:
+    system  静态部分，只依赖Agent配置，每个Agent渲染一次后复用
+    user    动态部分，每次请求渲染（用户消息、上下文、搜索结果等）
+
+提示词统一按 “静态系统提示 → 历史轮次 → 新消息” 的顺序组织，
+相同配置的请求前缀逐字节一致，可最大化Ollama KV缓存和DeepSeek前缀缓存的复用。
+"""
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from jinja2 import Environment, FileSystemLoader, ChoiceLoader, StrictUndefined, Template, TemplateNotFound
+from loguru import logger
+
+from app.core.config import settings
+
+# 内置模板目录
+BUILTIN_TEMPLATE_DIR = Path(__file__).parent / "templates"
+
+# 扁平提示词布局模板（供只接受单个prompt的提供商使用）
+FLAT_LAYOUT = "layout/flat.j2"
+
+TEMPLATE_SUFFIX = ".j2"
+
+
+class PromptTemplate:
+    """编译后的Agent提示词模板"""
+
+    def __init__(self, name: str, template: Template):
+        self.name = name
+        self.template = template
+        missing = {"system", "user"} - set(template.blocks)
+        if missing:
+            raise ValueError(f"提示词模板 {name} 缺少区块: {', '.join(sorted(missing))}")
+
+    def _render_block(self, block: str, variables: Dict[str, Any]) -> str:
+        context = self.template.new_context(variables)
+        return "".join(self.template.blocks[block](context)).strip()
+
+    def render_system(self, **variables) -> str:
+        """渲染静态系统提示（调用方应缓存结果）"""
+        return self._render_block("system", variables)
+
+    def render_user(self, **variables) -> str:
+        """渲染本次请求的用户消息"""
+        return self._render_block("user", variables)
+
+
+class PromptRegistry:
+    """提示词模板注册表"""
+
+    def __init__(self, template_dirs: Sequence[Path]):
+        self.template_dirs = [Path(d) for d in template_dirs]
+        self.env = Environment(
+            loader=ChoiceLoader([FileSystemLoader(str(d)) for d in self.template_dirs]),
+            undefined=StrictUndefined,
+            autoescape=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False
+        )
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._layout: Optional[Template] = None
+
+    def load_all(self) -> int:
+        """编译所有模板，返回模板数量"""
+        names = [name for name in self.env.list_templates() if name.endswith(TEMPLATE_SUFFIX)]
+        for name in names:
+            if name != FLAT_LAYOUT:
+                self.get(name[:-len(TEMPLATE_SUFFIX)])
+        self.layout()
+        logger.info(f"已编译 {len(names)} 个提示词模板")
+        return len(names)
+
+    def get(self, name: str) -> PromptTemplate:
+        """获取模板（如 "chat/default"），首次使用时编译"""
+        template = self._templates.get(name)
+        if template is None:
+            try:
+                compiled = self.env.get_template(f"{name}{TEMPLATE_SUFFIX}")
+            except TemplateNotFound:
+                raise ValueError(f"提示词模板不存在: {name}")
+            template = self._templates[name] = PromptTemplate(name, compiled)
+        return template
+
+    def layout(self) -> Template:
+        if self._layout is None:
+            self._layout = self.env.get_template(FLAT_LAYOUT)
+        return self._layout
+
+    def names(self) -> List[str]:
+        return sorted(self._templates)
+
+
+# 全局注册表：自定义模板目录优先于内置模板
+prompt_registry = PromptRegistry(
+    ([Path(settings.prompt_template_dir)] if settings.prompt_template_dir else []) + [BUILTIN_TEMPLATE_DIR]
+)
+
+
+def flatten_prompt(system: str, history: Sequence[Tuple[str, str]], user: str) -> str:
+    """生成扁平提示词：系统提示、历史轮次、新消息依次排列"""
+    return prompt_registry.layout().render(system=system, history=history, user=user).strip()
+
+
+def build_messages(system: str, history: Sequence[Tuple[str, str]], user: str) -> List[Dict[str, str]]:
+    """生成结构化消息：系统提示和历史轮次为独立消息，新消息在最后"""
+    messages = [{"role": "system", "content": system}]
+    for user_msg, ai_msg in history:
+        messages.append({"role": "user", "content": user_msg})
+        messages.append({"role": "assistant", "content": ai_msg})
+    messages.append({"role": "user", "content": user})
+    return messages
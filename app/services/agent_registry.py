@@ -0,0 +1,390 @@
+"""
+Agent注册表
+
+Agent实例按ID保存在内存中。内存中的Agent数量、估算大小（序列化后的字节数）或空闲时间超出限制时，
+最久未使用的空闲Agent被序列化为JSON换出到磁盘，下次请求时透明地恢复（包括聊天会话历史）。
+正在处理请求的Agent不会被换出；换出后长期未使用的Agent会被删除。
+Agent ID只在进程内唯一，多个worker进程各自使用 spill_dir 下以进程号命名的子目录，互不覆盖。
+"""
+import os
+import json
+import time
+import asyncio
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Type, AsyncIterator
+from loguru import logger
+
+from app.core.config import settings
+from app.agents import BaseAgent, ChatAgent, CodeAgent, SearchAgent, DocumentAgent
+from app.utils.serialization import dumps
+from app.utils.metrics import AGENT_REGISTRY_RESIDENT, AGENT_REGISTRY_SPILLED, AGENT_EVICTIONS, AGENT_REHYDRATIONS
+
+# Agent类型 -> 类（恢复换出的Agent时使用）
+AGENT_CLASSES: Dict[str, Type[BaseAgent]] = {
+    "chat": ChatAgent,
+    "code": CodeAgent,
+    "search": SearchAgent,
+    "document": DocumentAgent,
+}
+
+
+def _write_atomic(path: Path, data: bytes):
+    """先写临时文件再重命名，避免留下不完整的状态文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _unlink(path: Path):
+    path.unlink(missing_ok=True)
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # Windows上 os.kill(pid, 0) 会发送 CTRL_C_EVENT，无法用来探测，保守地视为存活
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class AgentEntry:
+    """注册表中的一个Agent（换出后 agent 为None）"""
+
+    __slots__ = (
+        "agent_id", "agent_type", "agent", "info", "created_at", "last_used", "requests",
+        "leases", "size", "measured_version", "version", "spilling", "lock"
+    )
+
+    def __init__(self, agent_id: str, agent: BaseAgent):
+        self.agent_id = agent_id
+        self.agent_type = agent.agent_type
+        self.agent: Optional[BaseAgent] = agent
+        self.info: Dict[str, Any] = {}
+        self.created_at = self.last_used = time.time()
+        self.requests = 0
+        self.leases = 0          # 正在处理的请求数，大于0时不换出
+        self.size = 0            # 最近一次测得的序列化大小（字节）
+        self.measured_version = -1   # 测量大小时Agent的 state_version，状态变化后才重新测量
+        self.version = 0         # 每次使用递增，用于发现换出期间的使用
+        self.spilling = False
+        self.lock = asyncio.Lock()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "resident": self.agent is not None,
+            "created_at": _isoformat(self.created_at),
+            "last_used": _isoformat(self.last_used),
+            "idle_seconds": round(time.time() - self.last_used, 1),
+            "requests": self.requests,
+            "in_flight": self.leases,
+            "size_bytes": self.size
+        }
+
+
+class AgentRegistry:
+    """有界的Agent注册表：LRU/空闲超时换出到磁盘，按需恢复"""
+
+    def __init__(
+        self,
+        spill_dir: str,
+        max_resident: int = 500,
+        max_memory_mb: float = 256.0,
+        idle_ttl: float = 1800.0,
+        spill_ttl: float = 604800.0,
+        sweep_interval: float = 30.0
+    ):
+        self.base_spill_dir = Path(spill_dir)
+        self.spill_dir = self._process_spill_dir()
+        self.max_resident = max_resident
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.idle_ttl = idle_ttl
+        self.spill_ttl = spill_ttl
+        self.sweep_interval = sweep_interval
+
+        # 按最近使用排序，最久未使用的在前
+        self._entries: "OrderedDict[str, AgentEntry]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+
+        self.evictions: Dict[str, int] = {}
+        self.rehydrations = 0
+        self.expired = 0
+
+    async def start(self):
+        """清理上次运行遗留的状态文件并启动后台检查"""
+        if self._task is not None:
+            return
+        # 在worker进程中启动时重新确定目录（注册表可能在fork之前创建）
+        self.spill_dir = self._process_spill_dir()
+        # 进程退出后内存中的Agent已丢失，遗留的换出文件也不再有对应的ID
+        await asyncio.to_thread(self._clear_spill_dir)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Agent注册表已启动，内存上限 {self.max_resident} 个/{self.max_memory_bytes / (1024 * 1024):g}MB，"
+            f"空闲 {self.idle_ttl:.0f}秒后换出到 {self.spill_dir}"
+        )
+
+    async def stop(self):
+        """停止后台检查"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _process_spill_dir(self) -> Path:
+        return self.base_spill_dir / f"worker-{os.getpid()}"
+
+    def _clear_spill_dir(self):
+        """清空本进程的换出目录，并删除已退出进程遗留的目录（其他存活worker的目录保持不变）"""
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.spill_dir.glob("*.json"):
+            path.unlink(missing_ok=True)
+        for directory in self.base_spill_dir.glob("worker-*"):
+            pid = directory.name[len("worker-"):]
+            if directory == self.spill_dir or not pid.isdigit() or _process_alive(int(pid)):
+                continue
+            for path in directory.glob("*"):
+                path.unlink(missing_ok=True)
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self._enforce_limits()
+                await self._expire_spilled()
+            except Exception as e:
+                logger.error(f"Agent注册表检查失败: {e}")
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def add(self, agent: BaseAgent) -> str:
+        """注册Agent，返回分配的ID（单调递增，删除后不会复用）"""
+        agent_id = f"{agent.agent_type}_{next(self._ids)}"
+        agent.agent_id = agent_id
+        self._entries[agent_id] = AgentEntry(agent_id, agent)
+        await self._enforce_limits()
+        return agent_id
+
+    async def get(self, agent_id: str) -> Optional[BaseAgent]:
+        """获取Agent（已换出时从磁盘恢复），不存在时返回None
+
+        只适用于不跨越await的短操作；处理请求请使用 use()，避免处理期间被换出。
+        """
+        entry = self._entries.get(agent_id)
+        if entry is None:
+            return None
+        if entry.agent is None:
+            return await self._rehydrate(entry)
+        self._touch(entry)
+        return entry.agent
+
+    @asynccontextmanager
+    async def use(self, agent_id: str) -> AsyncIterator[Optional[BaseAgent]]:
+        """在请求处理期间占用Agent（期间不会被换出），不存在时得到None"""
+        entry = self._entries.get(agent_id)
+        if entry is None:
+            yield None
+            return
+        entry.leases += 1
+        try:
+            agent = entry.agent
+            if agent is None:
+                agent = await self._rehydrate(entry)
+            else:
+                self._touch(entry)
+            if agent is not None:
+                entry.requests += 1
+            yield agent
+        finally:
+            entry.leases -= 1
+            if self._entries.get(agent_id) is entry:
+                self._touch(entry)
+
+    async def delete(self, agent_id: str) -> bool:
+        """删除Agent及其换出文件"""
+        entry = self._entries.pop(agent_id, None)
+        if entry is None:
+            return False
+        await asyncio.to_thread(_unlink, self._path(agent_id))
+        self._update_gauges()
+        return True
+
+    def _path(self, agent_id: str) -> Path:
+        return self.spill_dir / f"{agent_id}.json"
+
+    def _touch(self, entry: AgentEntry):
+        entry.last_used = time.time()
+        entry.version += 1
+        self._entries.move_to_end(entry.agent_id)
+
+    def _measure(self, entry: AgentEntry) -> int:
+        """测量内存中Agent的状态大小（仅在状态变化后重新测量，Agent增量维护大小，不重新序列化全部状态）"""
+        agent = entry.agent
+        if agent is not None and agent.state_version != entry.measured_version:
+            entry.size = agent.state_size()
+            entry.measured_version = agent.state_version
+        return entry.size
+
+    async def _enforce_limits(self):
+        """按空闲超时、数量上限、内存上限依次换出最久未使用的空闲Agent"""
+        resident = [entry for entry in self._entries.values() if entry.agent is not None]
+        count = len(resident)
+        memory = sum(self._measure(entry) for entry in resident)
+        now = time.time()
+
+        victims = []
+        for entry in resident:
+            if entry.leases or entry.spilling:
+                continue
+            if now - entry.last_used > self.idle_ttl:
+                reason = "idle"
+            elif count > self.max_resident:
+                reason = "count"
+            elif memory > self.max_memory_bytes:
+                reason = "memory"
+            else:
+                # 其余Agent使用得更晚，不会超时
+                break
+            victims.append((entry, reason))
+            count -= 1
+            memory -= entry.size
+
+        if victims:
+            await asyncio.gather(*(self._spill(entry, reason) for entry, reason in victims))
+        self._update_gauges()
+
+    async def _spill(self, entry: AgentEntry, reason: str):
+        """将Agent状态写入磁盘并从内存中释放"""
+        entry.spilling = True
+        version = entry.version
+        path = self._path(entry.agent_id)
+        try:
+            state = {**entry.agent.dump_state(), "agent_type": entry.agent_type}
+            data = dumps(state)
+            await asyncio.to_thread(_write_atomic, path, data)
+        except Exception as e:
+            logger.error(f"换出Agent {entry.agent_id} 失败: {e}")
+            return
+        finally:
+            entry.spilling = False
+
+        if self._entries.get(entry.agent_id) is not entry:
+            # 换出期间被删除
+            await asyncio.to_thread(_unlink, path)
+            return
+        if entry.leases or entry.version != version:
+            # 换出期间又被使用，保留在内存中（磁盘上的文件在下次换出时覆盖）
+            return
+
+        entry.info = {key: value for key, value in entry.agent.get_info().items() if key != "config"}
+        entry.size = len(data)
+        entry.agent = None
+        self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        AGENT_EVICTIONS.labels(reason).inc()
+        logger.debug(f"Agent {entry.agent_id} 已换出到磁盘（原因: {reason}，{len(data)}字节）")
+
+    async def _rehydrate(self, entry: AgentEntry) -> Optional[BaseAgent]:
+        """从磁盘恢复Agent，失败时移除该Agent并返回None"""
+        async with entry.lock:
+            if entry.agent is None:
+                try:
+                    data = await asyncio.to_thread(self._path(entry.agent_id).read_bytes)
+                    entry.agent = AGENT_CLASSES[entry.agent_type].from_state(json.loads(data))
+                    entry.agent.agent_id = entry.agent_id
+                except Exception as e:
+                    logger.error(f"恢复Agent {entry.agent_id} 失败: {e}")
+                    if self._entries.get(entry.agent_id) is entry:
+                        del self._entries[entry.agent_id]
+                    self._update_gauges()
+                    return None
+                entry.measured_version = -1
+                self.rehydrations += 1
+                AGENT_REHYDRATIONS.inc()
+                logger.debug(f"Agent {entry.agent_id} 已从磁盘恢复")
+        agent = entry.agent
+        self._touch(entry)
+        await self._enforce_limits()
+        return agent
+
+    async def _expire_spilled(self):
+        """删除换出后长期未使用的Agent"""
+        now = time.time()
+        expired = [
+            entry for entry in self._entries.values()
+            if entry.agent is None and not entry.leases and now - entry.last_used > self.spill_ttl
+        ]
+        for entry in expired:
+            del self._entries[entry.agent_id]
+            await asyncio.to_thread(_unlink, self._path(entry.agent_id))
+        if expired:
+            self.expired += len(expired)
+            logger.info(f"删除 {len(expired)} 个长期未使用的Agent")
+            self._update_gauges()
+
+    def _update_gauges(self):
+        resident = sum(1 for entry in self._entries.values() if entry.agent is not None)
+        AGENT_REGISTRY_RESIDENT.set(resident)
+        AGENT_REGISTRY_SPILLED.set(len(self._entries) - resident)
+
+    def list_agents(self) -> List[Dict[str, Any]]:
+        """所有Agent的信息及注册表统计（换出的Agent不返回config）"""
+        return [
+            {
+                "id": agent_id,
+                **(entry.agent.get_info() if entry.agent is not None else entry.info),
+                "registry": entry.get_stats()
+            }
+            for agent_id, entry in self._entries.items()
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        resident = [entry for entry in self._entries.values() if entry.agent is not None]
+        return {
+            "agents": len(self._entries),
+            "resident": len(resident),
+            "spilled": len(self._entries) - len(resident),
+            "resident_bytes": sum(entry.size for entry in resident),
+            "max_resident": self.max_resident,
+            "max_memory_bytes": self.max_memory_bytes,
+            "idle_ttl": self.idle_ttl,
+            "evictions": dict(self.evictions),
+            "rehydrations": self.rehydrations,
+            "expired": self.expired
+        }
+
+
+# 全局Agent注册表
+agent_registry = AgentRegistry(
+    spill_dir=settings.agent_spill_dir,
+    max_resident=settings.agent_max_resident,
+    max_memory_mb=settings.agent_max_memory_mb,
+    idle_ttl=settings.agent_idle_ttl,
+    spill_ttl=settings.agent_spill_ttl,
+    sweep_interval=settings.agent_sweep_interval
+)
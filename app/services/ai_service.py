@@ -2,114 +2,347 @@
 AI服务模块
 """
 import time
+import json
 import httpx
-import openai
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator
 from loguru import logger
 from app.core.config import settings
+from app.utils.timing import span
+from app.utils.http_client import get_http_client
+from app.utils.deadline import DeadlineExceeded, expired, is_deadline_timeout, stage_timeout
+from app.utils.metrics import LLM_PROMPT_TOKENS
+from app.services.ollama_residency import ModelResidency
+from app.services.ollama_pool import ollama_pool, OllamaNode
+
+# 模型调用的默认超时（秒），设置了请求截止时间时取剩余预算与之较小者
+LLM_TIMEOUT = 60.0
+
+
+class ConversationExpiredError(Exception):
+    """服务端会话已不存在（过期或被删除），调用方应丢弃会话ID后重试"""
 
 
 class AIService:
     """AI服务基类"""
     
+    # 提供商是否在服务端保存会话上下文（通过 conversation_id 续接）
+    supports_conversations = False
+    
     def __init__(self):
         self.start_time = None
         self.end_time = None
     
-    def _start_timer(self):
-        """开始计时"""
+    def _start_timer(self) -> float:
+        """开始计时，返回开始时间（同一服务实例可能被并发调用，调用方应保存返回值）"""
         self.start_time = time.time()
+        return self.start_time
     
-    def _end_timer(self):
+    def _end_timer(self, start_time: Optional[float] = None) -> float:
         """结束计时"""
         self.end_time = time.time()
-        return self.end_time - self.start_time
+        return self.end_time - (start_time if start_time is not None else self.start_time)
     
     async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """生成响应（子类实现）"""
         raise NotImplementedError
+    
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成响应
+        
+        依次产出 {"type": "delta", "content": ...} 事件，最后产出
+        {"type": "done", "result": ...}，result 与 generate_response 的返回值一致。
+        不支持流式的提供商默认一次性返回完整结果。
+        """
+        result = await self.generate_response(prompt, **kwargs)
+        if result.get("response"):
+            yield {"type": "delta", "content": result["response"]}
+        yield {"type": "done", "result": result}
+
+
+def _is_node_failure(error: Exception) -> bool:
+    """连接错误、超时和5xx视为节点故障（请求预算用完导致的超时除外）"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError) and not is_deadline_timeout(error)
 
 
 class OllamaService(AIService):
-    """Ollama服务"""
+    """Ollama服务
+    
+    请求通过节点池分发到一个或多个Ollama节点；连接失败（请求尚未被处理）时换一个节点重试一次。
+    调用参数 affinity_key（如Agent ID+会话ID）用于把同一会话的请求路由到同一节点。
+    """
     
     def __init__(self):
         super().__init__()
         self.base_url = settings.ollama_base_url
         self.model = settings.ollama_model
+        self.pool = ollama_pool
+    
+    @staticmethod
+    def _residency(node: OllamaNode) -> Optional[ModelResidency]:
+        return node.residency if settings.ollama_residency_enabled else None
+    
+    def _select_model(self, node: OllamaNode, requested: Optional[str]) -> str:
+        """选择模型：未指定时优先使用节点上已加载的模型"""
+        residency = self._residency(node)
+        if residency is not None:
+            return residency.choose_model(requested)
+        return requested or self.model
+    
+    def _payload(self, node: OllamaNode, model: str, prompt: str, stream: bool, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": kwargs.get("options", {})
+        }
+        residency = self._residency(node)
+        if residency is not None:
+            payload["keep_alive"] = residency.keep_alive_for(model)
+        return payload
+    
+    def _observe(self, node: OllamaNode, model: str, result: Dict[str, Any]):
+        residency = self._residency(node)
+        if residency is not None:
+            residency.observe(model, result)
+    
+    def _retry_node(self, node: OllamaNode, error: Exception, attempt: int, kwargs: Dict[str, Any]) -> Optional[OllamaNode]:
+        """记录节点故障，连接失败时返回用于重试的其他节点"""
+        if not _is_node_failure(error):
+            return None
+        self.pool.report_failure(node, error)
+        if attempt or not isinstance(error, httpx.ConnectError):
+            return None
+        retry_node = self.pool.select(kwargs.get("affinity_key"), kwargs.get("model"), exclude=node)
+        return retry_node if retry_node is not node else None
     
     async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """使用Ollama生成响应"""
-        self._start_timer()
+        start_time = self._start_timer()
+        client = get_http_client("ollama", timeout=LLM_TIMEOUT)
+        node = self.pool.select(kwargs.get("affinity_key"), kwargs.get("model"))
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": kwargs.get("model", self.model),
-                        "prompt": prompt,
-                        "stream": kwargs.get("stream", False),
-                        "options": kwargs.get("options", {})
-                    },
-                    timeout=60.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                processing_time = self._end_timer()
-                
-                return {
-                    "response": result.get("response", ""),
-                    "model_used": kwargs.get("model", self.model),
-                    "tokens_used": result.get("eval_count", 0),
-                    "processing_time": processing_time,
-                    "provider": "ollama",
-                    "metadata": result
-                }
+            for attempt in range(2):
+                model = self._select_model(node, kwargs.get("model"))
+                try:
+                    async with self.pool.lease(node):
+                        with span("ollama_http"):
+                            response = await client.post(
+                                f"{node.base_url}/api/generate",
+                                json=self._payload(node, model, prompt, False, kwargs),
+                                timeout=stage_timeout(LLM_TIMEOUT)
+                            )
+                            response.raise_for_status()
+                            result = response.json()
+                    self.pool.report_success(node)
+                    break
+                except Exception as e:
+                    retry_node = self._retry_node(node, e, attempt, kwargs)
+                    if retry_node is None:
+                        raise
+                    logger.warning(f"Ollama节点 {node.base_url} 连接失败，改用 {retry_node.base_url}")
+                    node = retry_node
+            
+            processing_time = self._end_timer(start_time)
+            self._observe(node, model, result)
+            
+            return {
+                "response": result.get("response", ""),
+                "model_used": model,
+                "tokens_used": result.get("eval_count", 0),
+                "processing_time": processing_time,
+                "finish_reason": result.get("done_reason"),
+                "provider": "ollama",
+                "metadata": self._strip_payload(result, node)
+            }
                 
         except Exception as e:
             logger.error(f"Ollama API错误: {e}")
             raise
+    
+    @staticmethod
+    def _strip_payload(result: Dict[str, Any], node: OllamaNode) -> Dict[str, Any]:
+        """去掉原始结果中与回答重复的文本和体积很大的context数组，并注明处理请求的节点"""
+        metadata = {k: v for k, v in result.items() if k not in ("response", "context")}
+        metadata["node"] = node.base_url
+        return metadata
+    
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """使用Ollama流式生成响应"""
+        start_time = self._start_timer()
+        client = get_http_client("ollama", timeout=LLM_TIMEOUT)
+        node = self.pool.select(kwargs.get("affinity_key"), kwargs.get("model"))
+        
+        try:
+            for attempt in range(2):
+                model = self._select_model(node, kwargs.get("model"))
+                started = False
+                try:
+                    async with self.pool.lease(node):
+                        async with client.stream(
+                            "POST",
+                            f"{node.base_url}/api/generate",
+                            json=self._payload(node, model, prompt, True, kwargs),
+                            timeout=stage_timeout(LLM_TIMEOUT)
+                        ) as response:
+                            response.raise_for_status()
+                            parts = []
+                            async for line in response.aiter_lines():
+                                if not line:
+                                    continue
+                                if expired():
+                                    raise DeadlineExceeded()
+                                chunk = json.loads(line)
+                                if chunk.get("response"):
+                                    started = True
+                                    parts.append(chunk["response"])
+                                    yield {"type": "delta", "content": chunk["response"]}
+                                if chunk.get("done"):
+                                    self.pool.report_success(node)
+                                    self._observe(node, model, chunk)
+                                    yield {
+                                        "type": "done",
+                                        "result": {
+                                            "response": "".join(parts),
+                                            "model_used": model,
+                                            "tokens_used": chunk.get("eval_count", 0),
+                                            "processing_time": self._end_timer(start_time),
+                                            "finish_reason": chunk.get("done_reason"),
+                                            "provider": "ollama",
+                                            "metadata": self._strip_payload(chunk, node)
+                                        }
+                                    }
+                                    return
+                            raise RuntimeError("Ollama流式响应意外结束")
+                except Exception as e:
+                    # 已经输出内容后不能换节点重试
+                    retry_node = None if started else self._retry_node(node, e, attempt, kwargs)
+                    if started and _is_node_failure(e):
+                        self.pool.report_failure(node, e)
+                    if retry_node is None:
+                        raise
+                    logger.warning(f"Ollama节点 {node.base_url} 连接失败，改用 {retry_node.base_url}")
+                    node = retry_node
+                    
+        except Exception as e:
+            logger.error(f"Ollama流式API错误: {e}")
+            raise
+    
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """批量生成文本向量（/api/embed），连接失败时换一个节点重试一次"""
+        model = model or settings.ollama_embed_model
+        client = get_http_client("ollama", timeout=LLM_TIMEOUT)
+        kwargs = {"model": model}
+        node = self.pool.select(None, model)
+        
+        for attempt in range(2):
+            try:
+                async with self.pool.lease(node):
+                    with span("ollama_embed"):
+                        response = await client.post(
+                            f"{node.base_url}/api/embed",
+                            json={"model": model, "input": texts},
+                            timeout=stage_timeout(LLM_TIMEOUT)
+                        )
+                        response.raise_for_status()
+                        embeddings = response.json()["embeddings"]
+                self.pool.report_success(node)
+                return embeddings
+            except Exception as e:
+                retry_node = self._retry_node(node, e, attempt, kwargs)
+                if retry_node is None:
+                    logger.error(f"Ollama向量API错误: {e}")
+                    raise
+                logger.warning(f"Ollama节点 {node.base_url} 连接失败，改用 {retry_node.base_url}")
+                node = retry_node
 
 
 class DeepSeekService(AIService):
-    """DeepSeek服务"""
+    """DeepSeek服务
+    
+    系统提示词和历史轮次作为独立的消息发送，前缀保持稳定时可命中服务端的上下文缓存。
+    """
+    
+    # 进程内共享的AsyncOpenAI客户端（复用共享HTTP连接池）
+    _client = None
+    _client_key = None
     
     def __init__(self):
         super().__init__()
         self.api_key = settings.deepseek_api_key
         self.base_url = settings.deepseek_api_base_url
         
-        if self.api_key:
-            openai.api_key = self.api_key
-            openai.api_base = self.base_url
+    def _get_client(self):
+        """首次使用时再导入openai，避免拖慢应用启动"""
+        from openai import AsyncOpenAI
+        
+        http_client = get_http_client("deepseek", timeout=LLM_TIMEOUT)
+        key = (self.api_key, self.base_url, id(http_client))
+        if DeepSeekService._client_key != key:
+            DeepSeekService._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client
+            )
+            DeepSeekService._client_key = key
+        return DeepSeekService._client
+    
+    @staticmethod
+    def _usage(response) -> Dict[str, int]:
+        """解析token用量，包括命中缓存的提示词token数"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+        
+        # DeepSeek 返回 prompt_cache_hit_tokens，OpenAI兼容接口返回 prompt_tokens_details.cached_tokens
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) if details is not None else None
+        return {
+            "prompt_tokens": usage.prompt_tokens or 0,
+            "completion_tokens": usage.completion_tokens or 0,
+            "total_tokens": usage.total_tokens or 0,
+            "cached_tokens": cached or 0
+        }
     
     async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """使用DeepSeek生成响应"""
+        """使用DeepSeek生成响应
+        
+        优先使用 kwargs["messages"] 中的结构化消息，未提供时把prompt作为单条用户消息发送。
+        """
         if not self.api_key:
             raise ValueError("DeepSeek API密钥未配置")
         
-        self._start_timer()
+        client = self._get_client()
+        model = kwargs.get("model", "deepseek-chat")
+        messages = kwargs.get("messages") or [{"role": "user", "content": prompt}]
+        start_time = self._start_timer()
         
         try:
-            response = await openai.ChatCompletion.acreate(
-                model=kwargs.get("model", "deepseek-chat"),
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=kwargs.get("max_tokens", 1000),
-                temperature=kwargs.get("temperature", 0.7),
-                stream=kwargs.get("stream", False)
-            )
+            with span("deepseek_api"):
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=kwargs.get("max_tokens", 1000),
+                    temperature=kwargs.get("temperature", 0.7),
+                    timeout=stage_timeout(LLM_TIMEOUT)
+                )
             
-            processing_time = self._end_timer()
+            processing_time = self._end_timer(start_time)
+            usage = self._usage(response)
+            LLM_PROMPT_TOKENS.labels("deepseek", "hit").inc(usage["cached_tokens"])
+            LLM_PROMPT_TOKENS.labels("deepseek", "miss").inc(max(0, usage["prompt_tokens"] - usage["cached_tokens"]))
             
             return {
                 "response": response.choices[0].message.content,
-                "model_used": kwargs.get("model", "deepseek-chat"),
-                "tokens_used": response.usage.total_tokens if hasattr(response, 'usage') else 0,
+                "model_used": model,
+                "tokens_used": usage["total_tokens"],
+                "cached_tokens": usage["cached_tokens"],
                 "processing_time": processing_time,
+                "finish_reason": response.choices[0].finish_reason,
                 "provider": "deepseek",
                 "metadata": response.model_dump() if hasattr(response, 'model_dump') else {}
             }
@@ -120,7 +353,12 @@ class DeepSeekService(AIService):
 
 
 class DifyService(AIService):
-    """Dify服务"""
+    """Dify服务
+    
+    Dify在服务端保存会话上下文，传入 conversation_id 后只需发送新消息。
+    """
+    
+    supports_conversations = True
     
     def __init__(self):
         super().__init__()
@@ -128,14 +366,19 @@ class DifyService(AIService):
         self.base_url = settings.dify_api_base_url
     
     async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
-        """使用Dify生成响应"""
+        """使用Dify生成响应
+        
+        传入的 conversation_id 在服务端已不存在（过期或被删除）时抛出 ConversationExpiredError。
+        """
         if not self.api_key:
             raise ValueError("Dify API密钥未配置")
         
-        self._start_timer()
+        conversation_id = kwargs.get("conversation_id")
+        client = get_http_client("dify", timeout=LLM_TIMEOUT)
+        start_time = self._start_timer()
         
         try:
-            async with httpx.AsyncClient() as client:
+            with span("dify_http"):
                 response = await client.post(
                     f"{self.base_url}/chat-messages",
                     headers={
@@ -145,26 +388,31 @@ class DifyService(AIService):
                     json={
                         "inputs": {},
                         "query": prompt,
-                        "response_mode": "streaming" if kwargs.get("stream", False) else "blocking",
-                        "conversation_id": kwargs.get("conversation_id"),
+                        "response_mode": "blocking",
+                        "conversation_id": conversation_id or "",
                         "user": kwargs.get("user", "default")
                     },
-                    timeout=60.0
+                    timeout=stage_timeout(LLM_TIMEOUT)
                 )
+                if response.status_code == 404 and conversation_id:
+                    raise ConversationExpiredError(f"Dify会话不存在: {conversation_id}")
                 response.raise_for_status()
                 result = response.json()
-                
-                processing_time = self._end_timer()
-                
-                return {
-                    "response": result.get("answer", ""),
-                    "model_used": "dify",
-                    "tokens_used": result.get("usage", {}).get("total_tokens", 0),
-                    "processing_time": processing_time,
-                    "provider": "dify",
-                    "metadata": result
-                }
-                
+            
+            processing_time = self._end_timer(start_time)
+            
+            return {
+                "response": result.get("answer", ""),
+                "model_used": "dify",
+                "tokens_used": result.get("metadata", {}).get("usage", {}).get("total_tokens", 0),
+                "processing_time": processing_time,
+                "provider": "dify",
+                "conversation_id": result.get("conversation_id"),
+                "metadata": result
+            }
+        
+        except ConversationExpiredError:
+            raise
         except Exception as e:
             logger.error(f"Dify API错误: {e}")
             raise
@@ -182,6 +430,9 @@ class AIServiceFactory:
             return DeepSeekService()
         elif provider == "dify":
             return DifyService()
+        elif provider == "replay":
+            from app.services.replay_service import ReplayService
+            return ReplayService()
         else:
             raise ValueError(f"不支持的AI提供商: {provider}")
     
@@ -196,4 +447,7 @@ class AIServiceFactory:
         if settings.dify_api_key:
             providers.append("dify")
         
+        if settings.replay_enabled:
+            providers.append("replay")
+        
         return providers 
\ No newline at end of file
@@ -0,0 +1,434 @@
+"""
+文档向量存储
+
+每个集合（collection）一个目录:
+    index.json          索引 {"generation", "file", "model", "dim", "chunks": [[哈希, 文档, 偏移, 长度], ...], "documents": {...}}
+    chunks-<文件>.bin    所有文本块的UTF-8文本依次拼接，按索引中的偏移读取
+    vectors-<文件>.f32   float32向量矩阵（shape为 [文本块数, 维度]，行已归一化），按只读方式内存映射
+
+向量矩阵以内存映射方式读取，多个进程共享操作系统页缓存而不各自复制；检索时一次矩阵乘法算出
+所有文本块的相似度，再用 argpartition 取前k个。文本块按内容哈希（含向量模型）复用已有向量，重新索引时只为
+变化的文本块生成向量。
+
+写入时只在文件末尾追加新的文本块和向量，删除的文本块在索引中标记为墓碑（文档为 null），检索时跳过；
+墓碑占比超过 document_compact_ratio 时压缩为新文件（按连续行分块复制，不把整个矩阵读入内存）。
+每次写入后原子替换 index.json，读取方发现索引变化时重新映射（追加的行不影响已映射的旧一代）。
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Tuple, Callable, Awaitable, Iterator
+from loguru import logger
+
+from app.core.config import settings
+from app.services.ai_service import AIServiceFactory
+from app.utils.serialization import dumps
+from app.utils.metrics import DOCUMENT_CHUNKS_INDEXED, DOCUMENT_SEARCH_SECONDS
+
+if TYPE_CHECKING:
+    # numpy在首次检索或索引时才导入，避免拖慢应用启动
+    import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows下只保证进程内的写入互斥
+    fcntl = None
+
+# 集合名称（用作目录名）
+COLLECTION_PATTERN = re.compile(r"^[\w\-]{1,64}$")
+
+# 段落哈希对该值取模为0时在段落后切分文本块（内容决定切分点，修改只影响附近的文本块）
+BOUNDARY_MODULUS = 4
+
+# 压缩时每次复制的最大行数
+COPY_BLOCK_ROWS = 4096
+
+# 向量化函数：文本列表 -> 向量列表
+EmbedFunc = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def _hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def split_text(text: str, chunk_size: int) -> List[str]:
+    """按段落切分文本块
+
+    段落依次合并，超过 chunk_size 或遇到由段落内容决定的切分点时结束当前文本块，超长段落按长度硬切。
+    切分点只取决于段落本身，修改某一段落后其余文本块的内容（和哈希）保持不变。
+    """
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        for start in range(0, len(paragraph), chunk_size):
+            piece = paragraph[start:start + chunk_size]
+            if current and len(current) + 2 + len(piece) > chunk_size:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+        if int(_hash(paragraph)[:8], 16) % BOUNDARY_MODULUS == 0:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _normalize(vectors: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _runs(rows: List[int], limit: int = COPY_BLOCK_ROWS) -> Iterator[Tuple[int, int]]:
+    """将递增的行号合并为连续区间 [start, stop)，每段不超过 limit 行"""
+    start = previous = None
+    for row in rows:
+        if start is not None and row == previous + 1 and row - start < limit:
+            previous = row
+            continue
+        if start is not None:
+            yield start, previous + 1
+        start = previous = row
+    if start is not None:
+        yield start, previous + 1
+
+
+async def embed_with_ollama(texts: List[str]) -> List[List[float]]:
+    """使用Ollama向量模型生成文本向量"""
+    return await AIServiceFactory.get_service("ollama").embed(texts)
+
+
+class Generation:
+    """一代索引（不可变），检索时持有引用，写入新一代不影响正在进行的检索"""
+
+    __slots__ = (
+        "number", "file_number", "dim", "chunks", "documents", "rows", "dead", "vectors", "file", "mtime", "_read_lock"
+    )
+
+    def __init__(self, index: Dict[str, Any], vectors: Optional["np.ndarray"], file, mtime: Optional[int]):
+        self.number: int = index["generation"]
+        self.file_number: int = index["file"]
+        self.dim: int = index["dim"]
+        self.chunks: List[List[Any]] = index["chunks"]
+        self.documents: Dict[str, Dict[str, Any]] = index["documents"]
+        # 内容哈希 -> 行号（不含墓碑）
+        self.rows: Dict[str, int] = {}
+        # 墓碑行号
+        self.dead: List[int] = []
+        for row, entry in enumerate(self.chunks):
+            if entry[1] is None:
+                self.dead.append(row)
+            else:
+                self.rows.setdefault(entry[0], row)
+        self.vectors = vectors
+        # 保持文本文件打开，旧一代文件被删除后仍可读取
+        self.file = file
+        self.mtime = mtime
+        self._read_lock = threading.Lock()
+
+    @property
+    def live(self) -> int:
+        return len(self.chunks) - len(self.dead)
+
+    def read_bytes(self, offset: int, length: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self.file.fileno(), length, offset)
+        with self._read_lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def read_text(self, row: int) -> str:
+        _, _, offset, length = self.chunks[row]
+        return self.read_bytes(offset, length).decode("utf-8")
+
+
+EMPTY_INDEX = {"generation": 0, "file": 0, "dim": 0, "chunks": [], "documents": {}}
+
+
+class DocumentStore:
+    """单个集合的文本块与向量存储"""
+
+    def __init__(self, directory: Path, model: str, embed: EmbedFunc = embed_with_ollama):
+        self.directory = directory
+        self.model = model
+        self.embed = embed
+        self.index_path = directory / "index.json"
+        self._generation = Generation(EMPTY_INDEX, None, None, None)
+        self._lock = threading.Lock()
+        self._write_lock = asyncio.Lock()
+
+    def _chunks_path(self, number: int) -> Path:
+        return self.directory / f"chunks-{number}.bin"
+
+    def _vectors_path(self, number: int) -> Path:
+        return self.directory / f"vectors-{number}.f32"
+
+    def current(self) -> Generation:
+        """返回最新一代索引（index.json 被其他进程更新时重新加载）"""
+        try:
+            mtime = self.index_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return self._generation
+        with self._lock:
+            if self._generation.mtime != mtime:
+                self._generation = self._load(mtime)
+            return self._generation
+
+    def _load(self, mtime: int) -> Generation:
+        import numpy as np
+        index = json.loads(self.index_path.read_bytes())
+        number, count = index["file"], len(index["chunks"])
+        if not count:
+            return Generation(index, None, None, mtime)
+        vectors = np.memmap(self._vectors_path(number), dtype=np.float32, mode="r", shape=(count, index["dim"]))
+        return Generation(index, vectors, open(self._chunks_path(number), "rb"), mtime)
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """跨进程的写入锁（同一集合同一时间只有一个写入方）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".lock", "wb") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    # ---------- 检索 ----------
+
+    def search(self, query: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """返回与查询向量最相似的 top_k 个文本块（同步，调用方应放到线程中执行）"""
+        import numpy as np
+        generation = self.current()
+        if generation.vectors is None or not generation.live or top_k <= 0:
+            return []
+        start = time.perf_counter()
+        query_vector = _normalize(np.asarray(query, dtype=np.float32))
+        if query_vector.shape[0] != generation.dim:
+            raise ValueError(f"查询向量维度 {query_vector.shape[0]} 与索引维度 {generation.dim} 不一致")
+
+        scores = generation.vectors @ query_vector
+        if generation.dead:
+            scores[generation.dead] = -np.inf
+        count = scores.shape[0]
+        top_k = min(top_k, generation.live)
+        # 只对前k个做部分排序，再按相似度排列这k个
+        top = np.argpartition(scores, count - top_k)[count - top_k:]
+        top = top[np.argsort(-scores[top])]
+        DOCUMENT_SEARCH_SECONDS.observe(time.perf_counter() - start)
+
+        return [
+            {
+                "document": generation.chunks[row][1],
+                "text": generation.read_text(row),
+                "score": round(float(scores[row]), 4)
+            }
+            for row in top.tolist()
+        ]
+
+    async def query(self, text: str, top_k: int) -> List[Dict[str, Any]]:
+        """向量化查询文本并检索"""
+        generation = await asyncio.to_thread(self.current)
+        if generation.vectors is None or not generation.live:
+            return []
+        (query,) = await self.embed([text])
+        return await asyncio.to_thread(self.search, query, top_k)
+
+    # ---------- 索引 ----------
+
+    async def index_document(self, name: str, text: str) -> Dict[str, Any]:
+        """索引（或重新索引）文档，只为新增或变化的文本块生成向量"""
+        import numpy as np
+        chunks = split_text(text, settings.document_chunk_size)
+        hashes = [_hash(f"{self.model}\0{chunk}") for chunk in chunks]
+
+        async with self._write_lock:
+            generation = await asyncio.to_thread(self.current)
+            missing: Dict[str, str] = {}
+            for chunk_hash, chunk in zip(hashes, chunks):
+                if chunk_hash not in generation.rows:
+                    missing.setdefault(chunk_hash, chunk)
+
+            new_vectors: Dict[str, "np.ndarray"] = {}
+            pending = list(missing.items())
+            batch_size = settings.document_embed_batch_size
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                embeddings = _normalize(np.asarray(await self.embed([chunk for _, chunk in batch]), dtype=np.float32))
+                new_vectors.update((chunk_hash, vector) for (chunk_hash, _), vector in zip(batch, embeddings))
+
+            document = {
+                "chunks": len(chunks),
+                "size": len(text.encode("utf-8")),
+                "indexed_at": datetime.utcnow().isoformat() + "Z"
+            }
+            await asyncio.to_thread(self._commit, name, list(zip(hashes, chunks)), new_vectors, document)
+
+        embedded = sum(1 for chunk_hash in hashes if chunk_hash in new_vectors)
+        DOCUMENT_CHUNKS_INDEXED.labels("embedded").inc(embedded)
+        DOCUMENT_CHUNKS_INDEXED.labels("reused").inc(len(chunks) - embedded)
+        logger.info(f"文档 {name} 已索引到 {self.directory.name}: {len(chunks)} 个文本块，新生成向量 {len(new_vectors)} 个")
+        return {"document": name, "chunks": len(chunks), "embedded": len(new_vectors), "reused": len(chunks) - embedded}
+
+    async def remove_document(self, name: str) -> bool:
+        """从索引中删除文档"""
+        async with self._write_lock:
+            generation = await asyncio.to_thread(self.current)
+            if name not in generation.documents:
+                return False
+            await asyncio.to_thread(self._commit, name, [], {}, None)
+        return True
+
+    def _commit(
+        self,
+        name: str,
+        chunks: List[Tuple[str, str]],
+        new_vectors: Dict[str, "np.ndarray"],
+        document: Optional[Dict[str, Any]]
+    ):
+        """写入新一代索引：该文档未变化的文本块原地保留，其余标记为墓碑，新文本块追加到文件末尾"""
+        import numpy as np
+        with self._exclusive():
+            generation = self.current()
+            dims = {vector.shape[0] for vector in new_vectors.values()}
+            dim = dims.pop() if dims else generation.dim
+            others = any(entry[1] not in (None, name) for entry in generation.chunks)
+            if dims or (generation.dim and others and dim != generation.dim):
+                raise ValueError("向量维度不一致，更换向量模型后请使用新的集合")
+
+            # 该文档中仍需要的文本块（按哈希计数，同一文本块可出现多次）
+            needed: Dict[str, int] = {}
+            for chunk_hash, _ in chunks:
+                needed[chunk_hash] = needed.get(chunk_hash, 0) + 1
+            entries: List[List[Any]] = []
+            for chunk_hash, doc, offset, length in generation.chunks:
+                if doc == name:
+                    if needed.get(chunk_hash):
+                        needed[chunk_hash] -= 1
+                    else:
+                        doc = None
+                entries.append([chunk_hash, doc, offset, length])
+            appended: List[Tuple[str, str]] = []
+            for chunk_hash, chunk in chunks:
+                if needed.get(chunk_hash):
+                    needed[chunk_hash] -= 1
+                    appended.append((chunk_hash, chunk))
+
+            vectors = np.empty((len(appended), dim), dtype=np.float32)
+            for row, (chunk_hash, _) in enumerate(appended):
+                vector = new_vectors.get(chunk_hash)
+                if vector is None:
+                    previous = generation.rows.get(chunk_hash)
+                    if previous is None:
+                        raise RuntimeError("索引在向量化期间被其他进程修改，请重试")
+                    vector = generation.vectors[previous]
+                vectors[row] = vector
+
+            dead = sum(1 for entry in entries if entry[1] is None)
+            total = len(entries) + len(appended)
+            if dim != generation.dim or (dead and dead >= total * settings.document_compact_ratio):
+                file_number = generation.number + 1
+                entries = self._compact(generation, entries, file_number, dim)
+            else:
+                file_number = generation.file_number
+            self._append(name, entries, appended, vectors, file_number)
+
+            documents = {doc: meta for doc, meta in generation.documents.items() if doc != name}
+            if document is not None:
+                documents[name] = document
+            tmp_path = self.index_path.with_suffix(".json.tmp")
+            tmp_path.write_bytes(dumps({
+                "generation": generation.number + 1,
+                "file": file_number,
+                "model": self.model,
+                "dim": dim,
+                "chunks": entries,
+                "documents": documents
+            }))
+            tmp_path.replace(self.index_path)
+
+            if file_number != generation.file_number:
+                # 压缩前的文件已不再被索引引用（正在检索的读取方仍持有打开的文件）
+                for path in (self._chunks_path(generation.file_number), self._vectors_path(generation.file_number)):
+                    try:
+                        path.unlink(missing_ok=True)
+                    except OSError as e:
+                        logger.debug(f"删除旧索引文件失败 {path}: {e}")
+            self.current()
+
+    def _compact(self, generation: Generation, entries: List[List[Any]], number: int, dim: int) -> List[List[Any]]:
+        """去掉墓碑，将存活的文本块和向量按连续行分块复制到新文件"""
+        import numpy as np
+        live = [row for row, entry in enumerate(entries) if entry[1] is not None]
+        compacted: List[List[Any]] = []
+        with open(self._chunks_path(number), "wb") as chunks_file, open(self._vectors_path(number), "wb") as vectors_file:
+            offset = 0
+            for start, stop in _runs(live):
+                # 连续行的文本在原文件中也是连续的，整段读取
+                begin = entries[start][2]
+                end = entries[stop - 1][2] + entries[stop - 1][3]
+                chunks_file.write(generation.read_bytes(begin, end - begin))
+                for chunk_hash, doc, chunk_offset, length in entries[start:stop]:
+                    compacted.append([chunk_hash, doc, offset + chunk_offset - begin, length])
+                offset += end - begin
+                vectors_file.write(np.ascontiguousarray(generation.vectors[start:stop]).tobytes())
+        logger.info(f"集合 {self.directory.name} 已压缩: 存活 {len(live)} 个文本块，清除墓碑 {len(entries) - len(live)} 个")
+        return compacted
+
+    def _append(
+        self,
+        name: str,
+        entries: List[List[Any]],
+        appended: List[Tuple[str, str]],
+        vectors: "np.ndarray",
+        number: int
+    ):
+        """在文件末尾追加文本块和向量（先截掉上次写入中断时残留的未提交部分）"""
+        offset = entries[-1][2] + entries[-1][3] if entries else 0
+        with open(self._chunks_path(number), "ab") as chunks_file:
+            chunks_file.truncate(offset)
+            for chunk_hash, chunk in appended:
+                data = chunk.encode("utf-8")
+                chunks_file.write(data)
+                entries.append([chunk_hash, name, offset, len(data)])
+                offset += len(data)
+        if entries:
+            with open(self._vectors_path(number), "ab") as vectors_file:
+                vectors_file.truncate((len(entries) - len(appended)) * vectors.shape[1] * 4)
+                vectors_file.write(vectors.tobytes())
+
+    def get_stats(self) -> Dict[str, Any]:
+        generation = self.current()
+        return {
+            "collection": self.directory.name,
+            "model": self.model,
+            "generation": generation.number,
+            "dim": generation.dim,
+            "chunks": generation.live,
+            "tombstones": len(generation.dead),
+            "documents": generation.documents
+        }
+
+
+# 每个集合在进程内只打开一次
+_stores: Dict[str, DocumentStore] = {}
+
+
+def get_document_store(collection: str) -> DocumentStore:
+    """获取集合的文档存储"""
+    if not COLLECTION_PATTERN.match(collection):
+        raise ValueError(f"无效的集合名称: {collection}")
+    store = _stores.get(collection)
+    if store is None:
+        store = _stores[collection] = DocumentStore(Path(settings.document_store_dir) / collection, settings.ollama_embed_model)
+    return store
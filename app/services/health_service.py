@@ -0,0 +1,166 @@
+"""
+AI服务健康检查模块
+
+后台任务定时并发探测各AI提供商（每个探测有严格超时），结果保存为快照；
+健康检查接口直接返回最近的快照及其时效，不在请求路径上访问外部服务。
+"""
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, Optional
+from loguru import logger
+
+from app.core.config import settings
+from app.services.ai_service import AIServiceFactory
+from app.services.ollama_pool import ollama_pool
+from app.utils.http_client import get_http_client
+
+
+class HealthMonitor:
+    """AI服务健康状态监控"""
+
+    def __init__(self, interval: float = 15.0, timeout: float = 2.0):
+        self.interval = interval
+        self.timeout = timeout
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """启动后台刷新任务"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"AI健康检查已启动，刷新间隔 {self.interval}秒，探测超时 {self.timeout}秒")
+
+    async def stop(self):
+        """停止后台刷新任务"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._refresh_task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"AI健康检查刷新失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> Dict[str, Any]:
+        """刷新快照，同一时间只有一次刷新在进行，并发调用共享结果"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._probe_all())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _probe_all(self) -> Dict[str, Any]:
+        providers = AIServiceFactory.get_available_providers()
+        results = await asyncio.gather(*(self._probe_with_timeout(p) for p in providers))
+        services = dict(zip(providers, results))
+
+        self._checked_at = time.monotonic()
+        self._snapshot = {
+            "ai_services": services,
+            "overall_status": "healthy" if all(r["status"] == "healthy" for r in services.values()) else "degraded",
+            "checked_at": datetime.utcnow().isoformat() + "Z"
+        }
+        return self._snapshot
+
+    async def _probe_with_timeout(self, provider: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._probe(provider), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            result = {"status": "unhealthy", "error": f"探测超时（{self.timeout}秒）"}
+        except Exception as e:
+            result = {"status": "unhealthy", "error": str(e) or type(e).__name__}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    async def _probe(self, provider: str) -> Dict[str, Any]:
+        """探测单个提供商"""
+        client = get_http_client("health", timeout=self.timeout)
+
+        if provider == "ollama":
+            return await self._probe_ollama(client)
+
+        if provider == "deepseek":
+            response = await client.get(
+                f"{settings.deepseek_api_base_url}/models",
+                headers={"Authorization": f"Bearer {settings.deepseek_api_key}"}
+            )
+            response.raise_for_status()
+            return {"status": "healthy"}
+
+        if provider == "dify":
+            response = await client.get(
+                f"{settings.dify_api_base_url}/parameters",
+                headers={"Authorization": f"Bearer {settings.dify_api_key}"}
+            )
+            response.raise_for_status()
+            return {"status": "healthy"}
+
+        if provider == "replay":
+            from app.services.replay_service import get_store
+            store = await asyncio.to_thread(get_store, settings.replay_file)
+            return {"status": "healthy", "recordings": len(store)}
+
+        return {"status": "available"}
+
+    async def _probe_ollama(self, client) -> Dict[str, Any]:
+        """探测所有Ollama节点，任一节点健康即可用"""
+        async def probe_node(base_url: str) -> Dict[str, Any]:
+            try:
+                response = await client.get(f"{base_url}/api/tags")
+                response.raise_for_status()
+                ollama_pool.report_probe_success(base_url)
+                return {"status": "healthy", "models": response.json().get("models", [])}
+            except Exception as e:
+                return {"status": "unhealthy", "error": str(e) or type(e).__name__}
+
+        base_urls = ollama_pool.base_urls
+        results = dict(zip(base_urls, await asyncio.gather(*(probe_node(url) for url in base_urls))))
+        healthy = [result for result in results.values() if result["status"] == "healthy"]
+        if len(results) == 1:
+            return next(iter(results.values()))
+        return {
+            "status": "healthy" if len(healthy) == len(results) else ("degraded" if healthy else "unhealthy"),
+            "models": healthy[0]["models"] if healthy else [],
+            "nodes": results
+        }
+
+    def _age(self) -> float:
+        return time.monotonic() - self._checked_at if self._checked_at is not None else float("inf")
+
+    def peek(self) -> Optional[Dict[str, Any]]:
+        """返回当前快照（可能为空），不触发探测"""
+        return self._snapshot
+
+    async def get_snapshot(self) -> Dict[str, Any]:
+        """获取最近的快照及其时效，尚无快照（或后台任务未运行且快照过期）时先刷新一次"""
+        if self._snapshot is None or (not self.running and self._age() > self.interval):
+            await self.refresh()
+        age = self._age()
+        return {
+            **self._snapshot,
+            "age_seconds": round(age, 3),
+            "stale": age > self.interval * 2 + self.timeout
+        }
+
+
+# 全局健康检查实例
+health_monitor = HealthMonitor(
+    interval=settings.health_refresh_interval,
+    timeout=settings.health_probe_timeout
+)
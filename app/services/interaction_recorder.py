@@ -0,0 +1,187 @@
+"""
+Agent交互记录服务
+
+采用写后（write-behind）方式：请求路径上只把记录放入内存缓冲区，
+后台任务按条数或时间阈值批量写入数据库。缓冲区有上限，超出时丢弃并计数。
+"""
+import gzip
+import uuid
+import asyncio
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.serialization import dumps
+
+# 导出时每批读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+# 导出的字段
+EXPORT_FIELDS = (
+    "id", "created_at", "request_id", "agent_name", "agent_type", "provider",
+    "model_used", "prompt", "response", "tokens_used", "latency"
+)
+
+
+class InteractionRecorder:
+    """Agent交互记录器"""
+
+    def __init__(
+        self,
+        max_buffer: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 2.0
+    ):
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def record(self, **fields) -> bool:
+        """记录一次交互（非阻塞），缓冲区已满或记录器未启动时返回False"""
+        if not self.running:
+            return False
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return False
+
+        fields.setdefault("created_at", datetime.utcnow())
+        fields.setdefault("updated_at", fields["created_at"])
+        self._buffer.append(fields)
+        self.recorded += 1
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def start(self):
+        """启动后台写入任务"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("交互记录器已启动")
+
+    async def stop(self):
+        """停止后台任务并写入剩余记录
+
+        不取消后台任务：正在进行的批量写入完成后任务自行退出，避免已从缓冲区取出的记录丢失。
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+        logger.info(f"交互记录器已停止: {self.get_stats()}")
+
+    async def _run(self):
+        """按条数或时间阈值触发批量写入"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """将缓冲区中的记录分批写入数据库"""
+        if not self._buffer:
+            return
+        from app.models.interaction import Interaction
+        from app.utils.database import bulk_insert
+
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                try:
+                    await bulk_insert(Interaction, batch, chunk_size=self.batch_size)
+                    self.flushed += len(batch)
+                except asyncio.CancelledError:
+                    # 写入被取消（事务未提交），放回缓冲区头部，由下一次写入处理
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                except Exception as e:
+                    self.failed += len(batch)
+                    logger.error(f"交互记录写入失败，丢弃 {len(batch)} 条: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取记录器统计信息"""
+        return {
+            "running": self.running,
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed
+        }
+
+    async def export_jsonl(self, start: datetime, end: datetime, path: Optional[str] = None) -> Dict[str, Any]:
+        """将时间范围内的交互记录导出为gzip压缩的JSONL文件"""
+        from sqlalchemy import select
+        from app.models.interaction import Interaction
+        from app.utils.database import AsyncSessionLocal, get_async_engine
+
+        # 先写入缓冲区，保证导出包含最近的记录
+        await self.flush()
+
+        if path is None:
+            export_dir = Path(settings.interaction_export_dir)
+            # 同一时间范围可以多次导出，文件名带上导出时间和随机后缀，避免互相覆盖
+            suffix = f"{datetime.utcnow():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:8]}"
+            path = str(export_dir / f"interactions_{start:%Y%m%d%H%M%S}_{end:%Y%m%d%H%M%S}_{suffix}.jsonl.gz")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        columns = [getattr(Interaction, field) for field in EXPORT_FIELDS]
+        query = (
+            select(*columns)
+            .where(Interaction.created_at >= start, Interaction.created_at < end)
+            .order_by(Interaction.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        count = 0
+        get_async_engine()
+        # 文件已存在时抛出 FileExistsError，不覆盖已有的导出
+        output = await asyncio.to_thread(gzip.open, path, "xb", 6)
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.stream(query)
+                async for rows in result.partitions(EXPORT_BATCH_SIZE):
+                    chunk = b"".join(dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+                    # 压缩和写盘放到线程中执行
+                    await asyncio.to_thread(output.write, chunk)
+                    count += len(rows)
+        finally:
+            await asyncio.to_thread(output.close)
+
+        logger.info(f"导出交互记录 {count} 条到 {path}")
+        return {"path": path, "count": count}
+
+
+# 全局交互记录器
+interaction_recorder = InteractionRecorder(
+    max_buffer=settings.interaction_buffer_size,
+    batch_size=settings.interaction_batch_size,
+    flush_interval=settings.interaction_flush_interval
+)
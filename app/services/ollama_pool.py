@@ -0,0 +1,204 @@
+"""
+Ollama多节点负载均衡模块
+
+把请求分发到多个Ollama节点：
+- 带会话亲和键的请求按一致性哈希选择节点，后续轮次落在仍持有KV缓存的节点上；
+  目标节点负载明显高于平均水平时顺延到哈希环上的下一个节点（有界负载一致性哈希）
+- 其余请求按 未完成请求数/权重 最小的节点分发，同等负载下优先已加载所需模型的节点
+- 节点连续失败达到阈值后被摘除，摘除时间到期后重新接收请求，成功即恢复，再次失败则加倍摘除时间
+  （不超过 OLLAMA_EJECT_MAX_SECONDS）；请求成功或健康探测成功后摘除时间恢复为初始值
+"""
+import time
+import random
+import bisect
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+from loguru import logger
+
+from app.core.config import settings
+from app.services.ollama_residency import residency_manager, ModelResidency
+from app.utils.metrics import OLLAMA_NODE_OUTSTANDING, OLLAMA_NODE_REQUESTS, OLLAMA_NODE_EJECTIONS
+
+# 每单位权重在哈希环上的虚拟节点数
+VIRTUAL_NODES_PER_WEIGHT = 100
+
+
+def parse_nodes(value: str, default_url: str) -> List[Tuple[str, float]]:
+    """解析节点配置，如 "http://gpu1:11434=2,http://gpu2:11434"（=后为权重，默认1）"""
+    nodes = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, weight = item, 1.0
+        if "=" in item:
+            head, tail = item.rsplit("=", 1)
+            try:
+                url, weight = head, float(tail)
+            except ValueError:
+                pass
+        nodes.append((url.rstrip("/"), weight))
+    return nodes or [(default_url, 1.0)]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class OllamaNode:
+    """单个Ollama节点的状态"""
+
+    def __init__(self, base_url: str, weight: float = 1.0):
+        self.base_url = base_url
+        self.weight = max(weight, 0.01)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.eject_seconds = settings.ollama_eject_seconds
+        self.ejected_until = 0.0
+
+    @property
+    def residency(self) -> ModelResidency:
+        return residency_manager.get(self.base_url)
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    @property
+    def load(self) -> float:
+        return self.outstanding / self.weight
+
+    def get_stats(self) -> Dict[str, Any]:
+        remaining = self.ejected_until - time.monotonic()
+        return {
+            "base_url": self.base_url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected_for_seconds": round(remaining, 1) if remaining > 0 else 0
+        }
+
+
+class OllamaPool:
+    """Ollama节点池"""
+
+    def __init__(self, nodes: List[Tuple[str, float]]):
+        self.nodes = [OllamaNode(url, weight) for url, weight in nodes]
+        self._ring: List[Tuple[int, OllamaNode]] = sorted(
+            (_hash(f"{node.base_url}#{i}"), node)
+            for node in self.nodes
+            for i in range(max(1, int(VIRTUAL_NODES_PER_WEIGHT * node.weight)))
+        )
+        self._ring_keys = [key for key, _ in self._ring]
+
+    @property
+    def base_urls(self) -> List[str]:
+        return [node.base_url for node in self.nodes]
+
+    def _candidates(self, exclude: Optional[OllamaNode]) -> List[OllamaNode]:
+        nodes = [node for node in self.nodes if node is not exclude]
+        available = [node for node in nodes if node.available]
+        # 所有节点都被摘除时仍然尝试，避免完全不可用
+        return available or nodes or self.nodes
+
+    def select(self, affinity_key: Optional[str] = None, model: Optional[str] = None,
+               exclude: Optional[OllamaNode] = None) -> OllamaNode:
+        """选择节点"""
+        candidates = self._candidates(exclude)
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if affinity_key:
+            node = self._select_by_hash(affinity_key, candidates)
+            if node is not None:
+                return node
+
+        def score(node: OllamaNode):
+            # 负载优先，其次优先已加载所需模型的节点
+            loaded = (model or node.residency.choose_model(None)) in node.residency.loaded
+            return (node.load, not loaded, random.random())
+
+        return min(candidates, key=score)
+
+    def _select_by_hash(self, affinity_key: str, candidates: List[OllamaNode]) -> Optional[OllamaNode]:
+        """一致性哈希选择节点，跳过不可用和负载过高的节点"""
+        allowed = set(map(id, candidates))
+        total_weight = sum(node.weight for node in candidates)
+        average = sum(node.outstanding for node in candidates) / total_weight
+        limit = settings.ollama_affinity_load_factor * (average + 1)
+
+        start = bisect.bisect(self._ring_keys, _hash(affinity_key))
+        seen = set()
+        for i in range(len(self._ring)):
+            node = self._ring[(start + i) % len(self._ring)][1]
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if id(node) in allowed and node.load < limit:
+                return node
+            if len(seen) == len(self.nodes):
+                break
+        return None
+
+    @asynccontextmanager
+    async def lease(self, node: OllamaNode) -> AsyncIterator[OllamaNode]:
+        """占用节点执行一次请求，统计未完成请求数"""
+        node.outstanding += 1
+        node.requests += 1
+        OLLAMA_NODE_OUTSTANDING.labels(node.base_url).set(node.outstanding)
+        try:
+            yield node
+        finally:
+            node.outstanding -= 1
+            OLLAMA_NODE_OUTSTANDING.labels(node.base_url).set(node.outstanding)
+
+    def report_success(self, node: OllamaNode):
+        """请求成功，恢复节点"""
+        OLLAMA_NODE_REQUESTS.labels(node.base_url, "success").inc()
+        if node.consecutive_failures:
+            if node.ejected_until:
+                logger.info(f"Ollama节点已恢复: {node.base_url}")
+            node.consecutive_failures = 0
+            node.eject_seconds = settings.ollama_eject_seconds
+            node.ejected_until = 0.0
+
+    def report_failure(self, node: OllamaNode, error: Exception):
+        """请求失败（连接错误或5xx），连续失败达到阈值时摘除节点"""
+        OLLAMA_NODE_REQUESTS.labels(node.base_url, "error").inc()
+        node.errors += 1
+        node.consecutive_failures += 1
+        if node.consecutive_failures < settings.ollama_eject_failures:
+            return
+
+        now = time.monotonic()
+        if now < node.ejected_until:
+            # 摘除期间完成的请求（摘除前发出的请求，或所有节点都被摘除时的兜底请求）失败，不延长摘除
+            return
+        if node.ejected_until:
+            # 摘除到期后的试探请求再次失败，加倍摘除时间
+            node.eject_seconds = min(node.eject_seconds * 2, settings.ollama_eject_max_seconds)
+        node.ejected_until = now + node.eject_seconds
+        OLLAMA_NODE_EJECTIONS.labels(node.base_url).inc()
+        logger.warning(
+            f"Ollama节点已摘除 {node.eject_seconds:.0f}秒: {node.base_url}"
+            f"（连续失败 {node.consecutive_failures} 次，最近错误: {error!r}）"
+        )
+
+    def report_probe_success(self, base_url: str):
+        """健康探测成功，摘除时间恢复为初始值（当前的摘除仍然有效，到期后由请求确认恢复）"""
+        for node in self.nodes:
+            if node.base_url == base_url and node.eject_seconds != settings.ollama_eject_seconds:
+                logger.info(f"Ollama节点探测成功，重置摘除时间: {base_url}")
+                node.eject_seconds = settings.ollama_eject_seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"nodes": [node.get_stats() for node in self.nodes]}
+
+
+# 全局节点池
+ollama_pool = OllamaPool(parse_nodes(settings.ollama_nodes, settings.ollama_base_url.rstrip("/")))
@@ -0,0 +1,238 @@
+"""
+Ollama模型驻留管理模块
+
+同一台Ollama服务器上运行多个模型时，请求冷模型会挤掉热模型，双方都要付出数秒的加载时间。
+本模块跟踪服务器上已加载的模型（定时查询 /api/ps，并结合每次生成返回的 load_duration），
+为每个模型设置 keep_alive，常驻配置的热模型并在启动时预热，
+对未指定模型的请求优先路由到已加载的候选模型，同时记录模型加载/卸载事件及其耗时。
+"""
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Union
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.http_client import get_http_client
+from app.utils.metrics import OLLAMA_MODEL_LOADS, OLLAMA_MODEL_LOAD_SECONDS, OLLAMA_MODEL_UNLOADS, OLLAMA_MODEL_RESIDENT
+
+# load_duration 超过该值（秒）认为本次请求触发了模型加载
+COLD_LOAD_THRESHOLD = 0.5
+
+# 保留的最近事件数
+MAX_EVENTS = 200
+
+
+def parse_model_list(value: str) -> List[str]:
+    """解析逗号分隔的模型列表"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def parse_keep_alive_map(value: str) -> Dict[str, str]:
+    """解析按模型的keep_alive配置，如 "qwen2.5:7b=30m,llama3:8b=-1" """
+    result = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        model, keep_alive = item.rsplit("=", 1)
+        result[model.strip()] = keep_alive.strip()
+    return result
+
+
+class ModelResidency:
+    """单个Ollama节点的模型驻留状态"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.default_model = settings.ollama_model
+        self.default_keep_alive = settings.ollama_keep_alive
+        self.pinned = set(parse_model_list(settings.ollama_pinned_models))
+        self.keep_alive_map = parse_keep_alive_map(settings.ollama_model_keep_alive)
+        self.flexible_models = parse_model_list(settings.ollama_flexible_models) or [self.default_model]
+
+        # 已加载的模型 -> {"size_vram", "expires_at", "last_used", "loaded_at"}
+        self.loaded: Dict[str, Dict[str, Any]] = {}
+        self.events: deque = deque(maxlen=MAX_EVENTS)
+        self._refresh_lock = asyncio.Lock()
+        self._refreshed_at: Optional[float] = None
+
+    def keep_alive_for(self, model: str) -> Union[str, int]:
+        """模型的keep_alive：常驻模型为-1（不卸载），其次按模型配置，最后为默认值"""
+        if model in self.pinned:
+            return -1
+        return self.keep_alive_map.get(model, self.default_keep_alive)
+
+    def choose_model(self, requested: Optional[str] = None) -> str:
+        """选择模型：指定模型时原样使用，否则优先选择已加载的候选模型"""
+        if requested:
+            return requested
+        loaded = [model for model in self.flexible_models if model in self.loaded]
+        if loaded:
+            # 最近使用的模型最不容易被卸载
+            return max(loaded, key=lambda model: self.loaded[model].get("last_used", 0.0))
+        return self.flexible_models[0]
+
+    def observe(self, model: str, result: Dict[str, Any]):
+        """根据一次生成的结果更新驻留状态（load_duration 较大说明触发了加载）"""
+        now = time.time()
+        load_seconds = (result.get("load_duration") or 0) / 1e9
+        if load_seconds >= COLD_LOAD_THRESHOLD or model not in self.loaded:
+            if load_seconds >= COLD_LOAD_THRESHOLD:
+                self._record_load(model, load_seconds, source="request")
+                # 加载新模型可能挤掉了其他模型，尽快同步
+                self._schedule_refresh()
+            self.loaded.setdefault(model, {"loaded_at": now})
+            OLLAMA_MODEL_RESIDENT.labels(self.base_url, model).set(1)
+        self.loaded[model]["last_used"] = now
+
+    def _schedule_refresh(self):
+        task = asyncio.ensure_future(self.refresh())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def refresh(self):
+        """查询 /api/ps 同步已加载的模型，并记录期间发生的加载/卸载"""
+        if self._refresh_lock.locked():
+            return
+        async with self._refresh_lock:
+            client = get_http_client("ollama_admin", timeout=settings.health_probe_timeout)
+            response = await client.get(f"{self.base_url}/api/ps")
+            response.raise_for_status()
+            running = {item["name"]: item for item in response.json().get("models", [])}
+
+            now = time.time()
+            first_refresh = self._refreshed_at is None
+            for model in list(self.loaded):
+                if model not in running:
+                    self._record_unload(model)
+            for model, item in running.items():
+                state = self.loaded.get(model)
+                if state is None:
+                    # 首次同步前已加载的模型不算事件；之后出现的是其他客户端触发的加载，耗时未知
+                    if not first_refresh:
+                        self._record_load(model, None, source="ps")
+                    state = self.loaded[model] = {"loaded_at": now, "last_used": 0.0}
+                state["size_vram"] = item.get("size_vram")
+                state["expires_at"] = item.get("expires_at")
+                OLLAMA_MODEL_RESIDENT.labels(self.base_url, model).set(1)
+            self._refreshed_at = time.monotonic()
+
+    async def prewarm(self):
+        """预热常驻模型（空提示词请求只加载模型，不生成内容）"""
+        client = get_http_client("ollama_admin", timeout=settings.health_probe_timeout)
+        for model in self.pinned:
+            if model in self.loaded:
+                continue
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": model, "keep_alive": -1},
+                    timeout=settings.ollama_prewarm_timeout
+                )
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"预热模型 {model} 失败（{self.base_url}）: {e}")
+                continue
+            self._record_load(model, time.perf_counter() - start, source="prewarm")
+            self.loaded[model] = {"loaded_at": time.time(), "last_used": 0.0}
+            OLLAMA_MODEL_RESIDENT.labels(self.base_url, model).set(1)
+
+    def _record_load(self, model: str, seconds: Optional[float], source: str):
+        OLLAMA_MODEL_LOADS.labels(self.base_url, model, source).inc()
+        if seconds is not None:
+            OLLAMA_MODEL_LOAD_SECONDS.labels(self.base_url, model).observe(seconds)
+        self.events.append({
+            "time": datetime.utcnow().isoformat() + "Z",
+            "event": "load",
+            "model": model,
+            "source": source,
+            "seconds": round(seconds, 3) if seconds is not None else None
+        })
+        logger.info(
+            "Ollama模型加载: {} ({}，来源: {}，耗时: {})",
+            model, self.base_url, source, f"{seconds:.2f}秒" if seconds is not None else "未知"
+        )
+
+    def _record_unload(self, model: str):
+        state = self.loaded.pop(model)
+        OLLAMA_MODEL_UNLOADS.labels(self.base_url, model).inc()
+        OLLAMA_MODEL_RESIDENT.labels(self.base_url, model).set(0)
+        resident_seconds = time.time() - state["loaded_at"]
+        self.events.append({
+            "time": datetime.utcnow().isoformat() + "Z",
+            "event": "unload",
+            "model": model,
+            "resident_seconds": round(resident_seconds, 1)
+        })
+        logger.info(f"Ollama模型卸载: {model} ({self.base_url})，驻留 {resident_seconds:.0f}秒")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """驻留状态"""
+        return {
+            "base_url": self.base_url,
+            "loaded": {
+                model: {**state, "pinned": model in self.pinned, "keep_alive": self.keep_alive_for(model)}
+                for model, state in self.loaded.items()
+            },
+            "pinned": sorted(self.pinned),
+            "flexible_models": self.flexible_models,
+            "refreshed_seconds_ago": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None,
+            "events": list(self.events)
+        }
+
+
+class ResidencyManager:
+    """所有Ollama节点的模型驻留管理，后台定时刷新"""
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self.nodes: Dict[str, ModelResidency] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, base_url: str) -> ModelResidency:
+        """获取节点的驻留状态"""
+        node = self.nodes.get(base_url)
+        if node is None:
+            node = self.nodes[base_url] = ModelResidency(base_url)
+        return node
+
+    async def start(self, base_urls: List[str]):
+        """同步一次驻留状态、预热常驻模型并启动后台刷新"""
+        if self._task is not None:
+            return
+        for base_url in base_urls:
+            self.get(base_url)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Ollama模型驻留管理已启动，刷新间隔 {self.interval}秒")
+
+    async def stop(self):
+        """停止后台刷新"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        await self._refresh_all()
+        await asyncio.gather(*(node.prewarm() for node in self.nodes.values()))
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._refresh_all()
+
+    async def _refresh_all(self):
+        results = await asyncio.gather(*(node.refresh() for node in self.nodes.values()), return_exceptions=True)
+        for node, result in zip(self.nodes.values(), results):
+            if isinstance(result, Exception):
+                logger.debug("查询Ollama已加载模型失败 ({}): {}", node.base_url, result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {base_url: node.get_stats() for base_url, node in self.nodes.items()}
+
+
+# 全局驻留管理实例
+residency_manager = ResidencyManager(interval=settings.ollama_residency_refresh_interval)
@@ -0,0 +1,245 @@
+"""
+录制/回放AI服务
+
+录制模式下包装真实的提供商，把请求与响应（包括流式分块的时间）追加写入JSONL文件；
+回放模式下按请求哈希查找并返回录制的响应，可按录制速度回放或尽快返回。
+
+文件格式:
+    recordings.jsonl      每行一条记录 {"key", "request", "result", "chunks": [[秒, 文本], ...]}
+    recordings.jsonl.idx  索引，每行一条 [key, 偏移, 长度]，随记录追加（同一key以最后一条为准）
+
+加载时只读取索引，查找时按偏移读取单条记录，大量录制数据也能快速加载。
+文件读写都在线程中执行，不阻塞事件循环；每条记录只追加一行索引，不重写整个索引文件。
+"""
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, AsyncIterator
+from loguru import logger
+
+from app.core.config import settings
+from app.services.ai_service import AIService, AIServiceFactory
+from app.utils.serialization import dumps
+from app.utils.cancellation import aclosing
+
+
+def request_key(prompt: str, **kwargs) -> str:
+    """计算请求哈希（提示词、模型及结构化消息）"""
+    payload = {
+        "prompt": prompt,
+        "model": kwargs.get("model"),
+        "messages": kwargs.get("messages"),
+    }
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ReplayStore:
+    """带偏移索引的录制文件（同步方法会阻塞，在事件循环中请使用 get_async/append_async）"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.index_path = Path(f"{path}.idx")
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._indexed_size = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _load_index(self):
+        """加载索引，并补齐索引之后追加的记录"""
+        if self.index_path.exists():
+            try:
+                self._read_index()
+            except (ValueError, TypeError) as e:
+                logger.warning(f"回放索引损坏，重新构建: {e}")
+                self._index, self._indexed_size = {}, 0
+                self._rewrite_index()
+
+        if not self.path.exists():
+            self._index, self._indexed_size = {}, 0
+            return
+
+        data_size = self.path.stat().st_size
+        if data_size < self._indexed_size:
+            # 录制文件被截断或替换
+            self._index, self._indexed_size = {}, 0
+            self._rewrite_index()
+        if data_size > self._indexed_size:
+            with open(self.index_path, "ab") as index_file:
+                self._scan_from(self._indexed_size, index_file)
+
+    def _read_index(self):
+        data = self.index_path.read_bytes()
+        lines = data.split(b"\n")
+        for line in lines[:-1]:
+            key, offset, length = json.loads(line)
+            self._index[key] = (offset, length)
+            self._indexed_size = max(self._indexed_size, offset + length)
+        if lines[-1]:
+            # 末尾不完整的索引行（写入中断）：截掉后继续追加，对应的记录在扫描录制文件时补齐
+            self._rewrite_index()
+
+    def _rewrite_index(self):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".idx.tmp")
+        tmp_path.write_bytes(b"".join(
+            dumps([key, offset, length]) + b"\n" for key, (offset, length) in self._index.items()
+        ))
+        tmp_path.replace(self.index_path)
+
+    def _scan_from(self, offset: int, index_file):
+        """从指定偏移扫描录制文件，补齐索引"""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    # 末尾不完整的记录（写入中断）
+                    break
+                try:
+                    key = json.loads(line)["key"]
+                except (ValueError, KeyError):
+                    offset += len(line)
+                    continue
+                self._index[key] = (offset, len(line))
+                index_file.write(dumps([key, offset, len(line)]) + b"\n")
+                offset += len(line)
+        self._indexed_size = offset
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """按请求哈希读取记录"""
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def append(self, record: Dict[str, Any]):
+        """追加一条记录及其索引行"""
+        line = dumps(record) + b"\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            with open(self.index_path, "ab") as f:
+                f.write(dumps([record["key"], offset, len(line)]) + b"\n")
+            self._index[record["key"]] = (offset, len(line))
+            self._indexed_size = offset + len(line)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """在线程中读取记录"""
+        if key not in self._index:
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def append_async(self, record: Dict[str, Any]):
+        """在线程中追加记录"""
+        await asyncio.to_thread(self.append, record)
+
+
+# 每个录制文件在进程内只加载一次
+_stores: Dict[str, ReplayStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: str) -> ReplayStore:
+    """获取录制文件（进程内共享，首次调用时同步加载索引）"""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ReplayStore(path)
+            logger.info(f"加载回放文件 {path}，共 {len(_stores[path])} 条记录")
+        return _stores[path]
+
+
+async def get_store_async(path: str) -> ReplayStore:
+    """获取录制文件，尚未加载时在线程中加载（读取索引、扫描录制文件）"""
+    store = _stores.get(path)
+    if store is None:
+        store = await asyncio.to_thread(get_store, path)
+    return store
+
+
+class ReplayService(AIService):
+    """录制/回放服务"""
+
+    def __init__(self):
+        super().__init__()
+        self.mode = settings.replay_mode
+        self.speed = settings.replay_speed
+        # 录制文件在首次调用时于线程中加载（启用回放时应用启动阶段已预先加载），构造时不读文件
+        self.path = settings.replay_file
+        self.inner = AIServiceFactory.get_service(settings.replay_inner_provider) if self.mode == "record" else None
+
+    async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """录制或回放一次完整响应"""
+        key = request_key(prompt, **kwargs)
+
+        if self.mode == "record":
+            result = await self.inner.generate_response(prompt, **kwargs)
+            await self._save(key, prompt, kwargs, result, [])
+            return result
+
+        record = await self._lookup(key)
+        if self.speed == "recorded":
+            await asyncio.sleep(record["result"].get("processing_time") or 0)
+        return self._replayed_result(record)
+
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """录制或回放流式响应（包括分块时间）"""
+        key = request_key(prompt, **kwargs)
+
+        if self.mode == "record":
+            start = time.perf_counter()
+            chunks = []
+            async with aclosing(self.inner.stream_response(prompt, **kwargs)) as events:
+                async for event in events:
+                    if event["type"] == "delta":
+                        chunks.append([round(time.perf_counter() - start, 4), event["content"]])
+                    else:
+                        await self._save(key, prompt, kwargs, event["result"], chunks)
+                    yield event
+            return
+
+        record = await self._lookup(key)
+        chunks = record.get("chunks") or [[record["result"].get("processing_time") or 0, record["result"]["response"]]]
+        start = time.perf_counter()
+        for offset, content in chunks:
+            if self.speed == "recorded":
+                delay = offset - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield {"type": "delta", "content": content}
+        yield {"type": "done", "result": self._replayed_result(record)}
+
+    async def _lookup(self, key: str) -> Dict[str, Any]:
+        store = await get_store_async(self.path)
+        record = await store.get_async(key)
+        if record is None:
+            raise ValueError(f"回放文件中没有该请求的录制: {key}")
+        return record
+
+    async def _save(self, key: str, prompt: str, kwargs: Dict[str, Any], result: Dict[str, Any], chunks: list):
+        store = await get_store_async(self.path)
+        await store.append_async({
+            "key": key,
+            "request": {"prompt": prompt, "model": kwargs.get("model"), "messages": kwargs.get("messages")},
+            "result": result,
+            "chunks": chunks
+        })
+
+    @staticmethod
+    def _replayed_result(record: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(record["result"])
+        result["provider"] = "replay"
+        return result
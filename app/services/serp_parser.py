@@ -0,0 +1,120 @@
+"""
+搜索结果页解析模块
+
+把Bing搜索结果页（HTML）解析为 title/snippet/url 结果。解析是CPU密集的同步操作，
+在独立的有界线程池中执行（lxml解析期间会释放GIL），不阻塞事件循环，
+也不占用 asyncio.to_thread 使用的默认线程池。lxml在首次解析时才导入，避免拖慢应用启动。
+"""
+import asyncio
+import base64
+import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from app.core.config import settings
+
+# 广告结果的class（整条广告或广告标记）
+AD_CLASSES = ("b_ad", "b_adSlug", "b_adTop", "b_adBottom")
+
+_AD_XPATH = " or ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in AD_CLASSES)
+
+# 自然结果（排除广告容器中的结果）、标题链接、摘要
+RESULTS_XPATH = (
+    "//li[contains(concat(' ', normalize-space(@class), ' '), ' b_algo ')]"
+    f"[not(ancestor-or-self::*[{_AD_XPATH}])][not(.//*[{_AD_XPATH}])]"
+)
+TITLE_XPATH = ".//h2//a[@href][1]"
+SNIPPET_XPATH = (
+    ".//div[contains(@class, 'b_caption')]//p[1]"
+    " | .//p[contains(@class, 'b_lineclamp')][1]"
+    " | .//div[contains(@class, 'b_snippet')][1]"
+)
+
+# 编译后的XPath对象不能跨线程共享，每个解析线程各编译一份
+_local = threading.local()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _compiled_xpaths() -> Tuple[Any, Any, Any]:
+    xpaths = getattr(_local, "xpaths", None)
+    if xpaths is None:
+        from lxml import etree
+        xpaths = _local.xpaths = (etree.XPath(RESULTS_XPATH), etree.XPath(TITLE_XPATH), etree.XPath(SNIPPET_XPATH))
+    return xpaths
+
+
+def _text(element) -> str:
+    return " ".join(element.text_content().split())
+
+
+def _resolve_url(href: str) -> str:
+    """还原Bing跳转链接（/ck/a?...&u=a1<base64url>）中的目标地址"""
+    parts = urlsplit(href)
+    if not parts.path.startswith("/ck/a"):
+        return href
+    target = parse_qs(parts.query).get("u", [""])[0]
+    if not target.startswith("a1"):
+        return href
+    encoded = target[2:]
+    try:
+        url = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        return href
+    return url if url.startswith(("http://", "https://")) else href
+
+
+def parse_bing(html: bytes, max_results: int = 10) -> List[Dict[str, Any]]:
+    """解析Bing搜索结果页，跳过广告位中的结果，最多返回 max_results 条"""
+    import lxml.html
+    from lxml import etree
+
+    if not html:
+        return []
+    try:
+        document = lxml.html.fromstring(html)
+    except (etree.ParserError, ValueError):
+        return []
+
+    results_xpath, title_xpath, snippet_xpath = _compiled_xpaths()
+    results = []
+    for item in results_xpath(document):
+        links = title_xpath(item)
+        if not links:
+            continue
+        link = links[0]
+        url = _resolve_url(link.get("href", ""))
+        if not url.startswith(("http://", "https://")):
+            continue
+        snippets = snippet_xpath(item)
+        results.append({
+            "title": _text(link),
+            "snippet": _text(snippets[0]) if snippets else "",
+            "url": url,
+            "engine": "bing"
+        })
+        if len(results) >= max_results:
+            break
+    return results
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.search_parse_workers, thread_name_prefix="serp-parser")
+    return _executor
+
+
+async def parse_bing_async(html: bytes, max_results: int = 10) -> List[Dict[str, Any]]:
+    """在解析线程池中解析Bing搜索结果页"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), parse_bing, html, max_results)
+
+
+def shutdown_parser_pool():
+    """关闭解析线程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
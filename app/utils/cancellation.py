@@ -0,0 +1,69 @@
+"""
+客户端断开检测与取消传播
+
+普通HTTP请求在处理期间同时监听 http.disconnect 消息，客户端断开后立即取消处理任务，
+取消沿 Agent → AI服务 传递，上游的HTTP流随之关闭，模型不再继续生成。
+流式生成在每一层都通过 aclosing() 迭代，外层停止迭代时内层生成器会立即关闭，
+而不是等到垃圾回收时才释放上游连接。
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Awaitable, TypeVar
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """客户端在响应返回前断开连接"""
+    pass
+
+
+@asynccontextmanager
+async def aclosing(agen):
+    """退出时关闭异步生成器（Python 3.10以下没有 contextlib.aclosing）"""
+    try:
+        yield agen
+    finally:
+        await agen.aclose()
+
+
+async def _wait_disconnect(request: Request):
+    """等待客户端断开（请求体已读完后，receive() 只会在断开时返回）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """执行awaitable，客户端先断开时取消它并抛出 ClientDisconnected"""
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait((work, watcher), return_when=asyncio.FIRST_COMPLETED)
+        if work.done():
+            return work.result()
+        work.cancel()
+        try:
+            await work
+        except asyncio.CancelledError:
+            pass
+        raise ClientDisconnected()
+    finally:
+        for task in (work, watcher):
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(work, watcher, return_exceptions=True)
+
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """响应结束（包括客户端断开）时立即关闭内容生成器，使取消沿生成器链传递到上游"""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with aclosing(self.body_iterator):
+            await super().__call__(scope, receive, send)
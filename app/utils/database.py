@@ -1,26 +1,107 @@
 """
 数据库工具模块
+
+同时提供同步和异步两套引擎：异步引擎供FastAPI路由和后台任务使用，
+同步引擎保留给脚本和旧代码。引擎在首次使用时才创建。
 """
-from sqlalchemy import create_engine
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Type
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from app.core.config import settings
 from app.models.base import Base
+from app.models import agent, interaction  # noqa: F401  注册数据表
+
+# 异步驱动映射
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+# 会话工厂（引擎创建后绑定）
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+
+def is_sqlite(url: str) -> bool:
+    """是否为SQLite数据库"""
+    return url.startswith("sqlite")
+
+
+def to_async_url(url: str) -> str:
+    """将数据库URL转换为对应的异步驱动URL"""
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme:
+        return url
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """按数据库类型生成连接池参数"""
+    options: Dict[str, Any] = {"echo": settings.debug}
+    if is_sqlite(url):
+        if ":memory:" in url or url.rstrip("/").endswith("sqlite:"):
+            # 内存数据库只能共享同一个连接
+            options["poolclass"] = StaticPool
+            options["connect_args"] = {"check_same_thread": False}
+    else:
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=True
+        )
+    return options
+
+
+def _enable_sqlite_pragmas(engine: Engine):
+    """为SQLite连接启用WAL模式，读写可以并发进行"""
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.db_pool_timeout * 1000)}")
+        cursor.close()
 
-# 创建数据库引擎
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {},
-    poolclass=StaticPool if "sqlite" in settings.database_url else None,
-    echo=settings.debug
-)
 
-# 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_engine() -> Engine:
+    """获取同步数据库引擎"""
+    global _engine
+    if _engine is None:
+        options = _engine_options(settings.database_url)
+        if is_sqlite(settings.database_url):
+            options.setdefault("connect_args", {"check_same_thread": False})
+        _engine = create_engine(settings.database_url, **options)
+        if is_sqlite(settings.database_url):
+            _enable_sqlite_pragmas(_engine)
+        SessionLocal.configure(bind=_engine)
+    return _engine
 
 
-def get_db() -> Session:
-    """获取数据库会话"""
+def get_async_engine() -> AsyncEngine:
+    """获取异步数据库引擎"""
+    global _async_engine
+    if _async_engine is None:
+        url = to_async_url(settings.database_url)
+        _async_engine = create_async_engine(url, **_engine_options(url))
+        if is_sqlite(url):
+            _enable_sqlite_pragmas(_async_engine.sync_engine)
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+
+def get_db() -> Iterator[Session]:
+    """获取同步数据库会话"""
+    get_engine()
     db = SessionLocal()
     try:
         yield db
@@ -28,11 +109,48 @@ def get_db() -> Session:
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """获取异步数据库会话（FastAPI依赖）"""
+    get_async_engine()
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def bulk_insert(model: Type[Base], rows: Sequence[Dict[str, Any]], chunk_size: int = 500) -> int:
+    """在单个事务中批量插入数据，返回插入行数"""
+    if not rows:
+        return 0
+
+    get_async_engine()
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            for start in range(0, len(rows), chunk_size):
+                await session.execute(insert(model), list(rows[start:start + chunk_size]))
+    return len(rows)
+
+
 def create_tables():
     """创建数据库表"""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
 
 
 def drop_tables():
     """删除数据库表"""
-    Base.metadata.drop_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.drop_all(bind=get_engine())
+
+
+async def create_tables_async():
+    """异步创建数据库表"""
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def dispose_engines():
+    """关闭数据库连接池"""
+    global _engine, _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
@@ -0,0 +1,138 @@
+"""
+请求截止时间模块
+
+调用方通过 X-Request-Timeout 请求头或请求体的 timeout 字段设置本次请求的预算（秒），
+截止时间保存在contextvars中随请求传递。搜索、向量化、LLM调用等各阶段只使用剩余的预算作为超时，
+超过截止时间时返回 504，而不是等到各阶段固定的超时后返回通用错误。
+"""
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+import httpx
+
+from app.core.config import settings
+
+DEADLINE_HEADER = "x-request-timeout"
+
+# 判断超时是否由截止时间引起时允许的误差（秒）
+DEADLINE_SLACK = 0.05
+
+T = TypeVar("T")
+
+# 当前请求的截止时间（time.monotonic()）
+_deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求超过截止时间"""
+    pass
+
+
+def request_timeout(header: Optional[str] = None, field: Optional[float] = None) -> Optional[float]:
+    """根据请求头和请求字段确定预算（取较小值），都未设置时使用 REQUEST_TIMEOUT
+
+    请求头不是正数时抛出 ValueError。
+    """
+    values = []
+    if header is not None:
+        value = float(header)
+        if not value > 0:
+            raise ValueError(f"{DEADLINE_HEADER} 必须为正数")
+        values.append(value)
+    if field is not None:
+        values.append(field)
+    if not values and settings.request_timeout > 0:
+        values.append(settings.request_timeout)
+    return min(values) if values else None
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[None]:
+    """在上下文内设置截止时间（外层已有更早的截止时间时保持不变）"""
+    current = _deadline_var.get()
+    if timeout is None or (current is not None and current <= time.monotonic() + timeout):
+        yield
+        return
+    token = _deadline_var.set(time.monotonic() + timeout)
+    try:
+        yield
+    finally:
+        _deadline_var.reset(token)
+
+
+def set_deadline(timeout: Optional[float]):
+    """为当前上下文设置截止时间且不恢复
+
+    用于流式响应：响应体在路由函数返回后才在同一请求任务中生成，无法用 deadline_scope 包住。
+    """
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        current = _deadline_var.get()
+        if current is None or deadline < current:
+            _deadline_var.set(deadline)
+
+
+def current_deadline() -> Optional[float]:
+    """当前上下文的截止时间（time.monotonic()），未设置时返回None"""
+    return _deadline_var.get()
+
+
+def replace_deadline(deadline: Optional[float]):
+    """把当前上下文的截止时间替换为 deadline（可以延后或取消，None表示不限）
+
+    只用于独立任务中代表多个请求执行的工作（如合并的一轮对话），各请求仍各自受自己的截止时间约束。
+    """
+    _deadline_var.set(deadline)
+
+
+def remaining() -> Optional[float]:
+    """剩余预算（秒），未设置截止时间时返回None"""
+    deadline = _deadline_var.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """是否已超过截止时间"""
+    left = remaining()
+    return left is not None and left <= DEADLINE_SLACK
+
+
+def stage_timeout(default: float) -> float:
+    """本阶段的超时：default 与剩余预算中的较小值，预算已用完时抛出 DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= DEADLINE_SLACK:
+        raise DeadlineExceeded()
+    return min(default, left)
+
+
+def is_deadline_timeout(error: BaseException) -> bool:
+    """超时错误是否由截止时间引起（这类超时不代表上游节点故障）"""
+    return isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)) and expired()
+
+
+async def run_with_deadline(awaitable: Awaitable[T]) -> T:
+    """在截止时间内执行awaitable，超时或各阶段因截止时间失败时抛出 DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= DEADLINE_SLACK:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded() from None
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if expired():
+            raise DeadlineExceeded() from e
+        raise
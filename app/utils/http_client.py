@@ -0,0 +1,33 @@
+"""
+共享HTTP客户端模块
+
+httpx.AsyncClient 创建开销较大（SSL上下文等），且每个客户端都有独立的连接池。
+按用途共享客户端，复用连接，应用关闭时统一释放。
+"""
+from typing import Dict
+import httpx
+
+from app.core.config import settings
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(name: str = "default", **options) -> httpx.AsyncClient:
+    """获取指定用途的共享客户端，首次调用时按options创建"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        options.setdefault("limits", httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections
+        ))
+        client = httpx.AsyncClient(**options)
+        _clients[name] = client
+    return client
+
+
+async def close_http_clients():
+    """关闭所有共享客户端"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
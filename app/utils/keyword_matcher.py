@@ -0,0 +1,85 @@
+"""
+多关键词匹配模块
+
+把一组关键词编译成前缀树，再把前缀树转换为一个正则表达式（Aho-Corasick式的单趟匹配），
+由C实现的正则引擎在文本上扫描一遍即可找出任意关键词，耗时基本不随关键词数量增长；
+逐个关键词执行 `in` 的耗时则与关键词数量成正比。
+
+匹配不区分大小写。纯ASCII关键词按整词匹配（"ad" 不会匹配 "read"），
+中日韩等其他关键词按子串匹配。同一组关键词只编译一次。
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ASCII关键词两侧不能紧挨字母或数字
+_WORD_BEFORE = r"(?<![0-9a-z_])"
+_WORD_AFTER = r"(?![0-9a-z_])"
+
+# 编译结果缓存的关键词组数量上限
+MATCHER_CACHE_SIZE = 64
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """把关键词转换为前缀树形式的正则（同一前缀只出现一次，分支按最长匹配优先）"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # 当前节点本身是一个完整关键词时，后续部分可选（贪婪，优先匹配更长的关键词）
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """编译后的多关键词匹配器"""
+
+    __slots__ = ("keywords", "_pattern")
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Tuple[str, ...] = tuple(sorted({k.strip().lower() for k in keywords if k and k.strip()}))
+        ascii_words = [k for k in self.keywords if k.isascii()]
+        other_words = [k for k in self.keywords if not k.isascii()]
+
+        alternatives = []
+        if ascii_words:
+            alternatives.append(_WORD_BEFORE + "(?:" + _trie_pattern(ascii_words) + ")" + _WORD_AFTER)
+        if other_words:
+            alternatives.append(_trie_pattern(other_words))
+        self._pattern = re.compile("|".join(alternatives) if alternatives else "(?!)")
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def search(self, text: str) -> Optional[str]:
+        """返回文本中出现的第一个关键词，没有时返回None"""
+        match = self._pattern.search(text.lower())
+        return match.group() if match else None
+
+    def findall(self, text: str) -> List[str]:
+        """返回文本中出现的所有关键词（不重叠，按出现顺序）"""
+        return self._pattern.findall(text.lower())
+
+    def match_prefix(self, text: str) -> Optional[str]:
+        """返回文本开头的最长关键词，开头不是关键词时返回None"""
+        match = self._pattern.match(text.lower())
+        return match.group() if match else None
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def _cached_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def get_matcher(keywords: Iterable[str]) -> KeywordMatcher:
+    """获取关键词组对应的匹配器（同一组关键词只编译一次）"""
+    return _cached_matcher(tuple(sorted(set(keywords))))
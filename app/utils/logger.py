@@ -2,51 +2,218 @@
 日志工具模块
 """
 import sys
+import copy
+import time
+import asyncio
+import queue
+import random
+import atexit
+import threading
 from pathlib import Path
+from typing import Dict, Callable, Any, List
 from loguru import logger
 from app.core.config import settings
 
+CONSOLE_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <magenta>{extra[request_id]}</magenta> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {extra[request_id]} | {name}:{function}:{line} - {message}"
+
+# 当前启用的后台sink，用于关闭时刷新
+_background_sinks: List["BackgroundSink"] = []
+
+
+class BackgroundSink:
+    """后台线程写入的日志sink
+
+    调用方线程只负责格式化并放入有界队列，磁盘写入、轮转和压缩都在后台线程执行。
+    队列满时丢弃日志并计数，不阻塞事件循环。
+    """
+
+    def __init__(self, write: Callable[[str], None], max_queue: int = 10000, name: str = "sink"):
+        self._write = write
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name=f"log-{name}", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message: str):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            # 批量取出队列中已有的日志，合并成一次写入
+            batch = [self._queue.get()]
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                messages = [message for message in batch if message is not None]
+                if messages:
+                    self._write("".join(messages))
+            except Exception as e:
+                sys.stderr.write(f"日志写入失败: {e}\n")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中已有的日志写完"""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def stop(self, timeout: float = 5.0):
+        """写完队列中剩余的日志后停止后台线程"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+def _file_writer(path: str, **options) -> Callable[[str], None]:
+    """创建写入文件的函数，复用loguru的轮转、保留和压缩能力"""
+    file_logger = copy.deepcopy(logger)
+    file_logger.remove()
+    file_logger.add(path, format="{message}", level=0, **options)
+    return file_logger.opt(raw=True).info
+
+
+def _stream_writer(stream) -> Callable[[str], None]:
+    """创建写入流的函数"""
+    def _write(message: str):
+        stream.write(message)
+        stream.flush()
+    return _write
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """解析按级别的采样率配置，如 "DEBUG=0.01,INFO=0.1" """
+    rates = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        level, rate = item.split("=", 1)
+        rates[level.strip().upper()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def make_sampling_filter(rates: Dict[str, float]) -> Callable[[Dict[str, Any]], bool]:
+    """创建按级别采样的日志过滤器，未配置的级别全部保留"""
+    if not rates:
+        return lambda record: True
+
+    def _filter(record: Dict[str, Any]) -> bool:
+        rate = rates.get(record["level"].name)
+        return rate is None or random.random() < rate
+
+    return _filter
+
+
+def get_dropped_count() -> int:
+    """获取后台队列已丢弃的日志条数"""
+    return sum(sink.dropped for sink in _background_sinks)
+
+
+def flush_background_sinks():
+    """等待所有后台sink写完已入队的日志"""
+    for sink in _background_sinks:
+        sink.flush()
+
+
+def stop_background_sinks():
+    """停止所有后台sink，确保剩余日志写出"""
+    while _background_sinks:
+        _background_sinks.pop().stop()
+
 
 def setup_logger():
     """设置日志配置"""
     # 移除默认的日志处理器
     logger.remove()
-    
+    stop_background_sinks()
+
+    # 未绑定请求ID时的默认值
+    logger.configure(extra={"request_id": "-"})
+
     # 创建日志目录
     log_dir = Path(settings.log_file).parent
     log_dir.mkdir(parents=True, exist_ok=True)
-    
+
+    sampling_filter = make_sampling_filter(parse_sample_rates(settings.log_sample_rates))
+    error_log_file = str(Path(settings.log_file).parent / "error.log")
+
+    if settings.log_enqueue:
+        def make_sink(write, name):
+            sink = BackgroundSink(write, max_queue=settings.log_queue_size, name=name)
+            _background_sinks.append(sink)
+            return sink
+
+        console_sink = make_sink(_stream_writer(sys.stdout), "console")
+        file_sink = make_sink(
+            _file_writer(settings.log_file, rotation="10 MB", retention="7 days", compression="zip"),
+            "file"
+        )
+        error_sink = make_sink(
+            _file_writer(error_log_file, rotation="10 MB", retention="30 days", compression="zip"),
+            "error"
+        )
+        file_options = {}
+        error_options = {}
+    else:
+        console_sink = sys.stdout
+        file_sink = settings.log_file
+        error_sink = error_log_file
+        file_options = {"rotation": "10 MB", "retention": "7 days", "compression": "zip"}
+        error_options = {"rotation": "10 MB", "retention": "30 days", "compression": "zip"}
+
     # 添加控制台日志处理器
     logger.add(
-        sys.stdout,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+        console_sink,
+        format=CONSOLE_FORMAT,
         level=settings.log_level,
-        colorize=True
+        colorize=True,
+        filter=sampling_filter
     )
-    
+
     # 添加文件日志处理器
     logger.add(
-        settings.log_file,
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        file_sink,
+        format=FILE_FORMAT,
         level=settings.log_level,
-        rotation="10 MB",
-        retention="7 days",
-        compression="zip"
+        filter=sampling_filter,
+        serialize=settings.log_json,
+        **file_options
     )
-    
-    # 添加错误日志文件
-    error_log_file = Path(settings.log_file).parent / "error.log"
+
+    # 添加错误日志文件（错误日志不采样）
     logger.add(
-        str(error_log_file),
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        error_sink,
+        format=FILE_FORMAT,
         level="ERROR",
-        rotation="10 MB",
-        retention="30 days",
-        compression="zip"
+        serialize=settings.log_json,
+        **error_options
     )
-    
+
     return logger
 
 
+async def shutdown_logger():
+    """应用关闭时写出后台队列中剩余的日志"""
+    await logger.complete()
+    await asyncio.to_thread(flush_background_sinks)
+
+
+atexit.register(stop_background_sinks)
+
 # 初始化日志
-setup_logger() 
\ No newline at end of file
+setup_logger()
@@ -0,0 +1,152 @@
+"""
+事件循环延迟监控模块
+
+后台协程按固定间隔休眠，用实际唤醒时间与预期时间之差衡量事件循环延迟，并导出为监控指标；
+独立的看门狗线程检查协程心跳，事件循环被阻塞超过阈值时抓取事件循环线程当时的调用栈并记录日志，
+从而定位阻塞事件循环的同步代码（同步数据库会话、同步文件写入、HTML解析等）。
+调试模式下开启 asyncio 调试，按位置报告执行时间过长的回调。
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Dict, Any, Optional
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_LAG_CURRENT, EVENT_LOOP_STALLS
+
+
+class _AsyncioLogHandler(logging.Handler):
+    """把 asyncio 标准库日志（慢回调报告）转发到 loguru"""
+
+    def emit(self, record: logging.LogRecord):
+        logger.opt(depth=6).log(record.levelname, record.getMessage())
+
+
+class LoopMonitor:
+    """事件循环延迟监控与阻塞检测"""
+
+    def __init__(self, interval: float = 0.1, stall_threshold: float = 0.5, debug: bool = False):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.debug = debug
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._log_handler: Optional[logging.Handler] = None
+
+        # 心跳时间由监控协程更新，看门狗线程读取
+        self._heartbeat = 0.0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._stalls = 0
+
+    async def start(self):
+        """启动监控协程与看门狗线程"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop_event.clear()
+
+        if self.debug:
+            self._enable_debug()
+
+        self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"事件循环监控已启动，采样间隔 {self.interval}秒，阻塞阈值 {self.stall_threshold}秒")
+
+    async def stop(self):
+        """停止监控"""
+        if self._task is None:
+            return
+        self._stop_event.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+        if self._log_handler is not None:
+            logging.getLogger("asyncio").removeHandler(self._log_handler)
+            self._log_handler = None
+
+    def _enable_debug(self):
+        """开启asyncio调试模式，执行时间超过阈值的回调会按位置报告"""
+        self._loop.set_debug(True)
+        self._loop.slow_callback_duration = self.stall_threshold
+        self._log_handler = _AsyncioLogHandler(level=logging.WARNING)
+        asyncio_logger = logging.getLogger("asyncio")
+        asyncio_logger.addHandler(self._log_handler)
+        asyncio_logger.setLevel(logging.WARNING)
+        logger.warning(f"asyncio调试模式已开启，报告执行超过 {self.stall_threshold}秒 的回调")
+
+    async def _run(self):
+        """按固定间隔休眠，测量唤醒延迟"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self._last_lag = lag
+            if lag > self._max_lag:
+                self._max_lag = lag
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            EVENT_LOOP_LAG_CURRENT.set(lag)
+
+    def _watch(self):
+        """看门狗线程：心跳超时即认为事件循环被阻塞，抓取阻塞时的调用栈"""
+        reported_heartbeat = None
+        check_interval = min(self.interval, self.stall_threshold / 2)
+        while not self._stop_event.wait(check_interval):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.stall_threshold or heartbeat == reported_heartbeat:
+                continue
+            # 同一次阻塞只报告一次
+            reported_heartbeat = heartbeat
+            self._stalls += 1
+            EVENT_LOOP_STALLS.inc()
+            logger.warning(
+                "事件循环已阻塞 {:.3f}秒，阻塞位置:\n{}",
+                blocked_for, self._loop_stack() or "（无法获取调用栈）"
+            )
+
+    def _loop_stack(self) -> str:
+        """获取事件循环线程当前的调用栈"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return ""
+        return "".join(traceback.format_stack(frame))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """监控统计"""
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "stall_threshold": self.stall_threshold,
+            "debug": self.debug,
+            "last_lag_ms": round(self._last_lag * 1000, 2),
+            "max_lag_ms": round(self._max_lag * 1000, 2),
+            "stalls": self._stalls,
+        }
+
+
+# 全局监控实例
+loop_monitor = LoopMonitor(
+    interval=settings.loop_monitor_interval,
+    stall_threshold=settings.loop_stall_threshold,
+    debug=settings.loop_debug
+)
@@ -0,0 +1,186 @@
+"""
+监控指标模块
+"""
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# 响应序列化
+RESPONSE_SERIALIZE_SECONDS = Histogram(
+    "response_serialize_seconds",
+    "响应JSON序列化耗时（秒）",
+    ["route"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+RESPONSE_PAYLOAD_BYTES = Histogram(
+    "response_payload_bytes",
+    "响应体大小（字节）",
+    ["route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+
+# 事件循环
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟（秒）",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+EVENT_LOOP_LAG_CURRENT = Gauge(
+    "event_loop_lag_current_seconds",
+    "最近一次测得的事件循环延迟（秒）"
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls_total",
+    "事件循环阻塞超过阈值的次数"
+)
+
+# LLM
+LLM_PROMPT_TOKENS = Counter(
+    "llm_prompt_tokens_total",
+    "提示词token数（按是否命中提供商上下文缓存）",
+    ["provider", "cache"]
+)
+
+# Ollama模型驻留
+OLLAMA_MODEL_LOADS = Counter(
+    "ollama_model_loads_total",
+    "Ollama模型加载次数",
+    ["node", "model", "source"]
+)
+OLLAMA_MODEL_LOAD_SECONDS = Histogram(
+    "ollama_model_load_seconds",
+    "Ollama模型加载耗时（秒）",
+    ["node", "model"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+OLLAMA_MODEL_UNLOADS = Counter(
+    "ollama_model_unloads_total",
+    "Ollama模型卸载次数",
+    ["node", "model"]
+)
+OLLAMA_MODEL_RESIDENT = Gauge(
+    "ollama_model_resident",
+    "Ollama模型是否已加载（1为已加载）",
+    ["node", "model"]
+)
+
+# Ollama节点池
+OLLAMA_NODE_OUTSTANDING = Gauge(
+    "ollama_node_outstanding_requests",
+    "Ollama节点上未完成的请求数",
+    ["node"]
+)
+OLLAMA_NODE_REQUESTS = Counter(
+    "ollama_node_requests_total",
+    "Ollama节点请求数（按结果）",
+    ["node", "outcome"]
+)
+OLLAMA_NODE_EJECTIONS = Counter(
+    "ollama_node_ejections_total",
+    "Ollama节点被摘除的次数",
+    ["node"]
+)
+
+# 模型级联
+CASCADE_RESPONSES = Counter(
+    "cascade_responses_total",
+    "级联策略下各级模型给出最终回答的次数（reason为升级原因，未升级为accepted）",
+    ["agent_type", "tier", "reason"]
+)
+CASCADE_SECONDS = Histogram(
+    "cascade_processing_seconds",
+    "级联策略下的总处理耗时（秒，升级时包含小模型耗时）",
+    ["agent_type", "tier"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+)
+
+
+# Agent注册表
+AGENT_REGISTRY_RESIDENT = Gauge(
+    "agent_registry_resident",
+    "内存中的Agent数量"
+)
+AGENT_REGISTRY_SPILLED = Gauge(
+    "agent_registry_spilled",
+    "已换出到磁盘的Agent数量"
+)
+AGENT_EVICTIONS = Counter(
+    "agent_evictions_total",
+    "Agent换出到磁盘的次数（按原因）",
+    ["reason"]
+)
+AGENT_REHYDRATIONS = Counter(
+    "agent_rehydrations_total",
+    "从磁盘恢复Agent的次数"
+)
+
+
+# 文档检索
+DOCUMENT_CHUNKS_INDEXED = Counter(
+    "document_chunks_indexed_total",
+    "索引的文本块数（embedded为新生成向量，reused为复用未变化文本块的向量）",
+    ["result"]
+)
+DOCUMENT_SEARCH_SECONDS = Histogram(
+    "document_search_seconds",
+    "向量检索耗时（秒，不含查询向量化）",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+)
+
+
+# 请求取消与截止时间
+REQUESTS_CANCELLED = Counter(
+    "requests_cancelled_total",
+    "客户端断开或主动取消而中止生成的请求数（不计入错误）",
+    ["route"]
+)
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "超过截止时间的请求数",
+    ["route"]
+)
+SEARCH_ENGINES_SKIPPED = Counter(
+    "search_engines_skipped_total",
+    "剩余预算不足而跳过的搜索引擎调用次数",
+    ["engine"]
+)
+
+SEARCH_RESULTS_FILTERED = Counter(
+    "search_results_filtered_total",
+    "被识别为广告而过滤的搜索结果数",
+    ["engine"]
+)
+
+
+def render_metrics() -> bytes:
+    """导出Prometheus格式的指标"""
+    return generate_latest()
+
+
+__all__ = [
+    "RESPONSE_SERIALIZE_SECONDS",
+    "RESPONSE_PAYLOAD_BYTES",
+    "EVENT_LOOP_LAG_SECONDS",
+    "EVENT_LOOP_LAG_CURRENT",
+    "EVENT_LOOP_STALLS",
+    "LLM_PROMPT_TOKENS",
+    "OLLAMA_MODEL_LOADS",
+    "OLLAMA_MODEL_LOAD_SECONDS",
+    "OLLAMA_MODEL_UNLOADS",
+    "OLLAMA_MODEL_RESIDENT",
+    "OLLAMA_NODE_OUTSTANDING",
+    "OLLAMA_NODE_REQUESTS",
+    "OLLAMA_NODE_EJECTIONS",
+    "CASCADE_RESPONSES",
+    "CASCADE_SECONDS",
+    "AGENT_REGISTRY_RESIDENT",
+    "AGENT_REGISTRY_SPILLED",
+    "AGENT_EVICTIONS",
+    "AGENT_REHYDRATIONS",
+    "DOCUMENT_CHUNKS_INDEXED",
+    "DOCUMENT_SEARCH_SECONDS",
+    "REQUESTS_CANCELLED",
+    "DEADLINE_EXCEEDED",
+    "SEARCH_ENGINES_SKIPPED",
+    "SEARCH_RESULTS_FILTERED",
+    "CONTENT_TYPE_LATEST",
+    "render_metrics",
+]
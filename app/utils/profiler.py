@@ -0,0 +1,147 @@
+"""
+采样式性能分析模块
+
+在运行中的进程内以固定间隔采集所有线程（事件循环线程和线程池线程）的调用栈，
+输出折叠栈（collapsed stack）格式，可直接用于 flamegraph.pl / speedscope 等工具。
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional
+
+# 工作线程空闲等待时栈顶所在的 (模块文件, 函数)，默认不计入结果。
+# 按模块匹配，业务代码中同名的 get/acquire 等函数不会被当作空闲；
+# 线程池和aiosqlite线程空闲时停在C实现的队列get中，栈顶Python帧即其主循环。
+IDLE_FRAMES = frozenset({
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("concurrent/futures/thread.py", "_worker"),
+    ("aiosqlite/core.py", "_connection_worker_thread"),
+})
+
+# 同一时间只允许一个采样任务
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """已有采样任务在运行"""
+
+
+class StackSampler:
+    """统计式调用栈采样器"""
+
+    def __init__(self, interval: float = 0.01, include_idle: bool = False, max_depth: int = 128,
+                 loop_ident: Optional[int] = None):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.max_depth = max_depth
+        # 事件循环线程的栈总是计入（栈顶的阻塞调用正是要找的问题）
+        self.loop_ident = loop_ident
+        self._idle_codes: Dict[Any, bool] = {}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _is_idle(self, code) -> bool:
+        idle = self._idle_codes.get(code)
+        if idle is None:
+            filename = code.co_filename.replace("\\", "/")
+            idle = self._idle_codes[code] = any(
+                name == code.co_name and filename.endswith("/" + module) for module, name in IDLE_FRAMES
+            )
+        return idle
+
+    def _collapse(self, thread_name: str, frame, filter_idle: bool = True) -> Optional[str]:
+        """把调用栈折叠成 "线程;外层;...;内层" 形式"""
+        if filter_idle and not self.include_idle and self._is_idle(frame.f_code):
+            return None
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._frame_label(frame))
+            frame = frame.f_back
+        labels.append(thread_name)
+        labels.reverse()
+        return ";".join(label.replace(";", ":") for label in labels)
+
+    def sample_once(self, own_ident: int):
+        """采集一次所有线程的调用栈"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = self._collapse(names.get(ident, f"thread-{ident}"), frame, filter_idle=ident != self.loop_ident)
+            if stack:
+                self.stacks[stack] += 1
+        self.samples += 1
+
+    def run(self, seconds: float):
+        """在当前线程中采样指定时长"""
+        own_ident = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + seconds
+        next_tick = start
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_tick:
+                time.sleep(next_tick - now)
+            self.sample_once(own_ident)
+            next_tick += self.interval
+        self.duration = time.perf_counter() - start
+
+    def collapsed(self) -> str:
+        """折叠栈文本，每行 "栈 次数" """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        """采样结果摘要"""
+        return {
+            "samples": self.samples,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "unique_stacks": len(self.stacks),
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.stacks.most_common()]
+        }
+
+
+async def profile(seconds: float, interval: float = 0.01, include_idle: bool = False) -> StackSampler:
+    """在独立线程中采样，不占用事件循环和默认线程池"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("已有性能分析任务在运行")
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    sampler = StackSampler(interval=interval, include_idle=include_idle, loop_ident=threading.get_ident())
+
+    def _target():
+        try:
+            sampler.run(seconds)
+            loop.call_soon_threadsafe(_set_result, future, sampler)
+        except BaseException as e:
+            loop.call_soon_threadsafe(_set_exception, future, e)
+        finally:
+            _profile_lock.release()
+
+    threading.Thread(target=_target, name="stack-sampler", daemon=True).start()
+    return await future
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException):
+    if not future.done():
+        future.set_exception(exc)
@@ -0,0 +1,52 @@
+"""
+请求上下文模块
+"""
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+from loguru import logger
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# 当前请求ID
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """获取当前请求ID"""
+    return request_id_var.get()
+
+
+class RequestContextMiddleware:
+    """为每个请求分配请求ID，绑定到日志上下文并写入响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER.encode("latin-1"):
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (REQUEST_ID_HEADER.encode("latin-1"), request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            with logger.contextualize(request_id=request_id):
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
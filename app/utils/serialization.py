@@ -0,0 +1,53 @@
+"""
+响应序列化工具模块
+"""
+import time
+import json
+from typing import Any, Dict
+from fastapi.responses import JSONResponse
+
+from app.utils.metrics import RESPONSE_SERIALIZE_SECONDS, RESPONSE_PAYLOAD_BYTES
+from app.utils.timing import record_span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson未安装时退回标准库
+    orjson = None
+
+# 精简模式下从metadata中移除的字段（原始提供商数据、完整搜索结果）
+VERBOSE_METADATA_KEYS = ("provider_metadata", "search_results")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为UTF-8编码的JSON"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def slim_result(result: Dict[str, Any], verbose: bool = False) -> Dict[str, Any]:
+    """精简Agent响应，非verbose模式下移除原始提供商数据"""
+    metadata = result.get("metadata")
+    if verbose or not metadata:
+        return result
+    return {
+        **result,
+        "metadata": {k: v for k, v in metadata.items() if k not in VERBOSE_METADATA_KEYS}
+    }
+
+
+class FastJSONResponse(JSONResponse):
+    """使用orjson序列化的JSON响应，并记录每个路由的序列化耗时与响应体大小"""
+
+    def __init__(self, content: Any, *args, route: str = "other", **kwargs):
+        self.route = route
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = dumps(content)
+        elapsed = time.perf_counter() - start
+        record_span("serialize", elapsed)
+        RESPONSE_SERIALIZE_SECONDS.labels(self.route).observe(elapsed)
+        RESPONSE_PAYLOAD_BYTES.labels(self.route).observe(len(body))
+        return body
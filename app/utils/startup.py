@@ -0,0 +1,48 @@
+"""
+启动耗时统计模块
+
+记录从主模块开始导入到应用就绪的各阶段耗时，便于把冷启动时间作为可追踪的指标。
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Optional
+
+# 本模块应尽早导入，以此作为计时起点
+_started_at = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+_ready_at: Optional[float] = None
+
+
+def record_phase(name: str, seconds: float):
+    """记录一个启动阶段的耗时"""
+    _phases.append((name, seconds))
+
+
+@contextmanager
+def startup_phase(name: str):
+    """统计代码块耗时并记录为启动阶段"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def since_start() -> float:
+    """距计时起点的秒数"""
+    return time.perf_counter() - _started_at
+
+
+def mark_ready():
+    """标记应用已就绪"""
+    global _ready_at
+    _ready_at = time.perf_counter()
+
+
+def get_startup_report() -> Dict[str, Any]:
+    """获取启动耗时报告"""
+    return {
+        "ready": _ready_at is not None,
+        "total_seconds": round((_ready_at or time.perf_counter()) - _started_at, 4),
+        "phases": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in _phases]
+    }
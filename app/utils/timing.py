@@ -0,0 +1,122 @@
+"""
+请求阶段耗时统计模块
+
+基于contextvars记录每个请求各阶段（查询提取、搜索、提示词构建、LLM调用、序列化等）的耗时，
+通过 Server-Timing 响应头和可选的 metadata.timings 返回。
+当前请求未开启记录时，span() 返回共享的空对象，几乎没有开销。
+"""
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+_INVALID_NAME_CHARS = re.compile(r"[^A-Za-z0-9_\-.]")
+
+# 当前请求的记录器
+_recorder_var: ContextVar[Optional["SpanRecorder"]] = ContextVar("span_recorder", default=None)
+
+
+class SpanRecorder:
+    """单个请求的阶段耗时记录器"""
+
+    __slots__ = ("spans",)
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def totals(self) -> Dict[str, float]:
+        """按阶段汇总耗时（毫秒），同名阶段累加"""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return {name: round(ms, 2) for name, ms in totals.items()}
+
+    def server_timing(self) -> str:
+        """生成 Server-Timing 响应头的值"""
+        return ", ".join(
+            f"{_INVALID_NAME_CHARS.sub('_', name)};dur={ms}" for name, ms in self.totals().items()
+        )
+
+
+class _Span:
+    __slots__ = ("_recorder", "_name", "_start")
+
+    def __init__(self, recorder: SpanRecorder, name: str):
+        self._recorder = recorder
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._recorder.add(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """统计代码块耗时：with span("prompt_build"): ..."""
+    recorder = _recorder_var.get()
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name)
+
+
+def record_span(name: str, seconds: float):
+    """直接记录一个已知耗时的阶段"""
+    recorder = _recorder_var.get()
+    if recorder is not None:
+        recorder.add(name, seconds)
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """获取当前请求已记录的阶段耗时（毫秒）"""
+    recorder = _recorder_var.get()
+    return recorder.totals() if recorder is not None else None
+
+
+class ServerTimingMiddleware:
+    """为每个HTTP请求开启阶段耗时记录，并写入 Server-Timing 响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.server_timing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        recorder = SpanRecorder()
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                recorder.add("total", time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", recorder.server_timing().encode("latin-1"))
+                ]
+            await send(message)
+
+        token = _recorder_var.set(recorder)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _recorder_var.reset(token)
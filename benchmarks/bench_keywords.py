@@ -0,0 +1,139 @@
+"""
+关键词匹配基准测试
+
+对大批量搜索结果（由 benchmarks/fixtures/bing_*.html 解析并复制扩充）测量广告过滤的耗时，
+对比逐个关键词 `in` 扫描与编译后的单趟匹配器在不同关键词数量下的表现；
+同时测量搜索指示词（查询意图）提取的耗时。
+
+用法:
+    python benchmarks/bench_keywords.py --results 20000
+    python benchmarks/bench_keywords.py --keywords 11 100 500 1000
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.agents.search_agent import AD_KEYWORDS, SEARCH_INTENT_KEYWORDS
+from app.services.serp_parser import parse_bing
+from app.utils.keyword_matcher import KeywordMatcher
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# 用于生成额外关键词的多语言词根
+_STEMS = {
+    "zh": ["优惠券", "秒杀", "包邮", "返利", "团购", "抢购", "代理", "加盟", "招商", "促销"],
+    "ja": ["広告", "セール", "割引", "限定", "特価", "送料無料", "キャンペーン", "お得"],
+    "en": ["deal", "discount", "coupon", "offer", "promo", "sale", "clearance", "bargain"],
+    "de": ["angebot", "rabatt", "werbung", "gutschein", "aktion"],
+}
+
+
+def build_keywords(base: list, count: int, seed: int = 0) -> list:
+    """在 base 基础上用多语言词根组合出 count 个关键词"""
+    rng = random.Random(seed)
+    keywords = list(dict.fromkeys(base))
+    pool = [(lang, stem) for lang, stems in _STEMS.items() for stem in stems]
+    for n in itertools.count():
+        if len(keywords) >= count:
+            break
+        lang, stem = rng.choice(pool)
+        keyword = f"{stem}{n}" if lang in ("zh", "ja") else f"{stem}{n}x"
+        keywords.append(keyword)
+    return keywords[:count]
+
+
+def linear_is_ad(keywords: list, text: str) -> bool:
+    """原实现：逐个关键词扫描（英文按整词）"""
+    text = text.lower()
+    words = set(re.findall(r"[a-z]+", text))
+    return any(k in words if k.isascii() else k in text for k in keywords)
+
+
+def linear_prefix(keywords: list, text: str) -> str:
+    """逐个指示词检查前缀（取最长）"""
+    best = ""
+    for keyword in keywords:
+        if text.startswith(keyword) and len(keyword) > len(best):
+            best = keyword
+    return best
+
+
+def load_results(fixtures: Path, count: int) -> list:
+    """解析保存的结果页并复制扩充到 count 条"""
+    base = []
+    for path in sorted(fixtures.glob("bing_*.html")):
+        base.extend(parse_bing(path.read_bytes(), max_results=50))
+    if not base:
+        raise SystemExit(f"{fixtures} 中没有可解析的 bing_*.html")
+    return [f"{r['title']}\n{r['snippet']}" for r in itertools.islice(itertools.cycle(base), count)]
+
+
+def timed(func, items) -> tuple:
+    start = time.perf_counter()
+    hits = sum(1 for item in items if func(item))
+    return time.perf_counter() - start, hits
+
+
+def bench_ads(texts: list, keyword_count: int) -> dict:
+    keywords = build_keywords(AD_KEYWORDS, keyword_count)
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    linear_time, linear_hits = timed(lambda t: linear_is_ad(keywords, t), texts)
+    matcher_time, matcher_hits = timed(lambda t: matcher.search(t) is not None, texts)
+    return {
+        "keywords": len(keywords),
+        "compile_ms": round(compile_ms, 3),
+        "linear_us_per_result": round(linear_time / len(texts) * 1e6, 3),
+        "matcher_us_per_result": round(matcher_time / len(texts) * 1e6, 3),
+        "speedup": round(linear_time / matcher_time, 2),
+        "ads": matcher_hits,
+        "agree": linear_hits == matcher_hits
+    }
+
+
+def bench_intent(texts: list, keyword_count: int) -> dict:
+    keywords = build_keywords(SEARCH_INTENT_KEYWORDS, keyword_count, seed=1)
+    matcher = KeywordMatcher(keywords)
+    # 一半消息以指示词开头
+    rng = random.Random(2)
+    messages = [f"{rng.choice(keywords)} {t.splitlines()[0]}" if i % 2 else t.splitlines()[0].lower()
+                for i, t in enumerate(texts)]
+
+    linear_time, _ = timed(lambda m: linear_prefix(keywords, m), messages)
+    matcher_time, _ = timed(matcher.match_prefix, messages)
+    return {
+        "keywords": len(keywords),
+        "linear_us_per_message": round(linear_time / len(messages) * 1e6, 3),
+        "matcher_us_per_message": round(matcher_time / len(messages) * 1e6, 3),
+        "speedup": round(linear_time / matcher_time, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词匹配基准测试")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_DIR, help="保存的结果页目录（bing_*.html）")
+    parser.add_argument("--results", type=int, default=20000, help="参与过滤的结果条数")
+    parser.add_argument("--keywords", type=int, nargs="+", default=[11, 100, 500])
+    args = parser.parse_args()
+
+    texts = load_results(args.fixtures, args.results)
+    output = {
+        "benchmark": "keyword_match",
+        "results": len(texts),
+        "ad_filter": [bench_ads(texts, n) for n in args.keywords],
+        "intent": [bench_intent(texts, n) for n in args.keywords]
+    }
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
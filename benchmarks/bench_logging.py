@@ -0,0 +1,78 @@
+"""
+日志开销基准测试
+
+对比同步文件日志、loguru自带enqueue、后台线程sink和采样日志在调用线程上的单次开销（微秒）。
+
+用法:
+    python benchmarks/bench_logging.py --iterations 20000
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from loguru import logger
+from app.utils.logger import FILE_FORMAT, BackgroundSink, make_sampling_filter, _file_writer
+
+
+def run_case(name: str, iterations: int, log_dir: Path, background: bool = False, **sink_options) -> dict:
+    """运行单个日志配置并返回每次调用的平均耗时"""
+    logger.remove()
+    logger.configure(extra={"request_id": "bench"})
+    path = str(log_dir / f"{name}.log")
+    background_sink = None
+    if background:
+        background_sink = BackgroundSink(
+            _file_writer(path, rotation="10 MB", compression="zip"),
+            max_queue=iterations,
+            name=name
+        )
+        logger.add(background_sink, format=FILE_FORMAT, level="INFO", **sink_options)
+    else:
+        logger.add(path, format=FILE_FORMAT, level="INFO", rotation="10 MB", compression="zip", **sink_options)
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        logger.info("Agent {} 生成响应成功，耗时: {:.2f}秒", "bench", i / 1000)
+    elapsed = time.perf_counter() - start
+
+    # 等待后台队列写完，不计入调用方耗时
+    logger.remove()
+    if background_sink:
+        background_sink.stop()
+
+    return {
+        "case": name,
+        "iterations": iterations,
+        "us_per_call": round(elapsed / iterations * 1e6, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志开销基准测试")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp)
+        results = [
+            run_case("sync", args.iterations, log_dir),
+            run_case("sync_json", args.iterations, log_dir, serialize=True),
+            run_case("loguru_enqueue", args.iterations, log_dir, enqueue=True),
+            run_case("background", args.iterations, log_dir, background=True),
+            run_case("background_json", args.iterations, log_dir, background=True, serialize=True),
+            run_case(
+                "background_sampled_0.1", args.iterations, log_dir,
+                background=True, filter=make_sampling_filter({"INFO": 0.1})
+            ),
+        ]
+
+    print(json.dumps({"benchmark": "logging", "results": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+搜索结果页解析基准测试
+
+对保存的Bing结果页（默认 benchmarks/fixtures/bing_*.html）测量单页解析耗时（毫秒），
+以及通过解析线程池并发解析时的吞吐量和事件循环的最大延迟。
+
+用法:
+    python benchmarks/bench_serp.py --iterations 200
+    python benchmarks/bench_serp.py --fixtures ~/saved_serps --concurrency 16
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.serp_parser import parse_bing, parse_bing_async, shutdown_parser_pool
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+def bench_page(path: Path, iterations: int) -> dict:
+    """在当前线程中重复解析单个页面"""
+    html = path.read_bytes()
+    results = parse_bing(html)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse_bing(html)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "fixture": path.name,
+        "bytes": len(html),
+        "results": len(results),
+        "ms_per_page": round(statistics.mean(timings) * 1000, 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1] * 1000, 3)
+    }
+
+
+async def bench_pool(pages: list, iterations: int, concurrency: int) -> dict:
+    """通过解析线程池并发解析，同时测量事件循环的调度延迟"""
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def probe():
+        nonlocal max_lag
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.001)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def parse(html: bytes):
+        async with semaphore:
+            await parse_bing_async(html)
+
+    probe_task = asyncio.create_task(probe())
+    total = iterations * len(pages)
+    start = time.perf_counter()
+    await asyncio.gather(*(parse(pages[i % len(pages)]) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    return {
+        "pages": total,
+        "workers": settings.search_parse_workers,
+        "concurrency": concurrency,
+        "pages_per_second": round(total / elapsed, 1),
+        "max_loop_lag_ms": round(max_lag * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="搜索结果页解析基准测试")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_DIR, help="保存的结果页目录（bing_*.html）")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    paths = sorted(args.fixtures.glob("bing_*.html"))
+    if not paths:
+        parser.error(f"{args.fixtures} 中没有 bing_*.html")
+
+    results = [bench_page(path, args.iterations) for path in paths]
+    pages = [path.read_bytes() for path in paths]
+    pool = asyncio.run(bench_pool(pages, args.iterations, args.concurrency))
+    shutdown_parser_pool()
+
+    print(json.dumps({"benchmark": "serp_parse", "results": results, "pool": pool}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
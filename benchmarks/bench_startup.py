@@ -0,0 +1,73 @@
+"""
+冷启动耗时基准测试
+
+在全新的子进程中导入应用并执行lifespan启动流程，统计各阶段耗时的中位数。
+
+用法:
+    python benchmarks/bench_startup.py --runs 5
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = """
+import time
+_t0 = time.perf_counter()
+import asyncio, json
+import main
+from app.utils.startup import get_startup_report
+
+async def _run():
+    async with main.lifespan(main.app):
+        pass
+
+asyncio.run(_run())
+report = get_startup_report()
+report["wall_seconds"] = round(time.perf_counter() - _t0, 4)
+print("STARTUP_REPORT " + json.dumps(report))
+"""
+
+
+def run_once() -> dict:
+    """在子进程中执行一次冷启动"""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    for line in output.splitlines():
+        if line.startswith("STARTUP_REPORT "):
+            return json.loads(line[len("STARTUP_REPORT "):])
+    raise RuntimeError("子进程未输出启动报告")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    reports = [run_once() for _ in range(args.runs)]
+
+    phases = {}
+    for report in reports:
+        for phase in report["phases"]:
+            phases.setdefault(phase["name"], []).append(phase["seconds"])
+
+    print(json.dumps({
+        "benchmark": "startup",
+        "runs": args.runs,
+        "median_total_seconds": statistics.median(r["total_seconds"] for r in reports),
+        "median_wall_seconds": statistics.median(r["wall_seconds"] for r in reports),
+        "median_phase_seconds": {name: statistics.median(values) for name, values in phases.items()}
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
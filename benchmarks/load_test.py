@@ -0,0 +1,330 @@
+"""
+离线压测基准
+
+启动本地模拟Ollama/DuckDuckGo服务和应用本身，以受控并发驱动chat、code、search三类Agent，
+输出吞吐量、p50/p95/p99延迟和首token时间（TTFT），结果为JSON，便于跨提交对比。
+
+用法:
+    python benchmarks/load_test.py --concurrency 1 8 32 --requests 200 --output results.json
+    python benchmarks/load_test.py --compare baseline.json --output current.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import httpx
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+
+AGENT_PAYLOADS = {
+    "chat": {"name": "压测聊天助手", "agent_type": "chat", "provider": "ollama", "config": {}},
+    "code": {"name": "压测代码助手", "agent_type": "code", "provider": "ollama", "config": {"language": "python"}},
+    "search": {
+        "name": "压测搜索助手", "agent_type": "search", "provider": "ollama",
+        "config": {"search_engines": ["duckduckgo"], "max_results": 3}
+    },
+}
+
+AGENT_MESSAGES = {
+    "chat": "你好，请介绍一下你自己",
+    "code": "请写一个快速排序函数",
+    "search": "搜索 Python最新版本",
+}
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """汇总延迟分布（毫秒）"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "mean": round(statistics.mean(values) * 1000, 2),
+    }
+
+
+def git_revision() -> Optional[str]:
+    """当前提交号"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0):
+    """等待服务可用"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"服务启动超时: {url}")
+
+
+def start_process(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """启动子进程"""
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+async def run_http(base_url: str, agent_id: str, message: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """通过HTTP接口压测"""
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            # 每个并发连接使用独立会话，同一会话内的消息按顺序处理
+            context = {"session_id": uuid.uuid4().hex}
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.post(f"/agents/{agent_id}/chat", json={"message": message, "context": context})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"latencies": latencies, "ttfts": [], "errors": errors, "elapsed": elapsed}
+
+
+async def run_websocket(ws_url: str, agent_id: str, message: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """通过WebSocket流式接口压测（可测量TTFT）"""
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors
+        context = {"session_id": uuid.uuid4().hex}
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            while not queue.empty():
+                queue.get_nowait()
+                message_id = uuid.uuid4().hex
+                start = time.perf_counter()
+                first_token = None
+                await ws.send(json.dumps({"id": message_id, "agent_id": agent_id, "message": message, "context": context}))
+                while True:
+                    frame = json.loads(await ws.recv())
+                    if frame.get("id") != message_id:
+                        continue
+                    if frame["type"] == "delta" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif frame["type"] == "done":
+                        latencies.append(time.perf_counter() - start)
+                        if first_token is not None:
+                            ttfts.append(first_token)
+                        break
+                    elif frame["type"] in ("error", "cancelled"):
+                        errors += 1
+                        break
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"latencies": latencies, "ttfts": ttfts, "errors": errors, "elapsed": elapsed}
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    """启动服务并执行全部压测场景"""
+    mock_ports = [free_port() for _ in range(args.mock_nodes)]
+    mock_port = mock_ports[0]
+    app_port = free_port()
+    base_url = f"http://127.0.0.1:{app_port}"
+    processes = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            # 每个模拟节点一个进程，互不共享事件循环
+            for i, port in enumerate(mock_ports):
+                processes.append(start_process([
+                    "benchmarks/mock_services.py", "--port", str(port),
+                    "--latency", str(args.mock_latency), "--token-rate", str(args.mock_token_rate),
+                    "--tokens", str(args.mock_tokens), "--name", f"mock-{i}"
+                ]))
+            for port in mock_ports:
+                await wait_until_ready(f"http://127.0.0.1:{port}/api/tags")
+
+            processes.append(start_process(
+                ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+                env={
+                    "OLLAMA_BASE_URL": f"http://127.0.0.1:{mock_port}",
+                    "OLLAMA_NODES": ",".join(f"http://127.0.0.1:{port}" for port in mock_ports),
+                    "DUCKDUCKGO_API_URL": f"http://127.0.0.1:{mock_port}/ddg/",
+                    "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+                    "LOG_FILE": f"{tmp}/logs/app.log",
+                    "LOG_LEVEL": "WARNING",
+                    "DEBUG": "false",
+                }
+            ))
+            await wait_until_ready(f"{base_url}/health/")
+
+            results = []
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                for agent_type in args.agents:
+                    response = await client.post(f"/agents/{agent_type}", json=AGENT_PAYLOADS[agent_type])
+                    response.raise_for_status()
+                    agent_id = response.json()["agent_id"]
+
+                    for mode in args.modes:
+                        for concurrency in args.concurrency:
+                            if mode == "http":
+                                raw = await run_http(
+                                    base_url, agent_id, AGENT_MESSAGES[agent_type], args.requests, concurrency
+                                )
+                            else:
+                                raw = await run_websocket(
+                                    f"ws://127.0.0.1:{app_port}/ws/agents", agent_id,
+                                    AGENT_MESSAGES[agent_type], args.requests, concurrency
+                                )
+                            result = {
+                                "agent": agent_type,
+                                "mode": mode,
+                                "concurrency": concurrency,
+                                "requests": args.requests,
+                                "errors": raw["errors"],
+                                "throughput_rps": round(len(raw["latencies"]) / raw["elapsed"], 2),
+                                "latency_ms": summarize(raw["latencies"]),
+                                "ttft_ms": summarize(raw["ttfts"]),
+                            }
+                            results.append(result)
+                            print(
+                                f"{agent_type:<7} {mode:<5} c={concurrency:<4} "
+                                f"{result['throughput_rps']:>8} rps  p50={result['latency_ms']['p50']}ms "
+                                f"p99={result['latency_ms']['p99']}ms  ttft_p50={result['ttft_ms']['p50']}ms",
+                                file=sys.stderr
+                            )
+
+                # 各模拟节点收到的请求数，用于检查负载分布
+                node_requests = {}
+                for i, port in enumerate(mock_ports):
+                    response = await client.get(f"http://127.0.0.1:{port}/mock/stats")
+                    node_requests[f"mock-{i}"] = response.json()["requests"]
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+
+    return {
+        "benchmark": "load_test",
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mock": {
+            "latency": args.mock_latency,
+            "token_rate": args.mock_token_rate,
+            "tokens": args.mock_tokens,
+            "nodes": args.mock_nodes,
+            "node_requests": node_requests,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """对比两次压测结果，返回各场景的相对变化"""
+    def key(result):
+        return result["agent"], result["mode"], result["concurrency"]
+
+    base_results = {key(r): r for r in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        base = base_results.get(key(result))
+        if not base:
+            continue
+
+        def delta(new, old):
+            if new is None or not old:
+                return None
+            return round((new - old) / old * 100, 1)
+
+        changes.append({
+            "agent": result["agent"],
+            "mode": result["mode"],
+            "concurrency": result["concurrency"],
+            "throughput_change_pct": delta(result["throughput_rps"], base["throughput_rps"]),
+            "p50_change_pct": delta(result["latency_ms"]["p50"], base["latency_ms"]["p50"]),
+            "p99_change_pct": delta(result["latency_ms"]["p99"], base["latency_ms"]["p99"]),
+        })
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线压测基准")
+    parser.add_argument("--agents", nargs="+", default=["chat", "code", "search"], choices=list(AGENT_PAYLOADS))
+    parser.add_argument("--modes", nargs="+", default=["http", "ws"], choices=["http", "ws"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--mock-latency", type=float, default=0.05, help="模拟首token延迟（秒）")
+    parser.add_argument("--mock-token-rate", type=float, default=200.0, help="模拟每秒token数")
+    parser.add_argument("--mock-tokens", type=int, default=64, help="模拟每次生成token数")
+    parser.add_argument("--mock-nodes", type=int, default=1, help="模拟Ollama节点数（通过OLLAMA_NODES分发）")
+    parser.add_argument("--output", help="结果输出文件（JSON）")
+    parser.add_argument("--compare", help="用于对比的基线结果文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(json.load(f), report)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
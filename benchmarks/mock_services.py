@@ -0,0 +1,255 @@
+"""
+本地模拟服务
+
+模拟Ollama的 /api/generate、/api/embed、/api/tags、/api/ps 接口、OpenAI兼容的 /v1/chat/completions 接口
+（按消息前缀模拟DeepSeek的上下文缓存命中）、DuckDuckGo即时答案接口和Bing结果页（返回 fixtures 中保存的页面），
+用于在没有真实模型和外网的情况下测量应用自身的开销。
+
+用法:
+    python benchmarks/mock_services.py --port 11500 --latency 0.05 --token-rate 200 --tokens 64
+    python benchmarks/mock_services.py --port 11500 --instances 3   # 3个节点，端口11500-11502
+"""
+import json
+import time
+import hashlib
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+
+# Bing结果页样例
+BING_FIXTURE = Path(__file__).resolve().parent / "fixtures" / "bing_python_asyncio.html"
+
+
+def create_app(
+    latency: float = 0.05,
+    token_rate: float = 200.0,
+    tokens: int = 64,
+    model: str = "deepseek-r1:8b",
+    node_name: str = "mock",
+    load_time: float = 0.0,
+    max_loaded: int = 0
+) -> FastAPI:
+    """创建模拟服务应用
+
+    latency: 首个token前的等待时间（秒），模拟排队和prompt处理
+    token_rate: 每秒生成的token数
+    tokens: 每次回答生成的token数
+    load_time: 请求未加载的模型时的加载耗时（秒）
+    max_loaded: 同时驻留的模型数上限，超出时卸载最久未使用的模型（0为不限）
+    """
+    app = FastAPI(title="Mock Ollama/DuckDuckGo")
+    stats = {"requests": 0, "in_flight": 0}
+    token_interval = 1.0 / token_rate if token_rate > 0 else 0.0
+    # 已加载的模型（按使用先后排序）
+    loaded: Dict[str, float] = {model: time.time()}
+
+    async def _ensure_loaded(request_model: str) -> float:
+        """模拟模型加载，返回加载耗时（秒）"""
+        if request_model in loaded:
+            loaded[request_model] = loaded.pop(request_model)
+            return 0.0
+        if load_time:
+            await asyncio.sleep(load_time)
+        loaded[request_model] = time.time()
+        while max_loaded and len(loaded) > max_loaded:
+            loaded.pop(next(iter(loaded)))
+        return load_time
+
+    def _final_chunk(request_model: str, started: float, load_seconds: float = 0.0) -> Dict[str, Any]:
+        total = time.perf_counter() - started
+        return {
+            "model": request_model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "context": list(range(tokens * 4)),
+            "total_duration": int(total * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": 32,
+            "eval_count": tokens,
+            "eval_duration": int(tokens * token_interval * 1e9),
+            "node": node_name
+        }
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        request_model = body.get("model", model)
+        started = time.perf_counter()
+        stats["requests"] += 1
+
+        if "prompt" not in body:
+            # 只加载模型（预热）
+            load_seconds = await _ensure_loaded(request_model)
+            return JSONResponse({**_final_chunk(request_model, started, load_seconds), "context": []})
+
+        if not body.get("stream", False):
+            stats["in_flight"] += 1
+            try:
+                load_seconds = await _ensure_loaded(request_model)
+                await asyncio.sleep(latency + tokens * token_interval)
+            finally:
+                stats["in_flight"] -= 1
+            result = _final_chunk(request_model, started, load_seconds)
+            result["response"] = " ".join(f"token{i}" for i in range(tokens))
+            return JSONResponse(result)
+
+        async def stream():
+            stats["in_flight"] += 1
+            try:
+                load_seconds = await _ensure_loaded(request_model)
+                await asyncio.sleep(latency)
+                for i in range(tokens):
+                    yield json.dumps({"model": request_model, "response": f"token{i} ", "done": False}) + "\n"
+                    if token_interval:
+                        await asyncio.sleep(token_interval)
+                yield json.dumps(_final_chunk(request_model, started, load_seconds)) + "\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        """按字符二元组哈希生成确定性的64维向量（文本越相似向量越接近）"""
+        body = await request.json()
+        inputs = body.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        stats["requests"] += 1
+        embeddings = []
+        for text in inputs:
+            vector = [0.0] * 64
+            for i in range(len(text) - 1):
+                digest = hashlib.blake2b(text[i:i + 2].encode("utf-8"), digest_size=2).digest()
+                vector[int.from_bytes(digest, "big") % 64] += 1.0
+            embeddings.append(vector)
+        return {"model": body.get("model"), "embeddings": embeddings}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": model, "model": model, "size": 0}]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": name, "model": name, "size": 0, "size_vram": 0} for name in loaded]}
+
+    # 已见过的消息前缀哈希，用于模拟上下文缓存
+    seen_prefixes = set()
+
+    def _cached_prompt_tokens(messages) -> int:
+        """返回命中缓存的前缀长度（以字符数近似token数），并记录本次请求的所有前缀"""
+        digest = hashlib.blake2b(digest_size=16)
+        cached, prefix_tokens, hit = 0, 0, True
+        for message in messages:
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            key = digest.copy().hexdigest()
+            prefix_tokens += len(message.get("content") or "")
+            if hit and key in seen_prefixes:
+                cached = prefix_tokens
+            else:
+                hit = False
+            seen_prefixes.add(key)
+        return cached
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(latency + tokens * token_interval)
+        finally:
+            stats["in_flight"] -= 1
+
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages)
+        cached = _cached_prompt_tokens(messages)
+        return {
+            "id": f"chatcmpl-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", model),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(f"token{i}" for i in range(tokens))},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": tokens,
+                "total_tokens": prompt_tokens + tokens,
+                "prompt_cache_hit_tokens": cached,
+                "prompt_cache_miss_tokens": prompt_tokens - cached
+            }
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "deepseek-chat", "object": "model"}]}
+
+    @app.get("/bing/search")
+    async def bing(q: str = ""):
+        return Response(BING_FIXTURE.read_bytes(), media_type="text/html; charset=utf-8")
+
+    @app.get("/ddg/")
+    async def duckduckgo(q: str = ""):
+        return {
+            "Abstract": f"{q} 的模拟摘要。",
+            "AbstractSource": "MockPedia",
+            "AbstractURL": f"https://example.com/wiki/{q}",
+            "RelatedTopics": [
+                {"Text": f"{q} 相关主题 {i}", "FirstURL": f"https://example.com/topic/{i}"}
+                for i in range(3)
+            ]
+        }
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟Ollama/DuckDuckGo服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.05, help="首token延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="每秒token数")
+    parser.add_argument("--tokens", type=int, default=64, help="每次生成的token数")
+    parser.add_argument("--model", default="deepseek-r1:8b")
+    parser.add_argument("--name", default="mock", help="节点名称（写入响应中）")
+    parser.add_argument("--load-time", type=float, default=0.0, help="加载未驻留模型的耗时（秒）")
+    parser.add_argument("--max-loaded", type=int, default=0, help="同时驻留的模型数上限（0为不限）")
+    parser.add_argument("--instances", type=int, default=1, help="启动的实例数（端口从--port起依次递增，模拟多个Ollama节点）")
+    args = parser.parse_args()
+
+    if args.instances <= 1:
+        app = create_app(args.latency, args.token_rate, args.tokens, args.model, args.name, args.load_time, args.max_loaded)
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+        return
+
+    servers = []
+    for i in range(args.instances):
+        app = create_app(
+            args.latency, args.token_rate, args.tokens, args.model,
+            f"{args.name}-{i}", args.load_time, args.max_loaded
+        )
+        servers.append(uvicorn.Server(uvicorn.Config(app, host=args.host, port=args.port + i, log_level="warning")))
+    print("OLLAMA_NODES=" + ",".join(f"http://{args.host}:{args.port + i}" for i in range(args.instances)))
+    asyncio.run(_serve_all(servers))
+
+
+async def _serve_all(servers):
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+if __name__ == "__main__":
+    main()
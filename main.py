@@ -1,19 +1,64 @@
 """
 AI Agent Demo 主应用入口
 """
+from app.utils import startup  # 尽早导入，作为启动计时起点
+
 import os
 import sys
+import asyncio
+import importlib
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from loguru import logger
 
 from app.core.config import settings
-from app.utils.logger import setup_logger
-from app.utils.database import create_tables
-from app.api import agents, health
+from app.utils.logger import setup_logger, shutdown_logger
+from app.utils.request_context import RequestContextMiddleware
+from app.utils.timing import ServerTimingMiddleware
+from app.utils.metrics import CONTENT_TYPE_LATEST, render_metrics
+from app.utils.serialization import FastJSONResponse
+from app.utils.loop_monitor import loop_monitor
+from app.api import agents, health, websocket, interactions, debug, documents
+from app.services.interaction_recorder import interaction_recorder
+from app.services.health_service import health_monitor
+from app.services.ollama_residency import residency_manager
+from app.services.ollama_pool import ollama_pool
+from app.services.agent_registry import agent_registry
+from app.utils.http_client import close_http_clients
+from app.services.serp_parser import shutdown_parser_pool
+from app.prompts import prompt_registry
+
+# 启动时需要准备的目录
+REQUIRED_DIRECTORIES = ["data", "logs", "data/uploads"]
+_directories_ready = False
+
+
+def prepare_directories(verbose: bool = False):
+    """创建必要的目录（每个进程只执行一次）"""
+    global _directories_ready
+    if _directories_ready:
+        return
+    for directory in REQUIRED_DIRECTORIES:
+        os.makedirs(directory, exist_ok=True)
+        if verbose:
+            logger.info(f"✅ 目录已准备: {directory}")
+    _directories_ready = True
+
+
+async def init_database():
+    """创建数据库表（在线程中导入SQLAlchemy，避免阻塞事件循环）"""
+    database = await asyncio.to_thread(importlib.import_module, "app.utils.database")
+    await database.create_tables_async()
+
+
+async def close_database():
+    """关闭数据库连接池"""
+    database = sys.modules.get("app.utils.database")
+    if database is not None:
+        await database.dispose_engines()
 
 
 def check_environment():
@@ -26,10 +71,7 @@ def check_environment():
         return False
     
     # 检查必要的目录
-    directories = ["data", "logs", "data/uploads"]
-    for directory in directories:
-        os.makedirs(directory, exist_ok=True)
-        logger.info(f"✅ 目录已准备: {directory}")
+    prepare_directories(verbose=True)
     
     # 检查环境变量文件
     if not os.path.exists(".env") and os.path.exists("env.example"):
@@ -48,27 +90,67 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     logger.info("启动AI Agent Demo应用...")
     
+    # 阻塞的初始化操作放到线程中执行，不占用事件循环
+    with startup.startup_phase("directories"):
+        await asyncio.to_thread(prepare_directories)
+    
+    # 编译提示词模板
+    with startup.startup_phase("prompts"):
+        await asyncio.to_thread(prompt_registry.load_all)
+    
     # 创建数据库表
     try:
-        create_tables()
+        with startup.startup_phase("database"):
+            await init_database()
         logger.info("数据库表创建成功")
     except Exception as e:
         logger.error(f"数据库表创建失败: {e}")
     
-    # 创建必要的目录
-    import os
-    os.makedirs("data", exist_ok=True)
-    os.makedirs("logs", exist_ok=True)
-    os.makedirs("data/uploads", exist_ok=True)
+    # 预先加载回放文件索引（大量录制数据时耗时较长）
+    if settings.replay_enabled:
+        from app.services.replay_service import get_store_async
+        with startup.startup_phase("replay"):
+            await get_store_async(settings.replay_file)
+    
+    # 启动交互记录器
+    if settings.interaction_log_enabled:
+        await interaction_recorder.start()
+    
+    # 启动Agent注册表（空闲Agent换出到磁盘）
+    await agent_registry.start()
+    
+    # 启动AI健康检查后台刷新
+    await health_monitor.start()
+    
+    # 启动Ollama模型驻留管理（同步已加载模型、预热常驻模型）
+    if settings.ollama_residency_enabled:
+        await residency_manager.start(ollama_pool.base_urls)
+    
+    # 启动事件循环监控
+    if settings.loop_monitor_enabled:
+        await loop_monitor.start()
     
-    logger.info("应用启动完成")
+    startup.mark_ready()
+    logger.info(f"应用启动完成，耗时: {startup.since_start():.3f}秒")
     
     yield
     
     # 关闭时执行
     logger.info("关闭AI Agent Demo应用...")
+    await loop_monitor.stop()
+    await health_monitor.stop()
+    await residency_manager.stop()
+    await agent_registry.stop()
+    await interaction_recorder.stop()
+    await close_http_clients()
+    shutdown_parser_pool()
+    await close_database()
+    await shutdown_logger()
 
 
+# 模块导入完成
+startup.record_phase("imports", startup.since_start())
+
 # 创建FastAPI应用
 app = FastAPI(
     title=settings.app_name,
@@ -76,6 +158,7 @@ app = FastAPI(
     version=settings.app_version,
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
@@ -88,9 +171,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求ID与日志上下文
+app.add_middleware(RequestContextMiddleware)
+
+# 各阶段耗时（Server-Timing响应头）
+app.add_middleware(ServerTimingMiddleware)
+
 # 注册路由
 app.include_router(agents.router)
 app.include_router(health.router)
+app.include_router(websocket.router)
+app.include_router(interactions.router)
+app.include_router(debug.router)
+app.include_router(documents.router)
 
 
 @app.get("/")
@@ -105,6 +198,13 @@ async def root():
     }
 
 
+if settings.enable_metrics:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus指标"""
+        return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """全局异常处理器"""
@@ -131,9 +231,9 @@ if __name__ == "__main__":
     logger.info(f"   健康检查: http://{settings.host}:{settings.port}/health")
     logger.info("=" * 50)
     
-    # 启动服务器
+    # 启动服务器（非热重载模式直接传入app对象，避免再次导入整个应用）
     uvicorn.run(
-        "main:app",
+        "main:app" if settings.debug else app,
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
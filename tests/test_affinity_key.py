@@ -0,0 +1,38 @@
+"""
+节点亲和键测试
+"""
+from app.agents.chat_agent import ChatAgent
+from app.agents.code_agent import CodeAgent
+from app.services.agent_registry import AgentRegistry
+
+
+class RecordingService:
+    def __init__(self):
+        self.keys = []
+
+    async def generate_response(self, prompt, **kwargs):
+        self.keys.append(kwargs["affinity_key"])
+        return {"response": "好", "model_used": "fake", "tokens_used": 1, "processing_time": 0.0, "provider": "fake"}
+
+
+async def test_agents_with_same_name_get_distinct_keys(tmp_path):
+    registry = AgentRegistry(spill_dir=str(tmp_path))
+    service = RecordingService()
+    agents = [CodeAgent(name="代码助手"), CodeAgent(name="代码助手")]
+    ids = [await registry.add(agent) for agent in agents]
+    for agent in agents:
+        agent.ai_service = service
+        await agent.generate_response("问题")
+
+    assert service.keys == ids
+
+
+async def test_chat_key_uses_agent_and_session_id(tmp_path):
+    registry = AgentRegistry(spill_dir=str(tmp_path))
+    agent = ChatAgent(name="助手")
+    agent_id = await registry.add(agent)
+    agent.ai_service = RecordingService()
+    await agent.process_message("你好", {"session_id": "s1"})
+
+    assert agent.ai_service.keys == [f"{agent_id}:s1"]
+    assert ChatAgent.from_state(agent.dump_state()).agent_id == agent_id
@@ -0,0 +1,57 @@
+"""
+Agent注册表测试
+"""
+import os
+
+from app.agents.chat_agent import ChatAgent
+from app.services.agent_registry import AgentRegistry
+from app.utils.serialization import dumps
+
+
+def _chat(agent: ChatAgent, session_id: str, turns: int):
+    session = agent._get_session(session_id)
+    for i in range(turns):
+        agent._update_history(f"问题{i}", {"response": "回答" * 50}, session_id, session)
+
+
+def test_state_size_tracks_sessions_incrementally():
+    agent = ChatAgent(max_sessions=3)
+    for n in range(5):
+        _chat(agent, f"s{n}", 12)
+    agent.clear_history("s4")
+
+    actual = len(dumps(agent.dump_state()))
+    assert abs(agent.state_size() - actual) <= 4 * len(agent.sessions) + 16
+
+
+async def test_measure_skips_unchanged_agents(tmp_path, monkeypatch):
+    registry = AgentRegistry(spill_dir=str(tmp_path))
+    agent = ChatAgent()
+    agent_id = await registry.add(agent)
+    entry = registry._entries[agent_id]
+
+    calls = []
+    monkeypatch.setattr(agent, "dump_state", lambda: calls.append(1) or {})
+    async with registry.use(agent_id):
+        pass
+    await registry._enforce_limits()
+    assert calls == []
+
+    before = entry.size
+    _chat(agent, "default", 1)
+    await registry._enforce_limits()
+    assert entry.size > before
+
+
+async def test_spill_dir_is_per_process(tmp_path):
+    stale = tmp_path / "worker-999999999"
+    stale.mkdir()
+    (stale / "chat_1.json").write_text("{}")
+
+    registry = AgentRegistry(spill_dir=str(tmp_path))
+    await registry.start()
+    try:
+        assert registry.spill_dir == tmp_path / f"worker-{os.getpid()}"
+        assert not stale.exists()
+    finally:
+        await registry.stop()
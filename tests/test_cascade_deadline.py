@@ -0,0 +1,59 @@
+"""
+级联与请求截止时间测试
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.agents.code_agent import CodeAgent
+from app.utils.deadline import DeadlineExceeded, deadline_scope
+
+CASCADE_CONFIG = {"cascade": {"small_model": "small", "large_model": "large"}}
+
+
+class FakeService:
+    def __init__(self, small_error=None, small_delay=0.0, small_response="好"):
+        self.small_error = small_error
+        self.small_delay = small_delay
+        self.small_response = small_response
+        self.models = []
+
+    async def generate_response(self, prompt, **kwargs):
+        self.models.append(kwargs["model"])
+        if kwargs["model"] == "small":
+            await asyncio.sleep(self.small_delay)
+            if self.small_error is not None:
+                raise self.small_error
+            return {"response": self.small_response, "model_used": "small", "processing_time": self.small_delay}
+        return {"response": "大模型回答", "model_used": "large", "processing_time": 0.0}
+
+
+def _agent(service: FakeService) -> CodeAgent:
+    agent = CodeAgent(config=CASCADE_CONFIG)
+    agent.ai_service = service
+    return agent
+
+
+@pytest.mark.parametrize("error", [DeadlineExceeded(), httpx.ReadTimeout("timeout")])
+async def test_small_model_deadline_does_not_escalate(error):
+    service = FakeService(small_error=error, small_delay=0.1)
+    with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+        await _agent(service).generate_response("问题")
+    assert service.models == ["small"]
+
+
+async def test_rejected_answer_after_deadline_does_not_escalate():
+    # 空回答未通过检查，但预算已经用完
+    service = FakeService(small_delay=0.1, small_response="")
+    with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+        await _agent(service).generate_response("问题")
+    assert service.models == ["small"]
+
+
+async def test_small_model_error_within_budget_escalates():
+    service = FakeService(small_error=RuntimeError("节点故障"))
+    with deadline_scope(5.0):
+        result = await _agent(service).generate_response("问题")
+    assert service.models == ["small", "large"]
+    assert result["cascade"]["escalation_reason"] == "error"
@@ -0,0 +1,74 @@
+"""
+聊天消息合并测试
+"""
+import asyncio
+
+import pytest
+
+from app.agents.chat_agent import ChatAgent
+from app.utils.deadline import DeadlineExceeded, deadline_scope, run_with_deadline, stage_timeout
+from app.utils.request_context import request_id_var
+
+GENERATION_SECONDS = 0.3
+
+
+async def _fake_stream(prompt, **kwargs):
+    await asyncio.sleep(GENERATION_SECONDS)
+    # 与真实的模型调用一样，按当前上下文的截止时间计算超时
+    stage_timeout(60.0)
+    yield {"type": "delta", "content": "好"}
+    yield {"type": "done", "result": {
+        "response": "好", "model_used": "fake", "tokens_used": 1, "processing_time": 0.0, "provider": "fake"
+    }}
+
+
+def _agent() -> ChatAgent:
+    agent = ChatAgent(config={"coalesce_window": 0.05})
+    agent.stream_response = _fake_stream
+    return agent
+
+
+async def _send(agent: ChatAgent, message: str, timeout, request_id: str):
+    request_id_var.set(request_id)
+    with deadline_scope(timeout):
+        return await run_with_deadline(agent.process_message(message))
+
+
+async def test_coalesced_turn_uses_latest_deadline():
+    agent = _agent()
+    short = asyncio.ensure_future(_send(agent, "第一条", GENERATION_SECONDS / 3, "req-short"))
+    await asyncio.sleep(0.01)
+    long = asyncio.ensure_future(_send(agent, "第二条", 5.0, "req-long"))
+
+    with pytest.raises(DeadlineExceeded):
+        await short
+    result = await long
+
+    assert result["response"] == "好"
+    assert result["metadata"]["coalesced_messages"] == 2
+    assert result["metadata"]["coalesced_request_ids"] == ["req-short", "req-long"]
+
+
+async def test_coalesced_turn_without_deadline_is_unbounded():
+    agent = _agent()
+    first = asyncio.ensure_future(_send(agent, "第一条", 5.0, "req-1"))
+    await asyncio.sleep(0.01)
+    second = asyncio.ensure_future(_send(agent, "第二条", None, "req-2"))
+
+    results = await asyncio.gather(first, second)
+    assert all(result["metadata"]["coalesced_messages"] == 2 for result in results)
+
+
+async def test_eviction_skips_busy_sessions():
+    agent = ChatAgent(max_sessions=2)
+    busy = agent._get_session("busy")
+    await busy.lock.acquire()
+    agent._get_session("idle")
+    agent._get_session("new")
+    # 最久未使用的会话正在处理，淘汰下一个空闲会话
+    assert list(agent.sessions) == ["busy", "new"]
+
+    agent.sessions["new"].pending = object()
+    agent._get_session("third")
+    assert list(agent.sessions) == ["busy", "new", "third"]
+    busy.lock.release()
@@ -0,0 +1,55 @@
+"""
+文档向量存储测试
+"""
+import hashlib
+
+from app.core.config import settings
+from app.services.document_store import DocumentStore
+
+
+async def fake_embed(texts):
+    """按文本哈希生成确定的向量，相同文本得到相同向量"""
+    return [[float(b) for b in hashlib.md5(text.encode("utf-8")).digest()[:8]] for text in texts]
+
+
+def paragraphs(count, changed=None):
+    return "\n\n".join(
+        f"第{i}段 {'已修改' if i == changed else '原始内容'} " + "x" * 30 for i in range(count)
+    )
+
+
+async def test_reindex_delete_and_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "document_chunk_size", 50)
+    store = DocumentStore(tmp_path / "docs", "fake", embed=fake_embed)
+
+    result = await store.index_document("a.txt", paragraphs(6))
+    assert (result["chunks"], result["embedded"], result["reused"]) == (6, 6, 0)
+    await store.index_document("b.txt", "另一篇文档 " + "y" * 30)
+
+    result = await store.index_document("a.txt", paragraphs(6, changed=2))
+    assert (result["chunks"], result["embedded"], result["reused"]) == (6, 1, 5)
+    stats = store.get_stats()
+    # 旧文本块标记为墓碑，新文本块追加到文件末尾
+    assert (stats["chunks"], stats["tombstones"]) == (7, 1)
+
+    (query,) = await fake_embed([paragraphs(6, changed=2).split("\n\n")[2]])
+    hits = store.search(query, top_k=1)
+    assert hits[0]["document"] == "a.txt" and "已修改" in hits[0]["text"] and hits[0]["score"] == 1.0
+    # 墓碑不出现在检索结果中
+    original = paragraphs(6).split("\n\n")[2]
+    (query,) = await fake_embed([original])
+    assert original not in [hit["text"] for hit in store.search(query, top_k=10)]
+
+    assert await store.remove_document("a.txt")
+    assert not await store.remove_document("a.txt")
+    # 墓碑超过一半后压缩
+    stats = store.get_stats()
+    assert (stats["chunks"], stats["tombstones"], list(stats["documents"])) == (1, 0, ["b.txt"])
+    hits = await store.query("另一篇文档 " + "y" * 30, top_k=3)
+    assert [hit["document"] for hit in hits] == ["b.txt"]
+    assert hits[0]["text"].startswith("另一篇文档")
+
+    # 重新打开（新进程）读取同样的结果
+    reopened = DocumentStore(tmp_path / "docs", "fake", embed=fake_embed)
+    assert reopened.get_stats()["chunks"] == 1
+    assert len(list((tmp_path / "docs").glob("vectors-*.f32"))) == 1
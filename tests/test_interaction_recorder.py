@@ -0,0 +1,54 @@
+"""
+交互记录器测试
+"""
+import asyncio
+
+import app.utils.database as database
+from app.services.interaction_recorder import InteractionRecorder
+
+
+async def test_stop_waits_for_in_flight_flush(monkeypatch):
+    inserted = []
+    started = asyncio.Event()
+
+    async def slow_bulk_insert(model, rows, chunk_size):
+        started.set()
+        await asyncio.sleep(0.1)
+        inserted.extend(rows)
+
+    monkeypatch.setattr(database, "bulk_insert", slow_bulk_insert)
+    recorder = InteractionRecorder(batch_size=2, flush_interval=60.0)
+    await recorder.start()
+    for i in range(3):
+        recorder.record(request_id=str(i))
+
+    await started.wait()
+    await recorder.stop()
+
+    assert [row["request_id"] for row in inserted] == ["0", "1", "2"]
+    assert recorder.get_stats()["flushed"] == 3
+    assert recorder.get_stats()["failed"] == 0
+
+
+async def test_cancelled_flush_keeps_batch(monkeypatch):
+    async def hanging_bulk_insert(model, rows, chunk_size):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(database, "bulk_insert", hanging_bulk_insert)
+    recorder = InteractionRecorder(batch_size=10, flush_interval=60.0)
+    await recorder.start()
+    recorder.record(request_id="a")
+
+    flush = asyncio.ensure_future(recorder.flush())
+    await asyncio.sleep(0.01)
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+
+    assert recorder.get_stats()["buffered"] == 1
+
+    async def noop_bulk_insert(model, rows, chunk_size):
+        pass
+
+    monkeypatch.setattr(database, "bulk_insert", noop_bulk_insert)
+    await recorder.stop()
+    assert recorder.get_stats()["flushed"] == 1
@@ -0,0 +1,63 @@
+"""
+交互记录接口测试
+"""
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import interactions
+from app.core.config import settings
+from app.services.interaction_recorder import interaction_recorder
+
+TOKEN = "secret"
+
+
+def _client(monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", TOKEN)
+    app = FastAPI()
+    app.include_router(interactions.router)
+    return TestClient(app)
+
+
+def test_routes_require_admin(monkeypatch):
+    client = _client(monkeypatch)
+    assert client.get("/interactions/stats").status_code == 403
+    assert client.post("/interactions/export", json={"start": "2025-01-01", "end": "2025-01-02"}).status_code == 403
+    assert client.get("/interactions/stats", headers={"X-Admin-Token": TOKEN}).status_code == 200
+
+
+def test_export_normalises_bounds_to_naive_utc(monkeypatch):
+    calls = []
+
+    async def fake_export(start, end):
+        calls.append((start, end))
+        return {"path": "x", "count": 0}
+
+    monkeypatch.setattr(interaction_recorder, "export_jsonl", fake_export)
+    client = _client(monkeypatch)
+    response = client.post(
+        "/interactions/export",
+        json={"start": "2025-01-01T08:00:00+08:00", "end": "2025-01-02T00:00:00Z"},
+        headers={"X-Admin-Token": TOKEN}
+    )
+    assert response.status_code == 200
+    assert calls == [(datetime(2025, 1, 1), datetime(2025, 1, 2))]
+
+    response = client.post(
+        "/interactions/export",
+        json={"start": "2025-01-01T00:00:00", "end": "2025-01-02T00:00:00Z"},
+        headers={"X-Admin-Token": TOKEN}
+    )
+    assert response.status_code == 200
+    assert calls[-1] == (datetime(2025, 1, 1), datetime(2025, 1, 2))
+
+
+def test_export_rejects_unconvertible_bounds(monkeypatch):
+    client = _client(monkeypatch)
+    response = client.post(
+        "/interactions/export",
+        json={"start": "0001-01-01T00:00:00+08:00", "end": "2025-01-02T00:00:00Z"},
+        headers={"X-Admin-Token": TOKEN}
+    )
+    assert response.status_code == 422
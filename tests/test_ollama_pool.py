@@ -0,0 +1,53 @@
+"""
+Ollama节点池摘除策略测试
+"""
+import time
+
+from app.core.config import settings
+from app.services.ollama_pool import OllamaPool
+
+
+def _fail(pool, node, times=1):
+    for _ in range(times):
+        pool.report_failure(node, RuntimeError("连接失败"))
+
+
+def _expire(node):
+    node.ejected_until = time.monotonic() - 1
+
+
+def test_failures_while_ejected_do_not_extend():
+    pool = OllamaPool([("http://a", 1.0), ("http://b", 1.0)])
+    node = pool.nodes[0]
+    _fail(pool, node, settings.ollama_eject_failures + 20)
+    assert node.eject_seconds == settings.ollama_eject_seconds
+
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_eject_max_seconds", 100.0)
+    pool = OllamaPool([("http://a", 1.0), ("http://b", 1.0)])
+    node = pool.nodes[0]
+    _fail(pool, node, settings.ollama_eject_failures)
+    for _ in range(20):
+        _expire(node)
+        _fail(pool, node)
+    assert node.eject_seconds == 100.0
+    assert node.ejected_until - time.monotonic() <= 100.0
+
+
+def test_backoff_resets_after_probe_and_success():
+    pool = OllamaPool([("http://a", 1.0), ("http://b", 1.0)])
+    node = pool.nodes[0]
+    _fail(pool, node, settings.ollama_eject_failures)
+    _expire(node)
+    _fail(pool, node)
+    assert node.eject_seconds == settings.ollama_eject_seconds * 2
+
+    pool.report_probe_success("http://a")
+    assert node.eject_seconds == settings.ollama_eject_seconds
+
+    _expire(node)
+    _fail(pool, node)
+    pool.report_success(node)
+    assert node.eject_seconds == settings.ollama_eject_seconds
+    assert node.available
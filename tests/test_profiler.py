@@ -0,0 +1,58 @@
+"""
+采样分析器空闲栈过滤测试
+"""
+import queue
+import threading
+import time
+
+from app.utils.profiler import StackSampler
+
+
+class Store:
+    def get(self, stop: threading.Event):
+        # 同步阻塞调用，栈顶是业务代码中名为 get 的函数
+        while not stop.is_set():
+            time.sleep(0.01)
+
+
+def _sample(sampler: StackSampler) -> str:
+    result = []
+    thread = threading.Thread(target=lambda: result.append(sampler.sample_once(threading.get_ident())))
+    thread.start()
+    thread.join()
+    return sampler.collapsed()
+
+
+def test_filters_stdlib_wait_sites_but_not_same_named_functions():
+    stop = threading.Event()
+    idle_queue: queue.Queue = queue.Queue()
+    threads = [
+        threading.Thread(target=Store().get, args=(stop,), name="busy-store"),
+        threading.Thread(target=idle_queue.get, name="idle-worker"),
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    try:
+        stacks = _sample(StackSampler())
+    finally:
+        stop.set()
+        idle_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    assert "busy-store;" in stacks
+    assert "idle-worker;" not in stacks
+
+
+def test_event_loop_thread_is_never_filtered():
+    stop = threading.Event()
+    waiter = threading.Thread(target=stop.wait, name="loop")
+    waiter.start()
+    time.sleep(0.05)
+    try:
+        assert "loop;" not in _sample(StackSampler())
+        assert "loop;" in _sample(StackSampler(loop_ident=waiter.ident))
+    finally:
+        stop.set()
+        waiter.join()
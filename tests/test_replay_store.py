@@ -0,0 +1,47 @@
+"""
+录制文件测试
+"""
+import asyncio
+
+from app.services.replay_service import ReplayStore
+from app.utils.serialization import dumps
+
+
+async def test_append_and_get_off_loop(tmp_path):
+    path = str(tmp_path / "recordings.jsonl")
+    store = ReplayStore(path)
+    await asyncio.gather(*(store.append_async({"key": f"k{i}", "result": {"response": str(i)}}) for i in range(50)))
+
+    assert (await store.get_async("k7"))["result"]["response"] == "7"
+    assert await store.get_async("missing") is None
+    # 每条记录追加一行索引
+    assert (tmp_path / "recordings.jsonl.idx").read_bytes().count(b"\n") == 50
+    assert len(ReplayStore(path)) == 50
+
+
+def test_rebuilds_truncated_index(tmp_path):
+    path = tmp_path / "recordings.jsonl"
+    ReplayStore(str(path)).append({"key": "a", "result": {}})
+    with open(tmp_path / "recordings.jsonl.idx", "ab") as f:
+        f.write(b'["b", 1')
+
+    store = ReplayStore(str(path))
+    assert store.get("a") == {"key": "a", "result": {}}
+    store.append({"key": "b", "result": {}})
+    assert ReplayStore(str(path)).get("b") == {"key": "b", "result": {}}
+
+
+async def test_service_loads_store_on_first_use(tmp_path, monkeypatch):
+    from app.core.config import settings
+    from app.services import replay_service
+
+    path = str(tmp_path / "lazy.jsonl")
+    monkeypatch.setattr(settings, "replay_file", path)
+    service = replay_service.ReplayService()
+    # 构造时不读取录制文件
+    assert path not in replay_service._stores
+
+    await service._save("k", "hi", {}, {"response": "ok"}, [])
+    assert (await service._lookup("k"))["result"]["response"] == "ok"
+    assert path in replay_service._stores
+    replay_service._stores.pop(path)
@@ -0,0 +1,35 @@
+"""
+搜索引擎Agent配置测试
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import agents
+from app.agents.search_agent import SearchAgent
+from app.services.agent_registry import agent_registry
+
+
+def _create_search_agent(config):
+    app = FastAPI()
+    app.include_router(agents.router)
+    with TestClient(app) as client:
+        response = client.post("/agents/search", json={"name": "搜索助手", "agent_type": "search", "config": config})
+    assert response.status_code == 200
+    return agent_registry._entries[response.json()["agent_id"]].agent
+
+
+def test_create_route_extends_keywords():
+    agent = _create_search_agent({"ad_keywords": ["casino"], "intent_keywords": ["帮我查一下"]})
+
+    assert "casino" in agent.ad_matcher.keywords
+    assert "广告" in agent.ad_matcher.keywords
+    assert agent._is_advertisement("Online casino", "")
+    assert agent._extract_search_query("帮我查一下 天气") == "天气"
+
+
+def test_keywords_survive_spill():
+    agent = _create_search_agent({"ad_keywords": ["casino"], "intent_keywords": ["帮我查一下"]})
+
+    restored = SearchAgent.from_state(agent.dump_state())
+    assert "casino" in restored.ad_matcher.keywords
+    assert "帮我查一下" in restored.intent_matcher.keywords
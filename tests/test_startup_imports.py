@@ -0,0 +1,14 @@
+"""
+冷启动导入测试：可选的重量级依赖不应在导入应用时加载
+"""
+import sys
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_import_main_skips_heavy_modules():
+    code = "import sys, main; print(','.join(m for m in ('numpy', 'lxml', 'openai') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""